@@ -1,10 +1,17 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import Depends, FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import dataclasses
+import hashlib
+import json
 import os
 import shutil
+import subprocess
 import uuid
 import sys
+import threading
+import time
 import traceback
 
 os.environ["CUDA_VISIBLE_DEVICES"] = ""
@@ -12,14 +19,41 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_bg_remover"))
 sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_noise_reduction"))
 sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_text_apply"))
 sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_bg_removal_icon"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_inference"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_cache"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_jobs"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_media"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_pipeline"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_metrics"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "sniply_models"))
 
-from sniply_bg_remover.bg_removal import run_bg_removal_pipeline
+# Processors that pull in numpy, Pillow, rembg or onnxruntime are imported on
+# first use (or by the warm-up thread), so the app itself starts fast.
 from sniply_text_apply.apply_text import (
+    SUBTITLE_EXTENSIONS,
     apply_text_to_video_ffmpeg as apply_text_to_video,
+    normalize_captions,
+    normalize_text_params,
 )
-from sniply_bg_removal_icon.remove_icon_bg import remove_background_from_media
-
-from sniply_noise_reduction.denoise_video import fast_denoise
+from sniply_bg_remover.mask_output import (
+    BACKGROUND_IMAGE_EXTENSIONS,
+    DEFAULT_BACKGROUND,
+    MASK_OUTPUTS,
+    OUTPUT_MODES,
+    validate_background,
+)
+from sniply_noise_reduction.denoise_video import fast_denoise, get_ffmpeg_path
+from sniply_inference.session_pool import get_pool, shutdown_pool, start_pool
+from sniply_cache.result_cache import ResultCache, make_cache_key
+from sniply_media.capabilities import get_capabilities
+from sniply_media.probe import probe_media
+from sniply_pipeline.pipeline import PipelineError, normalize_steps, run_pipeline
+from sniply_jobs.admission import AdmissionController, QueueFullError
+from sniply_jobs.jobs import JOB_TTL_SECONDS, Job, JobManager
+from sniply_jobs.thread_budget import get_budget
+from sniply_jobs.warmup import Readiness
+from sniply_metrics import metrics
+from sniply_models.model_store import get_store
 
 app = FastAPI()
 
@@ -33,17 +67,103 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "Server-Timing", "X-Inference-Stats"],
 )
 
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
+# Results live as long as their jobs and share one budget with the cache.
+result_cache = ResultCache(CACHE_DIR, results_root=RESULTS_DIR, result_ttl=JOB_TTL_SECONDS)
+admission = AdmissionController()
+job_manager = JobManager(admission)
+readiness = Readiness()
+
+
+def save_upload(file: UploadFile, path: str, processor: str | None = None) -> str:
+    """Writes an upload to disk and returns the SHA-256 of its contents."""
+    digest = hashlib.sha256()
+    start = time.perf_counter()
+    size = 0
+    with open(path, "wb") as buffer:
+        for chunk in iter(lambda: file.file.read(1024 * 1024), b""):
+            digest.update(chunk)
+            buffer.write(chunk)
+            size += len(chunk)
+    if processor:
+        metrics.record_stage("upload", time.perf_counter() - start, nbytes=size, processor=processor)
+    return digest.hexdigest()
+
+
+def send_file(path, media_type, filename, processor, headers=None) -> FileResponse:
+    # Only the size is known here; the transfer itself happens after we return.
+    metrics.record_stage("download", None, nbytes=os.path.getsize(path), processor=processor)
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+
+
+@app.on_event("startup")
+def start_inference_pool():
+    start_pool()
+
+
+def warm_text_apply():
+    import ffmpeg  # noqa: F401
+
+    get_capabilities()
+
+
+def warm_noise_reduction():
+    get_ffmpeg_path()
+    # Without the RNNoise model, denoising falls back to afftdn; still warm.
+    get_capabilities().model("rnnoise")
+
+
+def warm_bg_remover():
+    from sniply_bg_remover.bg_removal import DEFAULT_MODEL
+
+    get_pool().warm(DEFAULT_MODEL)
+
+
+def warm_bg_remover_icon():
+    from sniply_bg_removal_icon import batch  # noqa: F401
+    from sniply_bg_removal_icon.remove_icon_bg import MODEL_NAME
+
+    get_pool().warm(MODEL_NAME)
+
+
+@app.on_event("startup")
+def start_warmup():
+    # Encoders, hwaccels, filters and models are probed once, not per request,
+    # and in the background: /ready reports when each processor can serve.
+    readiness.start(
+        [
+            ("text_apply", [warm_text_apply]),
+            ("noise_reduction", [warm_noise_reduction]),
+            ("bg_remover", [warm_bg_remover]),
+            ("bg_remover_icon", [warm_bg_remover_icon]),
+            (PIPELINE, [readiness.require("text_apply", "noise_reduction", "bg_remover")]),
+        ]
+    )
+
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    job_manager.shutdown()
+    shutdown_pool()
+
+
 # Processor registry
 PROCESSORS = {}
 
 
+# Admission gates for /pipeline and icon batch requests; not processors of their own.
+PIPELINE = "pipeline"
+ICON_BATCH = "bg_remover_icon_batch"
+
+
 def register_processor(name):
     def decorator(func):
         PROCESSORS[name] = func
@@ -53,19 +173,34 @@ def register_processor(name):
 
 
 @register_processor("bg_remover")
-def process_bg_remover(input_path, output_path):
-    run_bg_removal_pipeline(input_video=input_path, output_video=output_path)
-    return output_path
+def process_bg_remover(
+    input_path,
+    output_path,
+    output_mode="rgba",
+    background=DEFAULT_BACKGROUND,
+    background_image=None,
+    temporal=None,
+    refine="bilinear",
+):
+    """Returns the run's frame and inference counts."""
+    from sniply_bg_remover.bg_removal import run_bg_removal_pipeline
+    from sniply_bg_remover.temporal import TemporalConfig
+
+    return run_bg_removal_pipeline(
+        input_video=input_path,
+        output_video=output_path,
+        output_mode=output_mode,
+        background=background,
+        background_image=background_image,
+        temporal=TemporalConfig(**temporal) if temporal else None,
+        refine=refine,
+    )
 
 
 @register_processor("noise_reduction")
 def process_noise_reduction(input_path, output_path):
     try:
-        fast_denoise(input_path)
-        denoised_file_path = os.path.join(
-            os.path.dirname(input_path), "output_final.mp4"
-        )
-        shutil.move(denoised_file_path, output_path)
+        fast_denoise(input_path, output_path)
 
     except Exception as e:
         traceback.print_exc()
@@ -84,6 +219,10 @@ def process_text_apply(
     box_color,
     box_border,
     position,
+    start=None,
+    end=None,
+    captions=None,
+    subtitle_path=None,
 ):
     apply_text_to_video(
         input_path=input_path,
@@ -94,77 +233,532 @@ def process_text_apply(
         box_color=box_color,
         box_border=box_border,
         position=position,
+        start=start,
+        end=end,
+        captions=captions,
+        subtitle_path=subtitle_path,
     )
     return output_path
 
 
 @register_processor("bg_remover_icon")
 def process_bg_remover_icon(input_path, output_path):
+    from sniply_bg_removal_icon.remove_icon_bg import remove_background_from_media
+
     remove_background_from_media(input_path, output_path)
     return output_path
 
 
-@app.post("/process/{processor_name}")
-async def process_video(
-    processor_name: str,
-    file: UploadFile = File(...),
+class StagedRequest:
+    """An uploaded input together with where and how its result is produced."""
+
+    def __init__(
+        self, processor_name, input_dir, input_path, output_path, media_type, params, func=None
+    ):
+        self.processor_name = processor_name
+        self.func = func or PROCESSORS[processor_name]
+        self.input_dir = input_dir
+        self.input_path = input_path
+        self.output_path = output_path
+        self.output_filename = os.path.basename(output_path)
+        self.media_type = media_type
+        self.params = params
+        self.cache_key = None
+        self.cached_path = None  # output_path, when linked from the cache
+        self.result = None
+        self.info = None  # probed MediaInfo of the upload
+
+
+def caption_form(
     text: str = Form(None),
     font_size: int = Form(64),
     font_color: str = Form("white"),
     box_color: str = Form("black@0.5"),
     box_border: int = Form(20),
     position: str = Form("bottom"),
-):
+    start: float = Form(None),
+    end: float = Form(None),
+    captions: str = Form(None),
+    subtitles: UploadFile = File(None),
+) -> dict:
+    return {
+        "text": text,
+        "font_size": font_size,
+        "font_color": font_color,
+        "box_color": box_color,
+        "box_border": box_border,
+        "position": position,
+        "start": start,
+        "end": end,
+        "captions": captions,
+        "subtitles": subtitles,
+    }
+
+
+def bg_form(
+    output_mode: str = Form("rgba"),
+    background: str = Form(DEFAULT_BACKGROUND),
+    background_image: UploadFile = File(None),
+    temporal: bool = Form(False),
+    max_interval: int = Form(None),
+    diff_threshold: float = Form(None),
+    hist_threshold: float = Form(None),
+    refine: str = Form("bilinear"),
+) -> dict:
+    """Output options of bg_remover: "rgba" (the default H.264 cut-out), "webm" or
+    "prores" with alpha, "composite" over a colour or image, or "mask".
+
+    With ``temporal``, only keyframes are segmented; the thresholds override
+    ``TemporalConfig``'s defaults. ``refine="edge"`` refines only a band
+    around each mask's edge (rgba output only).
+    """
+    thresholds = {
+        "max_interval": max_interval,
+        "diff_threshold": diff_threshold,
+        "hist_threshold": hist_threshold,
+    }
+    return {
+        "output_mode": output_mode,
+        "background": background,
+        "background_image": background_image,
+        "temporal": {k: v for k, v in thresholds.items() if v is not None} if temporal else None,
+        "refine": refine,
+    }
+
+
+def inference_stats(result) -> dict:
+    """The ``X-Inference-Stats`` header for a bg_remover run, e.g.
+    ``frames=300, inferences=40, skipped_inferences=260``."""
+    if not isinstance(result, dict):
+        return {}
+    return {"X-Inference-Stats": ", ".join(f"{k}={v}" for k, v in result.items())}
+
+
+def admit(processor_name: str):
+    """Reserves a queue slot for the processor or fails fast with 429."""
     if processor_name not in PROCESSORS:
         raise HTTPException(status_code=404, detail="Processor not found.")
-    process_id = str(uuid.uuid4())
-    input_dir = os.path.join(UPLOAD_DIR, process_id)
-    output_dir = os.path.join(RESULTS_DIR, process_id)
-    os.makedirs(input_dir, exist_ok=True)
-    os.makedirs(output_dir, exist_ok=True)
-    input_path = os.path.join(input_dir, file.filename)
+    return reserve(processor_name)
+
 
+def reserve(processor_name: str):
+    try:
+        return admission.admit(processor_name)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def stage_request(
+    processor_name: str, file: UploadFile, caption: dict, bg_options: dict | None = None
+) -> StagedRequest:
+    """Validates a request, saves its upload and looks the result up in the cache."""
+    caption = dict(caption)
+    bg_options = bg_options or {
+        "output_mode": "rgba",
+        "background_image": None,
+        "temporal": None,
+        "refine": "bilinear",
+    }
+    captions = caption.pop("captions")
+    subtitles = caption.pop("subtitles")
+    if processor_name == "text_apply" and not (caption["text"] or captions or subtitles):
+        raise HTTPException(
+            status_code=400,
+            detail="Text, captions or a subtitle file is required for text_apply processor.",
+        )
+    if processor_name == "text_apply" and captions:
+        try:
+            captions = json.loads(captions)
+            if not isinstance(captions, list):
+                raise ValueError
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Captions must be a JSON list.")
+    if processor_name == "text_apply" and subtitles:
+        subtitle_ext = os.path.splitext(subtitles.filename or "")[1].lower()
+        if subtitle_ext not in SUBTITLE_EXTENSIONS:
+            raise HTTPException(status_code=400, detail="Subtitles must be an SRT or ASS file.")
+        if not get_capabilities().has_filter("subtitles"):
+            raise HTTPException(
+                status_code=400, detail="Subtitle files aren't supported by this server's FFmpeg."
+            )
+    output_mode = bg_options["output_mode"] if processor_name == "bg_remover" else "rgba"
+    background_image = bg_options["background_image"] if output_mode == "composite" else None
+    if output_mode not in OUTPUT_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"Output mode must be one of {', '.join(OUTPUT_MODES)}."
+        )
+    if output_mode == "composite":
+        try:
+            validate_background(bg_options["background"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if background_image:
+        background_ext = os.path.splitext(background_image.filename or "")[1].lower()
+        if background_ext not in BACKGROUND_IMAGE_EXTENSIONS:
+            raise HTTPException(
+                status_code=400, detail="The background must be a PNG, JPEG, WebP or BMP image."
+            )
+    refine = bg_options["refine"] if processor_name == "bg_remover" else "bilinear"
+    if refine != "bilinear":
+        # Loaded only when needed: it pulls in numpy.
+        from sniply_inference.batched import REFINE_MODES
+
+        if refine not in REFINE_MODES:
+            raise HTTPException(
+                status_code=400, detail=f"Refine mode must be one of {', '.join(REFINE_MODES)}."
+            )
+        if output_mode != "rgba":
+            raise HTTPException(
+                status_code=400, detail="Edge refinement needs the rgba output mode."
+            )
+    temporal = bg_options["temporal"] if processor_name == "bg_remover" else None
+    if temporal is not None:
+        # Loaded only when needed: it pulls in numpy.
+        from sniply_bg_remover.temporal import TemporalConfig
+
+        try:
+            # Every field, so that the cache key covers the defaults too.
+            temporal = dataclasses.asdict(TemporalConfig(**temporal))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     if processor_name == "bg_remover_icon":
         file_ext = os.path.splitext(file.filename)[1]
         output_filename = f"output{file_ext}"
         media_type = f"image/{file_ext.lstrip('.')}"
         if file_ext == ".gif":
             media_type = "image/gif"
+    elif output_mode in MASK_OUTPUTS:
+        output_filename = f"output{MASK_OUTPUTS[output_mode].extension}"
+        media_type = MASK_OUTPUTS[output_mode].media_type
     else:
         output_filename = "output.mp4"
         media_type = "video/mp4"
 
-    output_path = os.path.join(output_dir, output_filename)
+    params = {}
+    key_params = {}
+    staged = new_staged(processor_name, file, output_filename, media_type, params)
+    if processor_name == "text_apply":
+        params.update(normalize_text_params(**caption))
+        if captions:
+            params["captions"] = normalize_captions(captions, params)
+        if subtitles:
+            params["subtitle_path"] = os.path.join(staged.input_dir, f"subtitles{subtitle_ext}")
+            # The upload's path is unique per request; its contents identify it.
+            key_params["subtitle_path"] = save_upload(subtitles, params["subtitle_path"])
+    if output_mode != "rgba":
+        params["output_mode"] = output_mode
+    if output_mode == "composite":
+        params["background"] = bg_options["background"]
+    if temporal is not None:
+        params["temporal"] = temporal
+    if refine != "bilinear":
+        params["refine"] = refine
+    if background_image:
+        params["background_image"] = os.path.join(staged.input_dir, f"background{background_ext}")
+        key_params["background_image"] = save_upload(background_image, params["background_image"])
+    return finish_staging(staged, file, key_params)
+
+
+def new_staged(processor_name, file, output_filename, media_type, params, func=None):
+    process_id = str(uuid.uuid4())
+    input_dir = os.path.join(UPLOAD_DIR, process_id)
+    os.makedirs(input_dir, exist_ok=True)
+    return StagedRequest(
+        processor_name,
+        input_dir,
+        os.path.join(input_dir, file.filename),
+        os.path.join(RESULTS_DIR, process_id, output_filename),
+        media_type,
+        params,
+        func,
+    )
+
 
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+def finish_staging(staged: StagedRequest, file: UploadFile, key_params=None) -> StagedRequest:
+    """Saves the upload, looks its result up in the cache and probes it on a miss."""
+    content_hash = save_upload(file, staged.input_path, staged.processor_name)
+    staged.cache_key = make_cache_key(
+        content_hash,
+        staged.processor_name,
+        {**staged.params, **(key_params or {}), "output": staged.output_filename},
+    )
+    staged.cached_path = result_cache.checkout(staged.cache_key, staged.output_path)
+    if staged.cached_path:
+        shutil.rmtree(staged.input_dir, ignore_errors=True)
+        return staged
+    # Probe once per upload; processors read the cached metadata.
     try:
-        if processor_name == "text_apply":
-            if not text:
-                raise HTTPException(
-                    status_code=400, detail="Text is required for text_apply processor."
-                )
-            PROCESSORS[processor_name](
-                input_path,
-                output_path,
-                text=text,
-                font_size=font_size,
-                font_color=font_color,
-                box_color=box_color,
-                box_border=box_border,
-                position=position,
-            )
-        else:
-            PROCESSORS[processor_name](input_path, output_path)
+        staged.info = probe_media(staged.input_path, content_hash)
+    except (subprocess.CalledProcessError, ValueError):
+        if staged.processor_name != "bg_remover_icon":
+            shutil.rmtree(staged.input_dir, ignore_errors=True)
+            raise HTTPException(status_code=400, detail="Unsupported or corrupt media file.")
+    return staged
+
+
+def run_staged(staged: StagedRequest) -> str:
+    """Runs the processor for a staged request (blocking) and caches its output."""
+    os.makedirs(os.path.dirname(staged.output_path), exist_ok=True)
+    staged.result = staged.func(staged.input_path, staged.output_path, **staged.params)
+    result_cache.add_result(staged.output_path)
+    result_cache.put(staged.cache_key, staged.output_path)
+    return staged.output_path
+
+
+@app.post("/process/{processor_name}")
+async def process_video(
+    processor_name: str,
+    file: UploadFile = File(...),
+    caption: dict = Depends(caption_form),
+    bg_options: dict = Depends(bg_form),
+):
+    ticket = admit(processor_name)
+    try:
+        staged = await run_in_threadpool(stage_request, processor_name, file, caption, bg_options)
+    except Exception:
+        ticket.cancel()
+        raise
+    if staged.cached_path:
+        ticket.cancel()
+        return send_file(
+            staged.cached_path, staged.media_type, staged.output_filename, processor_name
+        )
+
+    admission.estimate(ticket, staged.info)
+    try:
+        await admission.run_async(ticket, run_staged, staged)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
-    return FileResponse(output_path, media_type=media_type, filename=output_filename)
+    return send_file(
+        staged.output_path,
+        staged.media_type,
+        staged.output_filename,
+        processor_name,
+        headers=inference_stats(staged.result),
+    )
+
+
+def server_timing(timings) -> str:
+    return ", ".join(
+        f'{name};desc="{desc}";dur={seconds * 1000:.1f}' for name, desc, seconds in timings
+    )
+
+
+@app.post("/pipeline")
+async def process_pipeline(file: UploadFile = File(...), steps: str = Form(...)):
+    """Runs several processors over one upload, fused into a single encode.
+
+    ``steps`` is a JSON list of ``{"processor": name, "params": {...}}``.
+    Measured stage timings (decode, filter, encode, ...) come back in the
+    ``Server-Timing`` header.
+    """
+    try:
+        steps = normalize_steps(json.loads(steps))
+    except ValueError as e:
+        detail = str(e) if isinstance(e, PipelineError) else "Steps must be valid JSON."
+        raise HTTPException(status_code=400, detail=detail)
+    ticket = reserve(PIPELINE)
+    try:
+        staged = await run_in_threadpool(
+            finish_staging,
+            new_staged(PIPELINE, file, "output.mp4", "video/mp4", {"steps": steps}, run_pipeline),
+            file,
+        )
+    except Exception:
+        ticket.cancel()
+        raise
+    if staged.cached_path:
+        ticket.cancel()
+        return send_file(
+            staged.cached_path,
+            staged.media_type,
+            staged.output_filename,
+            PIPELINE,
+            headers={"Server-Timing": 'cache;desc="hit";dur=0'},
+        )
+
+    admission.estimate(ticket, staged.info)
+    try:
+        await admission.run_async(ticket, run_staged, staged)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+    return send_file(
+        staged.output_path,
+        staged.media_type,
+        staged.output_filename,
+        PIPELINE,
+        headers={"Server-Timing": server_timing(staged.result)},
+    )
+
+
+@app.post("/batch/bg_remover_icon")
+def process_icon_batch(files: list[UploadFile] = File(...)):
+    """Removes the background of many icons, uploaded as images and/or ZIP archives.
+
+    The response is a ZIP streamed as each icon finishes; ``manifest.json``
+    at its end lists every item and the error of any that failed.
+    """
+    from sniply_bg_removal_icon.batch import (
+        BatchCancelled,
+        BatchError,
+        BatchInputs,
+        ZipStream,
+        remove_icon_batch,
+    )
+
+    ticket = reserve(ICON_BATCH)
+    batch_dir = os.path.join(UPLOAD_DIR, str(uuid.uuid4()))
+    try:
+        os.makedirs(batch_dir)
+        uploads = []
+        for i, file in enumerate(files):
+            path = os.path.join(batch_dir, f"{i}{os.path.splitext(file.filename or '')[1]}")
+            save_upload(file, path, ICON_BATCH)
+            uploads.append((file.filename or f"image-{i}", path))
+        inputs = BatchInputs(uploads)
+    except Exception as e:
+        ticket.cancel()
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        if isinstance(e, BatchError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+
+    stream = ZipStream()
+
+    def produce():
+        try:
+            with inputs:
+                admission.run(ticket, remove_icon_batch, inputs, stream, batch_dir)
+            stream.finish()
+        except BatchCancelled:
+            print("Icon batch cancelled: client disconnected")
+        except Exception as e:
+            traceback.print_exc()
+            stream.finish(e)
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+    threading.Thread(target=produce, daemon=True).start()
+    return StreamingResponse(
+        stream,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="icons.zip"'},
+    )
+
+
+@app.post("/jobs/{processor_name}", status_code=202)
+def submit_job(
+    processor_name: str,
+    file: UploadFile = File(...),
+    caption: dict = Depends(caption_form),
+    bg_options: dict = Depends(bg_form),
+):
+    ticket = admit(processor_name)
+    try:
+        staged = stage_request(processor_name, file, caption, bg_options)
+    except Exception:
+        ticket.cancel()
+        raise
+    job = Job(
+        processor=processor_name,
+        output_path=staged.cached_path or staged.output_path,
+        output_filename=staged.output_filename,
+        media_type=staged.media_type,
+    )
+    if staged.cached_path:
+        ticket.cancel()
+        job_manager.add_finished(job)
+    else:
+        admission.estimate(ticket, staged.info)
+        job_manager.submit(job, ticket, run_staged, staged)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Processing failed: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}.")
+    return send_file(job.output_path, job.media_type, job.output_filename, job.processor)
 
 
 @app.get("/processors")
 def list_processors():
-    return {"processors": list(PROCESSORS.keys())}
+    return {
+        "processors": list(PROCESSORS.keys()),
+        "capabilities": get_capabilities().to_dict(),
+    }
+
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until every processor is warm, with per-processor states."""
+    report = readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@app.get("/processors/stats")
+def processor_stats():
+    return admission.stats()
+
+
+@app.get("/threads/stats")
+def thread_stats():
+    return get_budget().stats()
+
+
+@metrics.REGISTRY.on_collect
+def collect_gauges():
+    for name, gate in admission.stats().items():
+        metrics.QUEUE_DEPTH.set(gate["waiting"], processor=name)
+        metrics.ACTIVE_JOBS.set(gate["running"], processor=name)
+    metrics.WORKER_UTILIZATION.clear()
+    for worker in get_pool().stats()["workers"]:
+        metrics.WORKER_UTILIZATION.set(worker["utilization"], worker=worker["pid"])
+    leased = {}
+    for job in get_budget().stats()["jobs"]:
+        leased[job["name"]] = leased.get(job["name"], 0) + job["threads"]
+    metrics.THREADS_LEASED.clear()
+    for name, threads in leased.items():
+        metrics.THREADS_LEASED.set(threads, processor=name)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(
+        metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return result_cache.stats()
+
+
+@app.get("/models")
+def model_store_stats():
+    return get_store().stats()
+
+
+@app.get("/inference/pool")
+def inference_pool_stats():
+    return get_pool().stats()
 
 
 @app.get("/")
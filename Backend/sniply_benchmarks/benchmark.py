@@ -0,0 +1,382 @@
+"""Offline benchmarks for every registered processor.
+
+Inputs are generated deterministically (ffmpeg ``lavfi`` for videos, Pillow
+for icons) and each case runs in a fresh child process so peak RSS covers
+the processor, its ffmpeg children and the inference pool. Run from
+``Backend/``::
+
+    python -m sniply_benchmarks.benchmark --output results.json
+    python -m sniply_benchmarks.benchmark --baseline baseline.json --threshold 0.1
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import resource
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "sniply_bench")
+
+VIDEO_SIZES = {"360p": (640, 360), "720p": (1280, 720), "1080p": (1920, 1080)}
+VIDEO_DURATIONS = (2, 10)
+VIDEO_FPS = 30
+ICON_SIZE = 512
+# A stuck case (e.g. a model that can't be fetched offline) fails instead of hanging.
+CASE_TIMEOUT_SECONDS = 1800
+GIF_FRAMES = 12
+
+VIDEO_PROCESSORS = ("bg_remover", "noise_reduction", "text_apply")
+ICON_PROCESSORS = ("bg_remover_icon",)
+PROCESSOR_PARAMS = {
+    "text_apply": {
+        "text": "Benchmark",
+        "font_size": 48,
+        "font_color": "white",
+        "box_color": "black@0.5",
+        "box_border": 10,
+        "position": "bottom",
+    },
+}
+# Models each processor's pool workers load; warmed up outside the timed run.
+WARM_MODELS = {"bg_remover": ("u2netp",), "bg_remover_icon": ("u2net",)}
+
+
+@dataclass
+class Case:
+    name: str
+    processor: str
+    input_name: str
+    output_ext: str = ".mp4"
+
+
+@dataclass
+class Result:
+    case: str
+    processor: str
+    status: str = "ok"
+    error: str | None = None
+    frames: int | None = None
+    wall_seconds: float | None = None
+    runs: list[float] = field(default_factory=list)
+    fps: float | None = None
+    peak_rss_mb: float | None = None
+    warmup_seconds: float | None = None
+
+
+def video_inputs() -> dict[str, dict]:
+    return {
+        f"{size}_{duration}s_{'audio' if audio else 'silent'}": {
+            "kind": "video",
+            "size": VIDEO_SIZES[size],
+            "duration": duration,
+            "audio": audio,
+        }
+        for size in VIDEO_SIZES
+        for duration in VIDEO_DURATIONS
+        for audio in (True, False)
+    }
+
+
+def icon_inputs() -> dict[str, dict]:
+    return {
+        "icon_png": {"kind": "png"},
+        "icon_gif_still": {"kind": "gif", "frames": 1},
+        "icon_gif_animated": {"kind": "gif", "frames": GIF_FRAMES},
+    }
+
+
+def all_cases() -> list[Case]:
+    cases = [
+        Case(f"{processor}/{name}", processor, name)
+        for name in video_inputs()
+        for processor in VIDEO_PROCESSORS
+    ]
+    for name, spec in icon_inputs().items():
+        ext = ".png" if spec["kind"] == "png" else ".gif"
+        cases += [Case(f"{p}/{name}", p, name, ext) for p in ICON_PROCESSORS]
+    return cases
+
+
+def input_path(work_dir: str, name: str) -> str:
+    spec = {**video_inputs(), **icon_inputs()}[name]
+    ext = ".mp4" if spec["kind"] == "video" else f".{spec['kind']}"
+    return os.path.join(work_dir, "inputs", name + ext)
+
+
+def generate_video(path: str, size: tuple[int, int], duration: int, audio: bool):
+    """A noisy test pattern (plus a tone) so every processor has real work to do."""
+    width, height = size
+    cmd = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={width}x{height}:rate={VIDEO_FPS}:duration={duration}",
+    ]
+    if audio:
+        cmd += ["-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}"]
+    cmd += ["-vf", "noise=alls=12:allf=t", "-c:v", "libx264", "-preset", "veryfast"]
+    cmd += ["-g", str(VIDEO_FPS * 2), "-pix_fmt", "yuv420p", "-threads", "1"]
+    if audio:
+        cmd += ["-c:a", "aac", "-b:a", "128k"]
+    cmd += ["-fflags", "+bitexact", "-map_metadata", "-1", "-y", path]
+    subprocess.run(cmd, check=True)
+
+
+def icon_frame(index: int, frames: int):
+    from PIL import Image, ImageDraw
+
+    # A gradient backdrop with a solid subject moving across it.
+    img = Image.linear_gradient("L").resize((ICON_SIZE, ICON_SIZE)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    offset = int(ICON_SIZE * 0.3 * index / max(frames - 1, 1))
+    box = (96 + offset, 128, 320 + offset, 384)
+    draw.ellipse(box, fill=(220, 40, 40), outline=(20, 20, 20), width=6)
+    draw.rectangle((box[0] + 60, 200, box[0] + 160, 300), fill=(250, 220, 60))
+    return img
+
+
+def generate_icon(path: str, kind: str, frames: int = 1):
+    from PIL import Image
+
+    images = [icon_frame(i, frames) for i in range(frames)]
+    if kind == "png":
+        images[0].save(path)
+    else:
+        images = [img.convert("P", palette=Image.Palette.ADAPTIVE, colors=128) for img in images]
+        images[0].save(path, save_all=frames > 1, append_images=images[1:], duration=80, loop=0)
+
+
+def ensure_input(work_dir: str, name: str) -> str:
+    """Generates the named input once; later runs reuse the file."""
+    path = input_path(work_dir, name)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    spec = {**video_inputs(), **icon_inputs()}[name]
+    print(f"Generating {name}...")
+    if spec["kind"] == "video":
+        generate_video(path, spec["size"], spec["duration"], spec["audio"])
+    else:
+        generate_icon(path, spec["kind"], spec.get("frames", 1))
+    return path
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process or any child it waited for (ffmpeg, pool workers)."""
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_one(processor: str, input_file: str, output_file: str) -> dict:
+    """Runs a single case in this process; called in a child by ``run_case``."""
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+    from sniply_inference.session_pool import shutdown_pool, start_pool
+    from sniply_media.capabilities import get_capabilities
+    from sniply_media.probe import probe_media
+
+    # Startup work the server does once is kept out of the timed run.
+    start = time.perf_counter()
+    get_capabilities()
+    if processor in WARM_MODELS:
+        start_pool(preload_models=WARM_MODELS[processor])
+    warmup = time.perf_counter() - start
+
+    try:
+        frames = probe_media(input_file).frame_count or None
+    except (subprocess.CalledProcessError, ValueError):
+        frames = None
+    start = time.perf_counter()
+    main.PROCESSORS[processor](input_file, output_file, **PROCESSOR_PARAMS.get(processor, {}))
+    wall = time.perf_counter() - start
+    # Joining the pool folds its workers' peak RSS into RUSAGE_CHILDREN.
+    shutdown_pool()
+    return {
+        "wall_seconds": wall,
+        "frames": frames,
+        "warmup_seconds": warmup,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_case(
+    case: Case, work_dir: str, repeat: int, timeout: float = CASE_TIMEOUT_SECONDS
+) -> Result:
+    result = Result(case.name, case.processor)
+    source = ensure_input(work_dir, case.input_name)
+    output_dir = tempfile.mkdtemp(prefix="out_", dir=work_dir)
+    try:
+        return _run_repeats(case, result, source, output_dir, repeat, timeout)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def _run_repeats(case, result, source, output_dir, repeat, timeout) -> Result:
+    peaks, warmups = [], []
+    for _ in range(repeat):
+        output = os.path.join(output_dir, "output" + case.output_ext)
+        # Own session, so a timed-out case takes its ffmpeg and pool children with it.
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "sniply_benchmarks.benchmark", "--run-one"]
+            + [case.processor, source, output],
+            cwd=BACKEND_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env={**os.environ, "PYTHONHASHSEED": "0"},
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.communicate()
+            result.status = "error"
+            result.error = f"timed out after {timeout:.0f}s"
+            return result
+        lines = stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            result.status = "error"
+            result.error = (stderr.strip().splitlines() or ["unknown error"])[-1]
+            return result
+        run = json.loads(lines[-1])
+        result.runs.append(round(run["wall_seconds"], 4))
+        result.frames = run["frames"]
+        peaks.append(run["peak_rss_mb"])
+        warmups.append(run["warmup_seconds"])
+    result.wall_seconds = round(statistics.median(result.runs), 4)
+    result.peak_rss_mb = round(max(peaks), 1)
+    result.warmup_seconds = round(statistics.median(warmups), 4)
+    if result.frames:
+        result.fps = round(result.frames / result.wall_seconds, 2)
+    return result
+
+
+def environment() -> dict:
+    version = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": version.split("\n", 1)[0] or None,
+    }
+
+
+def compare(results: list[dict], baseline: dict, threshold: float) -> list[dict]:
+    """Cases whose wall time or peak RSS grew by more than ``threshold`` (a fraction)."""
+    previous = {r["case"]: r for r in baseline.get("results", []) if r["status"] == "ok"}
+    regressions = []
+    for current in results:
+        before = previous.get(current["case"])
+        if current["status"] != "ok" or before is None:
+            continue
+        for metric in ("wall_seconds", "peak_rss_mb"):
+            if before[metric] and current[metric] > before[metric] * (1 + threshold):
+                regressions.append(
+                    {
+                        "case": current["case"],
+                        "metric": metric,
+                        "baseline": before[metric],
+                        "current": current[metric],
+                        "change": round(current[metric] / before[metric] - 1, 4),
+                    }
+                )
+    return regressions
+
+
+def select_cases(patterns: list[str] | None, processors: list[str] | None, quick: bool):
+    cases = all_cases()
+    if quick:
+        cases = [c for c in cases if "1080p" not in c.name and "720p" not in c.name]
+        cases = [c for c in cases if f"_{max(VIDEO_DURATIONS)}s_" not in c.name]
+    if processors:
+        cases = [c for c in cases if c.processor in processors]
+    if patterns:
+        cases = [c for c in cases if any(fnmatch.fnmatch(c.name, p) for p in patterns)]
+    return cases
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Sniply processors.")
+    parser.add_argument("--run-one", nargs=3, metavar=("PROCESSOR", "INPUT", "OUTPUT"))
+    parser.add_argument("--cases", nargs="*", help="glob patterns, e.g. 'text_apply/*'")
+    parser.add_argument("--processors", nargs="*")
+    parser.add_argument("--quick", action="store_true", help="smallest inputs only")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--timeout", type=float, default=CASE_TIMEOUT_SECONDS)
+    parser.add_argument("--list", action="store_true", help="list cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        # Processor logs go to stderr so the last stdout line is the JSON result.
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        outcome = run_one(*args.run_one)
+        print(json.dumps(outcome), file=stdout)
+        return 0
+
+    cases = select_cases(args.cases, args.processors, args.quick)
+    if args.list:
+        print("\n".join(case.name for case in cases))
+        return 0
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = []
+    for case in cases:
+        result = run_case(case, args.work_dir, max(1, args.repeat), args.timeout)
+        results.append(asdict(result))
+        detail = (
+            f"{result.wall_seconds:.3f}s, {result.fps or '-'} fps, {result.peak_rss_mb} MB peak"
+            if result.status == "ok"
+            else f"ERROR: {result.error}"
+        )
+        print(f"{case.name}: {detail}")
+
+    report = {"environment": environment(), "threshold": args.threshold, "results": results}
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f), args.threshold)
+        for reg in report["regressions"]:
+            print(
+                f"REGRESSION {reg['case']} {reg['metric']}: "
+                f"{reg['baseline']} -> {reg['current']} ({reg['change']:+.1%})"
+            )
+        exit_code = 1 if report["regressions"] else 0
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
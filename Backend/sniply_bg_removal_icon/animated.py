@@ -0,0 +1,204 @@
+import hashlib
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+
+from PIL import GifImagePlugin, Image, ImageChops, ImageSequence
+
+from sniply_inference.session_pool import get_pool
+from sniply_metrics.metrics import record_stage, stage
+
+MODEL_NAME = "u2net"
+
+# Largest per-channel difference between two frames' thumbnails for them to
+# share a mask (dithering and re-compression noise); 0 only reuses exact copies.
+NEAR_DUPLICATE_THRESHOLD = int(os.environ.get("ANIMATION_DEDUP_THRESHOLD", 8))
+THUMBNAIL_SIZE = (64, 64)
+# Recent unique frames compared against each new frame for near-duplicates.
+NEAR_DUPLICATE_WINDOW = 8
+# Masks kept for exact repeats, e.g. a looping sprite.
+MASK_CACHE_SIZE = int(os.environ.get("ANIMATION_MASK_CACHE", 64))
+DEFAULT_DURATION = 100
+
+# Per-format encoder options for frames with transparency: each frame
+# replaces the previous one instead of being drawn over it.
+SAVE_OPTIONS = {
+    "PNG": {"disposal": 1, "blend": 0},  # APNG_DISPOSE_OP_BACKGROUND, APNG_BLEND_OP_SOURCE
+    "WEBP": {"quality": 90, "method": 4},
+}
+# Pillow's encoders read every frame up front, so frames must be collected
+# first; GIFs are written frame by frame with ``write_gif`` instead.
+LIST_FORMATS = {"PNG", "WEBP"}
+# Restore to background: a frame's area is cleared to transparent before the next one.
+GIF_DISPOSAL = 2
+
+
+def is_animated(input_path) -> bool:
+    try:
+        with Image.open(input_path) as img:
+            return getattr(img, "is_animated", False)
+    except OSError:
+        return False
+
+
+def remove_mask(session, img):
+    from rembg import remove  # already loaded in pool workers with the session
+
+    return remove(img, session=session, only_mask=True)
+
+
+def frame_key(frame) -> bytes:
+    return hashlib.blake2b(frame.tobytes(), digest_size=16).digest()
+
+
+def is_near_duplicate(thumb, other) -> bool:
+    extrema = ImageChops.difference(thumb, other).getextrema()
+    return max(high for _, high in extrema) <= NEAR_DUPLICATE_THRESHOLD
+
+
+def apply_mask(frame, mask, duration=None):
+    """The frame with ``mask`` as alpha, keeping pixels that were already transparent."""
+    out = frame.copy()
+    out.putalpha(ImageChops.multiply(frame.getchannel("A"), mask))
+    if duration is not None:
+        out.info["duration"] = duration
+    return out
+
+
+class MaskedFrames:
+    """Yields an animation's frames with their backgrounds removed, in order.
+
+    Each frame is hashed; exact and near-identical repeats reuse an earlier
+    mask, and unique frames run on the shared inference pool, at most
+    ``window`` at a time so memory stays bounded for long animations.
+    """
+
+    def __init__(self, img, pool, window: int):
+        self.img = img
+        self.pool = pool
+        self.window = max(window, 1)
+        self.frames = 0
+        self.unique = 0
+        self.inference_seconds = 0.0
+
+    def _masks(self):
+        cache = OrderedDict()  # frame key -> PendingResult of its mask
+        recent = deque(maxlen=NEAR_DUPLICATE_WINDOW)  # (thumbnail, PendingResult)
+        for frame in ImageSequence.Iterator(self.img):
+            rgba = frame.convert("RGBA")
+            # Read after decoding: WebP only sets a frame's duration on load.
+            duration = frame.info.get("duration") or DEFAULT_DURATION
+            key = frame_key(rgba)
+            pending = cache.get(key)
+            if pending is None and NEAR_DUPLICATE_THRESHOLD > 0:
+                thumb = rgba.resize(THUMBNAIL_SIZE, Image.Resampling.BOX)
+                pending = next((p for t, p in recent if is_near_duplicate(thumb, t)), None)
+            if pending is None:
+                pending = self.pool.submit(remove_mask, rgba, model_name=MODEL_NAME)
+                self.unique += 1
+                if NEAR_DUPLICATE_THRESHOLD > 0:
+                    recent.append((thumb, pending))
+            cache[key] = pending
+            cache.move_to_end(key)
+            if len(cache) > MASK_CACHE_SIZE:
+                cache.popitem(last=False)
+            yield key, rgba, duration, pending
+
+    def __iter__(self):
+        queued = deque()
+        previous = None  # (key, output) of the last frame, reused for exact repeats
+        for item in self._masks():
+            queued.append(item)
+            if len(queued) >= self.window:
+                previous = yield from self._emit(queued.popleft(), previous)
+        while queued:
+            previous = yield from self._emit(queued.popleft(), previous)
+
+    def _emit(self, item, previous):
+        key, rgba, duration, pending = item
+        first_use = pending.elapsed is None
+        mask = pending.get()
+        if first_use:
+            self.inference_seconds += pending.elapsed
+        self.frames += 1
+        if previous is not None and previous[0] == key:
+            # The encoders merge repeated frames into one longer frame.
+            out = previous[1].copy()
+            out.info["duration"] = duration
+        else:
+            out = apply_mask(rgba, mask, duration)
+        yield out
+        return key, out
+
+
+def gif_frame(frame):
+    """An RGBA frame as a palette image, with the index of its transparent colour if any."""
+    image = frame.convert("P", palette=Image.Palette.ADAPTIVE)
+    transparency = None
+    if image.palette.mode == "RGBA":
+        transparency = next((i for rgba, i in image.palette.colors.items() if rgba[3] == 0), None)
+    return image, transparency
+
+
+def write_gif(frames, output_path, loop=0) -> int:
+    """Writes RGBA ``frames`` to a GIF as they arrive and returns how many were written.
+
+    Pillow's GIF encoder keeps every frame until the last one arrives. Here
+    each frame is written as soon as the next one shows it isn't a repeat,
+    so one frame is held at a time. Every frame has its own palette and is
+    cropped to its visible area; disposal clears the rest to transparent.
+    """
+    written = 0
+    with open(output_path, "wb") as fp:
+        pending = None  # (frame, duration), written once the next frame differs
+        for frame in itertools.chain(frames, [None]):
+            if pending is not None and frame is not None:
+                if frame.tobytes() == pending[0].tobytes():
+                    pending = (pending[0], pending[1] + frame.info.get("duration", 0))
+                    continue
+            if pending is not None:
+                image, transparency = gif_frame(pending[0])
+                params = {"duration": pending[1], "disposal": GIF_DISPOSAL}
+                if transparency is not None:
+                    params["transparency"] = transparency
+                if written == 0:
+                    header, _ = GifImagePlugin.getheader(image, info={**params, "loop": loop})
+                    fp.writelines(header)
+                else:
+                    params["include_color_table"] = True
+                bbox = pending[0].getbbox() or (0, 0, 1, 1)
+                fp.writelines(GifImagePlugin.getdata(image.crop(bbox), bbox[:2], **params))
+                fp.flush()
+                written += 1
+            if frame is not None:
+                pending = (frame, frame.info.get("duration", DEFAULT_DURATION))
+        fp.write(b";")
+    return written
+
+
+def remove_bg_animated(input_path, output_path):
+    """Removes the background of an animated GIF, WebP or PNG (APNG), keeping frame timing."""
+    fmt = Image.registered_extensions().get(os.path.splitext(output_path)[1].lower(), "GIF")
+    pool = get_pool()
+    start = time.perf_counter()
+    with Image.open(input_path) as img:
+        options = {**SAVE_OPTIONS.get(fmt, {}), "loop": img.info.get("loop", 0)}
+        masked = MaskedFrames(img, pool, window=pool.size * 2)
+        with stage("encode") as run:
+            if fmt in LIST_FORMATS:
+                frames = list(masked)
+                options["duration"] = [frame.info["duration"] for frame in frames]
+                first, rest = frames[0], frames[1:]
+                first.save(output_path, format=fmt, save_all=True, append_images=rest, **options)
+            else:
+                # GIF frames are encoded as their masks arrive.
+                write_gif(masked, output_path, options["loop"])
+            run.frames = masked.frames
+            run.nbytes = os.path.getsize(output_path)
+    record_stage("inference", masked.inference_seconds, frames=masked.unique)
+    print(
+        f"Animated background removal: {masked.frames} frames, {masked.unique} unique, "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+
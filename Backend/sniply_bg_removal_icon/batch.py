@@ -0,0 +1,332 @@
+import io
+import json
+import os
+import posixpath
+import queue
+import time
+import traceback
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image, UnidentifiedImageError
+
+from sniply_bg_removal_icon.animated import MODEL_NAME, apply_mask, remove_bg_animated
+from sniply_inference.batched import DEFAULT_INPUT_SIZE, adaptive_batch_size, predict_image_masks
+from sniply_inference.session_pool import get_pool
+from sniply_jobs.thread_budget import current_threads
+from sniply_metrics.metrics import record_stage, stage
+
+MAX_ITEMS = int(os.environ.get("ICON_BATCH_MAX_ITEMS", 500))
+# Larger archive members are reported as failed instead of being extracted.
+MAX_ITEM_BYTES = int(os.environ.get("ICON_BATCH_MAX_ITEM_BYTES", 25 * 1024 * 1024))
+# Icons per model call; lowered further when memory is tight.
+BATCH_SIZE = int(os.environ.get("ICON_BATCH_SIZE", 8))
+# Encoded chunks the response may fall behind by before processing waits.
+MAX_PENDING_CHUNKS = 16
+MANIFEST_NAME = "manifest.json"
+
+
+class BatchError(ValueError):
+    """A batch request that can't be processed at all (as opposed to one bad item)."""
+
+
+class BatchCancelled(Exception):
+    """The client stopped reading the response."""
+
+
+@dataclass
+class BatchItem:
+    name: str
+    path: str  # the upload, or the archive holding the item
+    member: zipfile.ZipInfo | None = None
+
+
+@dataclass
+class Decoded:
+    item: BatchItem
+    data: bytes | None = None
+    image: Image.Image | None = None
+    animated: bool = False
+    error: str | None = None
+
+
+class BatchInputs:
+    """The images of a batch: uploaded files, with ZIP archives expanded in place.
+
+    Archives stay open until the batch is done, so members are read once,
+    when their turn comes.
+    """
+
+    def __init__(self, uploads: list[tuple[str, str]]):
+        self.items = []
+        self._archives = {}
+        try:
+            for filename, path in uploads:
+                if os.path.splitext(filename)[1].lower() == ".zip":
+                    self._add_archive(filename, path)
+                else:
+                    self.items.append(BatchItem(filename, path))
+        except zipfile.BadZipFile:
+            self.close()
+            raise BatchError(f"'{filename}' is not a valid ZIP archive.")
+        if not self.items:
+            self.close()
+            raise BatchError("The batch contains no images.")
+        if len(self.items) > MAX_ITEMS:
+            self.close()
+            raise BatchError(f"A batch may contain at most {MAX_ITEMS} images.")
+
+    def _add_archive(self, filename, path):
+        archive = self._archives[path] = zipfile.ZipFile(path)
+        for member in archive.infolist():
+            base = posixpath.basename(member.filename)
+            if member.is_dir() or base.startswith(".") or member.filename.startswith("__MACOSX/"):
+                continue
+            self.items.append(BatchItem(member.filename, path, member))
+
+    def read(self, item: BatchItem) -> bytes:
+        if item.member is None:
+            with open(item.path, "rb") as f:
+                return f.read()
+        if item.member.file_size > MAX_ITEM_BYTES:
+            raise ValueError(f"larger than {MAX_ITEM_BYTES // (1024 * 1024)} MB")
+        return self._archives[item.path].read(item.member)
+
+    def close(self):
+        for archive in self._archives.values():
+            archive.close()
+        self._archives.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ZipStream:
+    """Unseekable file that hands whatever is written to a streaming response.
+
+    ``zipfile`` writes local headers with data descriptors when it can't
+    seek, so each finished item can be sent as soon as it is added. The
+    queue is bounded: a slow client slows processing down instead of the
+    archive piling up in memory.
+    """
+
+    _END = object()
+
+    def __init__(self, max_chunks: int = MAX_PENDING_CHUNKS):
+        self._queue = queue.Queue(max_chunks)
+        self._buffer = bytearray()
+        self.cancelled = False
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, item):
+        while True:
+            if self.cancelled:
+                raise BatchCancelled()
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, error: Exception | None = None):
+        """Ends the response; an ``error`` makes the reader raise it (truncating the archive)."""
+        try:
+            self._put(error or self._END)
+        except BatchCancelled:
+            pass
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is self._END:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            self.cancelled = True
+
+
+def output_name(name: str, ext: str, taken: set) -> str:
+    """A unique, relative archive path for an item's result."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    stem = posixpath.splitext("/".join(parts) or "image")[0]
+    candidate, n = stem + ext, 1
+    while candidate in taken or candidate == MANIFEST_NAME:
+        candidate, n = f"{stem}-{n}{ext}", n + 1
+    taken.add(candidate)
+    return candidate
+
+
+def decode(entry: Decoded) -> Decoded:
+    if entry.error:
+        return entry
+    try:
+        with Image.open(io.BytesIO(entry.data)) as img:
+            entry.animated = getattr(img, "is_animated", False)
+            if not entry.animated:
+                entry.image = img.convert("RGBA")
+                entry.data = None
+    except UnidentifiedImageError:
+        entry.error = "Not a supported image format"
+    except Exception as e:
+        entry.error = f"Unreadable image: {e}"
+    return entry
+
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def remove_animated(entry: Decoded, work_dir: str) -> tuple[str, bytes]:
+    ext = os.path.splitext(entry.item.name)[1].lower() or ".gif"
+    input_path = os.path.join(work_dir, f"animated-input{ext}")
+    output_path = os.path.join(work_dir, f"animated-output{ext}")
+    with open(input_path, "wb") as f:
+        f.write(entry.data)
+    try:
+        remove_bg_animated(input_path, output_path)
+        with open(output_path, "rb") as f:
+            return ext, f.read()
+    finally:
+        for path in (input_path, output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class IconBatch:
+    """Removes the backgrounds of many icons, writing each result to a ZIP as it finishes.
+
+    Items are read and decoded concurrently in chunks of ``batch_size``; each
+    chunk's still images go to the inference pool as one task, so a worker
+    runs a single model call on its loaded session for the whole chunk.
+    Up to one chunk per pool worker is in flight. Animated items take the
+    per-frame path of ``animated.py``. Failed items are listed in
+    ``manifest.json`` at the end of the archive and the rest still complete.
+    """
+
+    def __init__(self, inputs: BatchInputs, stream: ZipStream, work_dir: str):
+        self.inputs = inputs
+        self.stream = stream
+        self.work_dir = work_dir
+        self.pool = get_pool()
+        self.batch_size = adaptive_batch_size(
+            DEFAULT_INPUT_SIZE, DEFAULT_INPUT_SIZE, self.pool.size, BATCH_SIZE
+        )
+        self.manifest = []
+        self._taken = set()
+
+    def run(self) -> dict:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(current_threads()) as executor, zipfile.ZipFile(
+            self.stream, "w"
+        ) as archive:
+            in_flight = deque()
+            items = self.inputs.items
+            for i in range(0, len(items), self.batch_size):
+                in_flight.append(self._submit(executor, items[i : i + self.batch_size]))
+                if len(in_flight) > self.pool.size:
+                    self._write(executor, archive, *in_flight.popleft())
+            while in_flight:
+                self._write(executor, archive, *in_flight.popleft())
+            summary = self.summary(time.perf_counter() - start)
+            archive.writestr(MANIFEST_NAME, json.dumps({**summary, "items": self.manifest}, indent=2))
+        self.stream.flush()
+        print(
+            f"Icon batch: {summary['succeeded']} of {summary['total']} images in "
+            f"{summary['seconds']}s ({summary['failed']} failed)"
+        )
+        return summary
+
+    def summary(self, seconds: float) -> dict:
+        failed = sum(1 for entry in self.manifest if entry["status"] == "failed")
+        return {
+            "total": len(self.manifest),
+            "succeeded": len(self.manifest) - failed,
+            "failed": failed,
+            "seconds": round(seconds, 3),
+        }
+
+    def _read(self, item: BatchItem) -> Decoded:
+        try:
+            return Decoded(item, data=self.inputs.read(item))
+        except Exception as e:
+            return Decoded(item, error=f"Unreadable item: {e}")
+
+    def _submit(self, executor, chunk):
+        with stage("decode", frames=len(chunk)):
+            decoded = list(executor.map(decode, [self._read(item) for item in chunk]))
+        stills = [entry.image for entry in decoded if entry.image is not None]
+        pending = (
+            self.pool.submit(predict_image_masks, stills, model_name=MODEL_NAME)
+            if stills
+            else None
+        )
+        return decoded, pending
+
+    def _write(self, executor, archive, decoded, pending):
+        masks, failure = [], None
+        if pending is not None:
+            try:
+                masks = pending.get()
+                record_stage("inference", pending.elapsed, frames=len(masks))
+            except Exception as e:
+                traceback.print_exc()
+                failure = f"Inference failed: {e}"
+        stills = [entry for entry in decoded if entry.image is not None]
+        with stage("encode", frames=len(masks)) as run:
+            encoded = (
+                list(
+                    executor.map(
+                        lambda pair: encode_png(apply_mask(pair[0].image, pair[1])),
+                        zip(stills, masks),
+                    )
+                )
+                if not failure
+                else []
+            )
+            run.nbytes = sum(len(data) for data in encoded)
+        results = dict(zip(map(id, stills), encoded))
+        for entry in decoded:
+            error = entry.error
+            ext, data = ".png", results.get(id(entry))
+            if error is None and entry.animated:
+                try:
+                    ext, data = remove_animated(entry, self.work_dir)
+                except Exception as e:
+                    error = f"Processing failed: {e}"
+            elif error is None and data is None:
+                error = failure or "Processing failed"
+            self._add(archive, entry.item.name, ext, data, error)
+            entry.image = entry.data = None
+
+    def _add(self, archive, name, ext, data, error):
+        if error is not None:
+            self.manifest.append({"input": name, "status": "failed", "error": error})
+            return
+        output = output_name(name, ext, self._taken)
+        info = zipfile.ZipInfo(output, time.localtime()[:6])
+        # PNG, GIF and WebP are already compressed.
+        archive.writestr(info, data, compress_type=zipfile.ZIP_STORED)
+        self.stream.flush()
+        self.manifest.append({"input": name, "status": "done", "output": output})
+
+
+def remove_icon_batch(inputs: BatchInputs, stream: ZipStream, work_dir: str) -> dict:
+    return IconBatch(inputs, stream, work_dir).run()
@@ -1,37 +1,32 @@
 import os
+
 from PIL import Image
-from rembg import remove
 
+from sniply_bg_removal_icon.animated import MODEL_NAME, is_animated, remove_bg_animated
+from sniply_inference.session_pool import get_pool
+from sniply_metrics.metrics import stage
 
-def remove_bg_image(input_path, output_path):
-    with Image.open(input_path) as img:
-        no_bg = remove(img)
-        if output_path.lower().endswith((".jpg", ".jpeg")):
-            no_bg = no_bg.convert("RGB")
-        no_bg.save(output_path)
 
+def remove_image(session, img):
+    from rembg import remove  # already loaded in pool workers with the session
 
-def remove_bg_gif(input_path, output_path):
-    with Image.open(input_path) as img:
-        frames = []
-        for frame in range(img.n_frames):
-            img.seek(frame)
-            no_bg_frame = remove(img)
-            frames.append(no_bg_frame)
+    return remove(img, session=session)
 
-        frames[0].save(
-            output_path,
-            save_all=True,
-            append_images=frames[1:],
-            loop=0,
-            duration=img.info.get("duration", 100),
-        )
+
+def remove_bg_image(input_path, output_path):
+    with Image.open(input_path) as img:
+        with stage("inference", frames=1):
+            no_bg = get_pool().run(remove_image, img, model_name=MODEL_NAME)
+        with stage("encode", frames=1) as run:
+            if output_path.lower().endswith((".jpg", ".jpeg")):
+                no_bg = no_bg.convert("RGB")
+            no_bg.save(output_path)
+            run.nbytes = os.path.getsize(output_path)
 
 
 def remove_background_from_media(input_path, output_path):
-    file_ext = os.path.splitext(input_path)[1].lower()
-    if file_ext == ".gif":
-        remove_bg_gif(input_path, output_path)
+    if is_animated(input_path):
+        remove_bg_animated(input_path, output_path)
     else:
         remove_bg_image(input_path, output_path)
 
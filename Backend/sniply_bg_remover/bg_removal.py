@@ -1,27 +1,113 @@
+import math
 import os
 import shutil
 import subprocess
 import time
-from functools import partial
-from multiprocessing import Pool, cpu_count
+from collections import deque
 
+import numpy as np
 from PIL import Image
-from rembg import new_session, remove
 from tqdm import tqdm
 
+from sniply_inference.batched import (
+    DEFAULT_INPUT_SIZE,
+    adaptive_batch_size,
+    composite,
+    predict_low_res_masks,
+    predict_masks,
+    remove_frames,
+)
+from sniply_inference.session_pool import get_pool
+from sniply_jobs.thread_budget import current_threads, thread_args
+from sniply_media.probe import probe_media
+from sniply_metrics.metrics import record_stage, stage
+from sniply_bg_remover.mask_output import (
+    DEFAULT_BACKGROUND,
+    MASK_OUTPUTS,
+    OUTPUT_MODES,
+    mask_decode_filter,
+    mask_encoder_command,
+)
+from sniply_bg_remover.temporal import KeyframeSelector, TemporalConfig, interpolate_masks
+
+
+PIPELINE_MODES = ("stream", "png")
+DEFAULT_MODEL = "u2netp"  # lightweight model for CPU
+
 
 def run_bg_removal_pipeline(
     input_video: str,
     output_video: str,
-    model_name: str = "u2netp",  # Reverted to lightweight model for CPU
+    model_name: str = DEFAULT_MODEL,
     frame_rate: int = 30,
-    workers: int = min(cpu_count(), 4),  # Conservative workers for cloud CPUs
-    batch_size: int = 5,  # Smaller batches for lower memory
+    batch_size: int | None = None,  # None adapts to available memory
+    mode: str = "stream",  # "stream" (raw frames over pipes) or "png" (frames on disk)
+    max_in_flight: int | None = None,
+    temporal: TemporalConfig | None = None,  # Segment keyframes only (stream mode)
+    refine: str = "bilinear",  # "edge" refines only a band around the mask edge
+    pre_filter: str | None = None,  # ffmpeg filters applied while decoding (stream mode)
+    post_filter: str | None = None,  # ffmpeg filters applied while encoding (stream mode)
+    output_mode: str = "rgba",  # or a mask output: "webm", "prores", "composite", "mask"
+    background: str = DEFAULT_BACKGROUND,  # colour behind the cut-out ("composite")
+    background_image: str | None = None,  # image behind the cut-out ("composite")
 ):
-    """Runs the complete background removal pipeline on CPU."""
-    print(f"Starting background removal for {input_video}...")
+    """Runs the complete background removal pipeline on CPU.
+
+    Mask outputs (see ``mask_output.py``) only move low-res masks through
+    Python; ffmpeg upscales and applies them. They need stream mode and
+    bilinear refinement. Returns a dict with the number of frames written
+    and inferences run.
+    """
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode '{mode}', expected one of {PIPELINE_MODES}")
+    if temporal is not None and mode != "stream":
+        raise ValueError("Temporal mask reuse is only available in stream mode")
+    if (pre_filter or post_filter) and mode != "stream":
+        raise ValueError("Pre/post filters are only available in stream mode")
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{output_mode}', expected one of {OUTPUT_MODES}")
+    if output_mode in MASK_OUTPUTS and (mode != "stream" or refine != "bilinear"):
+        raise ValueError("Mask outputs need stream mode and bilinear refinement")
+
+    print(f"Starting background removal for {input_video} ({mode} mode)...")
     t0 = time.time()
 
+    info = probe_media(input_video)
+    # Never resample above the source rate: duplicated frames would each cost
+    # an inference pass.
+    if info.video is not None and info.video.fps:
+        frame_rate = min(frame_rate, info.video.fps)
+
+    if batch_size is None:
+        width, height = probe_frame_size(input_video)
+        if output_mode in MASK_OUTPUTS:
+            width = height = DEFAULT_INPUT_SIZE
+        workers = get_pool().size
+        batch_size = adaptive_batch_size(width, height, workers)
+        # Short clips are split so that every worker gets a batch.
+        if info.frame_count:
+            batch_size = max(1, min(batch_size, math.ceil(info.frame_count / workers)))
+        print(f"Using adaptive batch size of {batch_size} frames")
+
+    if mode == "stream":
+        stats = stream_remove_backgrounds(
+            input_video,
+            output_video,
+            model_name,
+            frame_rate,
+            batch_size,
+            max_in_flight,
+            temporal,
+            refine,
+            pre_filter,
+            post_filter,
+            output_mode,
+            background,
+            background_image,
+        )
+        print(f"Background removal done in {time.time() - t0:.1f}s")
+        return stats
+
     base_dir = os.path.dirname(input_video)
     # Create unique subdirectories for concurrent runs
     run_id = os.path.splitext(os.path.basename(input_video))[0]
@@ -30,13 +116,20 @@ def run_bg_removal_pipeline(
 
     try:
         # 1. Extract frames
-        extract_frames(input_video, frame_dir, frame_rate)
+        with stage("extract"):
+            extract_frames(input_video, frame_dir, frame_rate)
 
         # 2. Remove backgrounds
-        remove_backgrounds(frame_dir, output_frame_dir, model_name, workers, batch_size)
+        with stage("inference") as run:
+            frame_count = remove_backgrounds(
+                frame_dir, output_frame_dir, model_name, batch_size, refine
+            )
+            run.frames = frame_count
 
         # 3. Create video
-        create_video(output_frame_dir, output_video, frame_rate)
+        with stage("encode", frames=frame_count) as run:
+            create_video(output_frame_dir, output_video, frame_rate)
+            run.nbytes = os.path.getsize(output_video)
 
     finally:
         # 4. Clean up
@@ -45,6 +138,308 @@ def run_bg_removal_pipeline(
         print(f"Cleaned up temporary directories.")
 
     print(f"Background removal done in {time.time() - t0:.1f}s")
+    return {"frames": frame_count, "inferences": frame_count, "skipped_inferences": 0}
+
+
+def probe_frame_size(input_video: str) -> tuple[int, int]:
+    """Returns the (width, height) of decoded frames, honouring rotation metadata."""
+    size = probe_media(input_video).display_size
+    if size is None:
+        raise ValueError(f"No video stream found in {input_video}")
+    return size
+
+
+def stream_remove_backgrounds(
+    input_video: str,
+    output_video: str,
+    model_name: str,
+    frame_rate: int,
+    batch_size: int,
+    max_in_flight: int | None = None,
+    temporal: TemporalConfig | None = None,
+    refine: str = "bilinear",
+    pre_filter: str | None = None,
+    post_filter: str | None = None,
+    output_mode: str = "rgba",
+    background: str = DEFAULT_BACKGROUND,
+    background_image: str | None = None,
+) -> dict:
+    """Decodes, segments and encodes frames through pipes without touching disk.
+
+    Frames are grouped into batches of ``batch_size`` and at most
+    ``max_in_flight`` batches are held between the decoder and the encoder,
+    so memory use does not grow with the length of the clip. By default that
+    is the number of pool workers the job's thread share covers, plus one,
+    re-read as other jobs start and finish. With
+    ``temporal`` set, only keyframes are segmented (see ``temporal.py``).
+    ``pre_filter`` and ``post_filter`` run inside the decoder and encoder
+    processes and must not change the frame size.
+
+    With a mask output, frames are decoded at the model's input size and
+    only their grayscale masks are piped on; the encoder reads the original
+    video itself and applies them.
+    """
+    width, height = probe_frame_size(input_video)
+    masks_only = output_mode in MASK_OUTPUTS
+    # u2net-family models take 320x320 input whatever the frame's aspect ratio.
+    decode_size = (DEFAULT_INPUT_SIZE, DEFAULT_INPUT_SIZE) if masks_only else (width, height)
+    frame_bytes = decode_size[0] * decode_size[1] * 3
+    pool = get_pool()
+
+    def in_flight_limit():
+        if max_in_flight:
+            return max_in_flight
+        workers = max(1, current_threads() // pool.session_threads)
+        return min(pool.size, workers) + 1
+
+    # Decoding and encoding get a quarter of the share; inference gets the rest.
+    ffmpeg_threads = thread_args(max(1, current_threads() // 4))
+    print(
+        f"Streaming {width}x{height} frames in batches of {batch_size} across "
+        f"{pool.size} workers (max {in_flight_limit()} batches in flight)..."
+    )
+
+    if masks_only:
+        # The same fps filter as the encoder's copy of the original, so that
+        # masks and frames pair up one to one.
+        decode_args = ["-vf", mask_decode_filter(frame_rate, decode_size, pre_filter)]
+    else:
+        decode_args = [*(["-vf", pre_filter] if pre_filter else []), "-r", str(frame_rate)]
+    decoder = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-i",
+            input_video,
+            *decode_args,
+            *ffmpeg_threads,
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+    )
+    if masks_only:
+        encode_cmd = mask_encoder_command(
+            input_video,
+            output_video,
+            output_mode,
+            (width, height),
+            decode_size,
+            frame_rate,
+            ffmpeg_threads,
+            background,
+            background_image,
+            pre_filter,
+            post_filter,
+        )
+    else:
+        encode_cmd = [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgba",
+            "-s",
+            f"{width}x{height}",
+            "-framerate",
+            str(frame_rate),
+            "-i",
+            "pipe:0",
+            *(["-vf", post_filter] if post_filter else []),
+            *ffmpeg_threads,
+            "-c:v",
+            "libx264",
+            "-preset",
+            "fast",
+            "-pix_fmt",
+            "yuv420p",
+            output_video,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+        ]
+    encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE)
+
+    # Seconds each stage kept this job busy; they overlap in wall-clock time.
+    # Without temporal mode, compositing runs in the workers as part of inference.
+    busy = {"decode": 0.0, "inference": 0.0, "composite": 0.0, "encode": 0.0}
+
+    def read_batches(size):
+        while True:
+            t = time.perf_counter()
+            buf = decoder.stdout.read(frame_bytes * size)
+            busy["decode"] += time.perf_counter() - t
+            count = len(buf) // frame_bytes
+            if count:
+                frames = np.frombuffer(buf[: count * frame_bytes], dtype=np.uint8)
+                yield frames.reshape(count, decode_size[1], decode_size[0], 3)
+            if count < size:
+                return
+
+    def collect(result):
+        # Temporal mode fetches some results twice; count their worker time once.
+        counted = result.elapsed is not None
+        value = result.get()
+        if not counted:
+            busy["inference"] += result.elapsed
+            for name, amount in result.counts.items():
+                stats[name] = stats.get(name, 0) + amount
+        return value
+
+    def write(frames):
+        # RGBA frames, or grayscale masks for a mask output.
+        t = time.perf_counter()
+        encoder.stdin.write(frames.tobytes())
+        busy["encode"] += time.perf_counter() - t
+        progress.update(len(frames))
+
+    if masks_only:
+        task, task_args = predict_low_res_masks, ()
+    else:
+        task, task_args = remove_frames, (refine,)
+
+    stats = {"frames": 0, "inferences": 0}
+    if refine == "edge" and not masks_only:
+        # Counted by the workers: frames refined along the mask edge only,
+        # frames too ragged for it, and the full-res pixels refined.
+        stats.update(edge_frames=0, edge_fallback_frames=0, edge_band_pixels=0)
+    try:
+        with tqdm(unit="frame") as progress:
+            if temporal is None:
+                pending = deque()
+                for frames in read_batches(batch_size):
+                    pending.append(pool.submit(task, frames, *task_args, model_name=model_name))
+                    stats["frames"] += len(frames)
+                    stats["inferences"] += len(frames)
+                    if len(pending) >= in_flight_limit():
+                        write(collect(pending.popleft()))
+                while pending:
+                    write(collect(pending.popleft()))
+            else:
+                frames = (frame for batch in read_batches(1) for frame in batch)
+                stream_temporal(
+                    frames,
+                    pool,
+                    model_name,
+                    temporal,
+                    refine,
+                    in_flight_limit,
+                    write,
+                    stats,
+                    collect,
+                    busy,
+                    masks_only,
+                )
+        t = time.perf_counter()
+        encoder.stdin.close()
+        encoder.wait()
+        busy["encode"] += time.perf_counter() - t
+    except BaseException:
+        decoder.kill()
+        encoder.kill()
+        raise
+    finally:
+        decoder.stdout.close()
+        if not encoder.stdin.closed:
+            encoder.stdin.close()
+        decoder.wait()
+        encoder.wait()
+
+    if decoder.returncode != 0:
+        raise subprocess.CalledProcessError(decoder.returncode, "ffmpeg (decode)")
+    if encoder.returncode != 0:
+        raise subprocess.CalledProcessError(encoder.returncode, "ffmpeg (encode)")
+
+    frames = stats["frames"]
+    record_stage("decode", busy["decode"], frames, frames * frame_bytes)
+    record_stage("inference", busy["inference"], stats["inferences"])
+    if temporal is not None:
+        record_stage("composite", busy["composite"], frames)
+        # Frames whose mask was derived from a keyframe's instead of inferred.
+        record_stage("mask_reuse", None, frames - stats["inferences"])
+    if "edge_frames" in stats:
+        record_stage("edge_refine", None, stats["edge_frames"])
+        record_stage("edge_fallback", None, stats["edge_fallback_frames"])
+    record_stage("encode", busy["encode"], frames, os.path.getsize(output_video))
+
+    stats["skipped_inferences"] = stats["frames"] - stats["inferences"]
+    if temporal is not None:
+        print(
+            f"Temporal mode ran {stats['inferences']} inferences for {stats['frames']} "
+            f"frames (skipped {stats['skipped_inferences']})"
+        )
+    return stats
+
+
+def stream_temporal(
+    frames,
+    pool,
+    model_name,
+    config,
+    refine,
+    in_flight_limit,
+    write,
+    stats,
+    collect,
+    busy,
+    masks_only=False,
+):
+    """Segments keyframes only and derives the other frames' masks from them.
+
+    Each segment is a keyframe plus the frames up to the next keyframe. Its
+    in-between masks are blended towards the next keyframe's mask, or held
+    if the next keyframe starts a new scene. With ``masks_only``, the masks
+    themselves are written instead of cut-out frames.
+    """
+    selector = KeyframeSelector(config)
+    compose = (lambda frames, masks: masks) if masks_only else composite
+    segments = deque()
+    current = None
+
+    def flush(segment):
+        key_frame, key_result, followers, next_result = segment
+        key_mask = collect(key_result)[0]
+        t = time.perf_counter()
+        out = compose(key_frame[None], key_mask[None])
+        busy["composite"] += time.perf_counter() - t
+        write(out)
+        if followers:
+            end_mask = collect(next_result)[0] if next_result is not None else None
+            t = time.perf_counter()
+            masks = interpolate_masks(key_mask, end_mask, len(followers))
+            out = compose(np.stack(followers), masks)
+            busy["composite"] += time.perf_counter() - t
+            write(out)
+
+    for frame in frames:
+        stats["frames"] += 1
+        is_key, scene_change = selector.check(frame)
+        if not is_key:
+            current[2].append(frame)
+            continue
+
+        if masks_only:
+            result = pool.submit(predict_low_res_masks, frame[None], model_name=model_name)
+        else:
+            result = pool.submit(predict_masks, frame[None], refine, model_name=model_name)
+        stats["inferences"] += 1
+        if current is not None:
+            current[3] = None if scene_change else result
+            segments.append(current)
+        current = [frame, result, [], None]
+        if len(segments) >= in_flight_limit():
+            flush(segments.popleft())
+
+    if current is not None:
+        segments.append(current)
+    while segments:
+        flush(segments.popleft())
 
 
 def extract_frames(input_video: str, frame_dir: str, frame_rate: int):
@@ -71,8 +466,8 @@ def remove_backgrounds(
     frame_dir: str,
     output_frame_dir: str,
     model_name: str,
-    workers: int,
     batch_size: int,
+    refine: str = "bilinear",
 ):
     print(f"Removing backgrounds from frames in {frame_dir}...")
     os.makedirs(output_frame_dir, exist_ok=True)
@@ -84,37 +479,46 @@ def remove_backgrounds(
         frame_files[i : i + batch_size] for i in range(0, len(frame_files), batch_size)
     ]
 
-    process_func = partial(
-        process_batch,
-        frame_dir=frame_dir,
-        output_frame_dir=output_frame_dir,
-        model_name=model_name,
-    )
-
+    pool = get_pool()
     print(
-        f"Processing {len(frame_files)} frames in {len(batches)} batches across {workers} workers..."
+        f"Processing {len(frame_files)} frames in {len(batches)} batches across {pool.size} workers..."
     )
-    with Pool(workers) as p:
-        list(tqdm(p.imap(process_func, batches), total=len(batches)))
+    pending = [
+        pool.submit(
+            process_batch,
+            batch,
+            frame_dir=frame_dir,
+            output_frame_dir=output_frame_dir,
+            refine=refine,
+            model_name=model_name,
+        )
+        for batch in batches
+    ]
+    for result in tqdm(pending):
+        result.get()
+    return len(frame_files)
 
 
 def process_batch(
-    batch_files: list[str], frame_dir: str, output_frame_dir: str, model_name: str
+    session,
+    batch_files: list[str],
+    frame_dir: str,
+    output_frame_dir: str,
+    refine: str = "bilinear",
 ):
-    """Processes a batch of frames in a single CPU-bound process."""
-    # Create one session per worker process. This is the key optimization.
-    session = new_session(model_name)
-
-    for frame_file in batch_files:
-        in_path = os.path.join(frame_dir, frame_file)
-        out_path = os.path.join(output_frame_dir, frame_file)
-
-        try:
-            with Image.open(in_path) as img:
-                no_bg = remove(img, session=session)
-                no_bg.save(out_path)
-        except Exception as e:
-            print(f"Error processing {frame_file}: {e}")
+    """Processes a batch of frames with one inference call on the worker's session."""
+    try:
+        frames = []
+        for frame_file in batch_files:
+            with Image.open(os.path.join(frame_dir, frame_file)) as img:
+                frames.append(np.asarray(img.convert("RGB")))
+        no_bg = remove_frames(session, np.stack(frames), refine)
+    except Exception as e:
+        print(f"Error processing batch {batch_files[0]}..{batch_files[-1]}: {e}")
+        return
+
+    for frame_file, frame in zip(batch_files, no_bg):
+        Image.fromarray(frame).save(os.path.join(output_frame_dir, frame_file))
 
 
 def create_video(output_frame_dir: str, output_video: str, frame_rate: int):
@@ -0,0 +1,170 @@
+"""Outputs built by ffmpeg from a low-resolution mask stream.
+
+In these modes the pipeline decodes frames already scaled down to the
+model's input size and pipes back one grayscale byte per low-res pixel.
+A single ffmpeg process upscales the masks, ``alphamerge``s them onto the
+original decoded video and encodes the result, so Python never builds or
+writes full-resolution RGBA frames.
+"""
+
+from dataclasses import dataclass
+
+from sniply_text_apply.apply_text import is_valid_color
+
+
+@dataclass(frozen=True)
+class MaskOutput:
+    extension: str
+    media_type: str
+    video_args: tuple[str, ...]
+
+
+H264_ARGS = ("-c:v", "libx264", "-preset", "fast", "-pix_fmt", "yuv420p")
+
+MASK_OUTPUTS = {
+    # VP9 with an alpha track; alt-ref frames would drop the alpha plane.
+    "webm": MaskOutput(
+        ".webm",
+        "video/webm",
+        (
+            "-c:v",
+            "libvpx-vp9",
+            "-pix_fmt",
+            "yuva420p",
+            "-b:v",
+            "0",
+            "-crf",
+            "32",
+            "-deadline",
+            "good",
+            "-cpu-used",
+            "4",
+            "-row-mt",
+            "1",
+            "-auto-alt-ref",
+            "0",
+        ),
+    ),
+    "prores": MaskOutput(
+        ".mov",
+        "video/quicktime",
+        ("-c:v", "prores_ks", "-profile:v", "4444", "-pix_fmt", "yuva444p10le"),
+    ),
+    # The cut-out over a solid colour or an image.
+    "composite": MaskOutput(".mp4", "video/mp4", H264_ARGS),
+    # The full-size mask alone, white for foreground.
+    "mask": MaskOutput(".mp4", "video/mp4", H264_ARGS),
+}
+# "rgba" is the original path: full-res RGBA frames piped to an H.264 encoder.
+OUTPUT_MODES = ("rgba",) + tuple(MASK_OUTPUTS)
+# Modes whose output is an MP4, e.g. for /pipeline.
+MP4_OUTPUT_MODES = ("rgba", "composite", "mask")
+DEFAULT_BACKGROUND = "black"
+BACKGROUND_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+
+def validate_background(color: str) -> str:
+    """Returns ``color`` if it is safe to put into the filter graph, else raises ValueError."""
+    if not is_valid_color(color):
+        raise ValueError(f"Invalid background colour '{color}'; use a name or #RRGGBB.")
+    return color
+
+
+def join_filters(*filters) -> str:
+    return ",".join(f for f in filters if f)
+
+
+def mask_decode_filter(frame_rate, mask_size: tuple[int, int], pre_filter=None) -> str:
+    """Decoder filters producing model-sized frames, in step with ``mask_filter_graph``."""
+    width, height = mask_size
+    return join_filters(pre_filter, f"fps={frame_rate}", f"scale={width}:{height}:flags=lanczos")
+
+
+def mask_filter_graph(
+    output_mode: str,
+    size: tuple[int, int],
+    frame_rate,
+    background: str = DEFAULT_BACKGROUND,
+    background_image: str | None = None,
+    pre_filter: str | None = None,
+    post_filter: str | None = None,
+) -> tuple[list[str], str]:
+    """Extra inputs and the ``-filter_complex`` graph for a mask output.
+
+    Input 0 is the original video and input 1 the mask pipe; ``[out]`` is
+    the labelled result. The original is resampled with the same ``fps``
+    filter as the mask decoder so that frames and masks pair up one to one.
+    """
+    width, height = size
+    graph = [f"[1:v]scale={width}:{height}:flags=bilinear,format=gray[mask]"]
+    inputs = []
+    if output_mode == "mask":
+        graph.append(f"[mask]{post_filter or 'null'}[out]")
+        return inputs, ";".join(graph)
+
+    source = join_filters(pre_filter, f"fps={frame_rate}", "setpts=PTS-STARTPTS")
+    graph += [f"[0:v]{source}[src]", "[src][mask]alphamerge[cut]"]
+    if output_mode != "composite":
+        graph.append(f"[cut]{post_filter or 'null'}[out]")
+        return inputs, ";".join(graph)
+
+    if background_image:
+        inputs = ["-loop", "1", "-i", background_image]
+        graph.append(
+            f"[2:v]scale={width}:{height}:force_original_aspect_ratio=increase,"
+            f"crop={width}:{height},setsar=1,fps={frame_rate}[bg]"
+        )
+    else:
+        background = validate_background(background)
+        graph.append(f"color=c={background}:s={width}x{height}:r={frame_rate}[bg]")
+    overlay = join_filters("[bg][cut]overlay=shortest=1:format=auto", post_filter)
+    graph.append(f"{overlay}[out]")
+    return inputs, ";".join(graph)
+
+
+def mask_encoder_command(
+    input_video: str,
+    output_video: str,
+    output_mode: str,
+    size: tuple[int, int],
+    mask_size: tuple[int, int],
+    frame_rate,
+    thread_args: list[str],
+    background: str = DEFAULT_BACKGROUND,
+    background_image: str | None = None,
+    pre_filter: str | None = None,
+    post_filter: str | None = None,
+) -> list[str]:
+    """ffmpeg command that reads gray masks on stdin and writes ``output_video``."""
+    inputs, graph = mask_filter_graph(
+        output_mode, size, frame_rate, background, background_image, pre_filter, post_filter
+    )
+    mask_width, mask_height = mask_size
+    return [
+        "ffmpeg",
+        "-y",
+        "-i",
+        input_video,
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "gray",
+        "-s",
+        f"{mask_width}x{mask_height}",
+        "-framerate",
+        str(frame_rate),
+        "-i",
+        "pipe:0",
+        *inputs,
+        "-filter_complex",
+        graph,
+        "-map",
+        "[out]",
+        "-an",
+        *thread_args,
+        *MASK_OUTPUTS[output_mode].video_args,
+        output_video,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+    ]
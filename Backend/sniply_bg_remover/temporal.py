@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# Frames between keyframes are held at full resolution until the next keyframe,
+# so the interval bounds the memory of each buffered segment.
+MAX_INTERVAL = 60
+
+
+@dataclass
+class TemporalConfig:
+    """Thresholds for deciding which frames get a fresh segmentation pass."""
+
+    # Mean absolute difference of grayscale thumbnails, in [0, 1]. Applied to
+    # the previous frame (scene change) and to the last keyframe (drift).
+    diff_threshold: float = 0.06
+    # Half L1 distance between grayscale histograms, in [0, 1].
+    hist_threshold: float = 0.2
+    # Force a keyframe after this many frames even if nothing changed.
+    max_interval: int = 15
+    thumb_size: int = 64
+    hist_bins: int = 32
+
+    def __post_init__(self):
+        if not 0 <= self.diff_threshold <= 1 or not 0 <= self.hist_threshold <= 1:
+            raise ValueError("Temporal thresholds must be between 0 and 1.")
+        if not 1 <= self.max_interval <= MAX_INTERVAL:
+            raise ValueError(f"The keyframe interval must be between 1 and {MAX_INTERVAL} frames.")
+
+
+class KeyframeSelector:
+    """Flags keyframes with a cheap thumbnail difference and histogram check.
+
+    A frame that differs sharply from its predecessor is a scene change. A
+    frame that has drifted away from the last keyframe, or that is
+    ``max_interval`` frames past it, is a keyframe within the same scene.
+    """
+
+    def __init__(self, config: TemporalConfig):
+        self.config = config
+        self._prev = None
+        self._key = None
+        self._since_key = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        height, width, _ = frame.shape
+        step = max(1, max(height, width) // self.config.thumb_size)
+        small = frame[::step, ::step].astype(np.float32)
+        thumb = (small @ np.array([0.299, 0.587, 0.114], dtype=np.float32)) / 255
+        hist = np.histogram(thumb, bins=self.config.hist_bins, range=(0, 1))[0]
+        return thumb, hist / max(hist.sum(), 1)
+
+    def _changed(self, a, b) -> bool:
+        diff = float(np.abs(a[0] - b[0]).mean())
+        hist_dist = float(np.abs(a[1] - b[1]).sum()) / 2
+        return diff > self.config.diff_threshold or hist_dist > self.config.hist_threshold
+
+    def check(self, frame: np.ndarray) -> tuple[bool, bool]:
+        """Returns ``(is_keyframe, is_scene_change)`` for the next frame."""
+        current = self._thumbnail(frame)
+        scene_change = self._prev is None or self._changed(current, self._prev)
+        self._prev = current
+        self._since_key += 1
+
+        is_key = (
+            scene_change
+            or self._since_key >= self.config.max_interval
+            or self._changed(current, self._key)
+        )
+        if is_key:
+            self._key, self._since_key = current, 0
+        return is_key, scene_change
+
+
+def interpolate_masks(start: np.ndarray, end: np.ndarray | None, count: int) -> np.ndarray:
+    """Returns ``count`` masks for the frames between two keyframes.
+
+    Masks are linearly blended from ``start`` towards ``end``; with no ``end``
+    (a scene change or the end of the clip) the ``start`` mask is held.
+    """
+    if end is None:
+        return np.repeat(start[None], count, axis=0)
+    weights = (np.arange(1, count + 1, dtype=np.float32) / (count + 1))[:, None, None]
+    blended = start[None] * (1 - weights) + end[None] * weights
+    return blended.astype(np.uint8)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 5 * 1024**3))
+
+
+def make_cache_key(content_hash: str, processor_name: str, params: dict) -> str:
+    """Derives a cache key from the input's hash, the processor and its normalised params."""
+    payload = json.dumps(
+        {"input": content_hash, "processor": processor_name, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _link(src: str, dst: str):
+    """Hard-links ``dst`` to ``src`` so both names share one copy on disk."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Another filesystem, or one without hard links.
+        shutil.copyfile(src, dst)
+
+
+class ResultCache:
+    """Content-addressed store of processor outputs with LRU eviction.
+
+    Each entry lives in ``<root>/<key>/<filename>`` and is a hard link to
+    the result it was stored from, so a result is kept on disk once. Hits
+    are linked into ``results_root`` in turn, so evicting an entry never
+    removes a file a job or response still points at.
+
+    ``max_bytes`` bounds both directories together: entries are evicted
+    least recently used first while the total is over budget. Entries that
+    share their file with a result cost nothing extra and stay pinned until
+    the result expires after ``result_ttl`` seconds. Recency is persisted
+    through file mtimes, so the order survives restarts.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        results_root: str | None = None,
+        result_ttl: float | None = None,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.results_root = results_root
+        self.result_ttl = result_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (path, size, inode), oldest first
+        self._total = 0
+        self._results = {}  # result path -> (inode, size, added_at), oldest first
+        self._result_inodes = {}  # inode -> number of results sharing it
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for key in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, key)
+            files = os.listdir(entry_dir) if os.path.isdir(entry_dir) else []
+            if ".tmp" in key or len(files) != 1:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            path = os.path.join(entry_dir, files[0])
+            st = os.stat(path)
+            found.append((st.st_mtime, key, path, st.st_size, st.st_ino))
+        for _, key, path, size, inode in sorted(found):
+            self._entries[key] = (path, size, inode)
+            self._total += size
+        results = []
+        if self.results_root and os.path.isdir(self.results_root):
+            for dirpath, _, files in os.walk(self.results_root):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    results.append((os.stat(path).st_mtime, path))
+        with self._lock:
+            for mtime, path in sorted(results):
+                self._add_result(path, mtime)
+            self._evict()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._lookup(key)
+        if entry is None:
+            return None
+        os.utime(entry[0])
+        return entry[0]
+
+    def checkout(self, key: str, result_path: str) -> str | None:
+        """Links a cached result to ``result_path`` and returns it, or None on a miss."""
+        os.makedirs(os.path.dirname(result_path), exist_ok=True)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            _link(entry[0], result_path)
+            self._add_result(result_path)
+        os.utime(result_path)
+        return result_path
+
+    def add_result(self, result_path: str):
+        """Counts a result file against the budget until it expires."""
+        with self._lock:
+            self._add_result(result_path)
+            self._evict()
+
+    def put(self, key: str, result_path: str) -> str | None:
+        """Links a finished result into the cache and returns its cached path."""
+        size = os.path.getsize(result_path)
+        if size > self.max_bytes:
+            return None
+        entry_dir = os.path.join(self.root, key)
+        tmp_dir = f"{entry_dir}.tmp{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        _link(result_path, os.path.join(tmp_dir, os.path.basename(result_path)))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            path = os.path.join(entry_dir, os.path.basename(result_path))
+            self._entries[key] = (path, size, os.stat(path).st_ino)
+            self._total += size
+            self._evict()
+        return path
+
+    def clear(self):
+        """Evicts every entry; results linked from them stay."""
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+                self.evictions += 1
+
+    def _lookup(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or not os.path.exists(entry[0]):
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def _add_result(self, path: str, added_at: float | None = None):
+        if path in self._results:
+            self._remove_result(path)
+        st = os.stat(path)
+        self._results[path] = (st.st_ino, st.st_size, added_at or time.time())
+        self._result_inodes[st.st_ino] = self._result_inodes.get(st.st_ino, 0) + 1
+
+    def _remove_result(self, path: str):
+        inode, _, _ = self._results.pop(path)
+        self._result_inodes[inode] -= 1
+        if not self._result_inodes[inode]:
+            del self._result_inodes[inode]
+
+    def _expire_results(self):
+        if self.result_ttl is None:
+            return
+        cutoff = time.time() - self.result_ttl
+        for path in [p for p, (_, _, added_at) in self._results.items() if added_at < cutoff]:
+            self._remove_result(path)
+            try:
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+    def _result_bytes(self) -> int:
+        """Bytes of results that don't share their file with a cache entry."""
+        cached = {inode for _, _, inode in self._entries.values()}
+        return sum(size for inode, size, _ in self._results.values() if inode not in cached)
+
+    def _drop(self, key: str):
+        path, size, _ = self._entries.pop(key)
+        self._total -= size
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def _evict(self):
+        self._expire_results()
+        usage = self._total + self._result_bytes()
+        for key in list(self._entries):
+            if usage <= self.max_bytes:
+                break
+            _, size, inode = self._entries[key]
+            if inode in self._result_inodes:
+                continue  # pinned: a result still uses this file
+            self._drop(key)
+            self.evictions += 1
+            usage -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "result_bytes": self._result_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,292 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from sniply_inference.session_pool import count
+
+# Normalisation used by the u2net family of models (matches rembg).
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+DEFAULT_INPUT_SIZE = 320
+
+# Rough peak memory of one u2netp forward pass at 320x320, per frame.
+MODEL_BYTES_PER_FRAME = 64 * 1024 * 1024
+MAX_BATCH_SIZE = 16
+
+# "bilinear" upsamples the whole mask; "edge" upsamples with nearest-neighbour
+# lookups and only refines pixels in a thin band around the mask boundary.
+REFINE_MODES = ("bilinear", "edge")
+# Low-res probabilities outside this range count as settled foreground/background.
+EDGE_LOW, EDGE_HIGH = 0.05, 0.95
+# Radius (in low-res pixels) of the window used to sample foreground/background colours.
+COLOR_RADIUS = 2
+# Minimum squared RGB distance between sampled colours for the colour model to be trusted.
+MIN_COLOR_CONTRAST = 30.0**2
+# Above this fraction of band cells the mask is too ragged to benefit from
+# band-only refinement, so plain bilinear upsampling is cheaper.
+MAX_BAND_FRACTION = 0.25
+
+
+def available_memory() -> int:
+    """Returns the bytes of memory currently available to new allocations."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 1024 * 1024 * 1024
+
+
+def adaptive_batch_size(
+    width: int, height: int, workers: int, max_batch: int = MAX_BATCH_SIZE
+) -> int:
+    """Picks a batch size so that all workers' in-flight batches fit in half of free memory."""
+    # RGB input, RGBA output and float32 mask buffers for the upsample.
+    frame_bytes = width * height * (3 + 4 + 4 * 3)
+    budget = available_memory() // 2 // max(workers, 1)
+    return int(max(1, min(max_batch, budget // (frame_bytes + MODEL_BYTES_PER_FRAME))))
+
+
+def _input_size(inner_session) -> tuple[int, int]:
+    shape = inner_session.get_inputs()[0].shape
+    if len(shape) == 4 and isinstance(shape[2], int) and isinstance(shape[3], int):
+        return shape[3], shape[2]
+    return DEFAULT_INPUT_SIZE, DEFAULT_INPUT_SIZE
+
+
+def _supports_batching(inner_session) -> bool:
+    batch_dim = inner_session.get_inputs()[0].shape[0]
+    return not isinstance(batch_dim, int) or batch_dim != 1
+
+
+def resize_frames(frames: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+    """Resizes (N, H, W, 3) uint8 frames to the model's input size."""
+    return np.stack(
+        [np.asarray(Image.fromarray(f).resize(size, Image.Resampling.LANCZOS)) for f in frames]
+    )
+
+
+def prepare_batch(small: np.ndarray) -> np.ndarray:
+    """Returns a normalised NCHW float32 tensor for a batch of resized frames."""
+    small = small.astype(np.float32)
+    peak = small.reshape(len(small), -1).max(axis=1)
+    small /= np.maximum(peak, 1e-6)[:, None, None, None]
+    small -= MEAN
+    small /= STD
+    return np.ascontiguousarray(small.transpose(0, 3, 1, 2))
+
+
+def run_model(inner_session, tensor: np.ndarray) -> np.ndarray:
+    """Runs one session call per batch and returns (N, h, w) raw predictions."""
+    input_name = inner_session.get_inputs()[0].name
+    if _supports_batching(inner_session):
+        return inner_session.run(None, {input_name: tensor})[0][:, 0]
+    # Models exported with a fixed batch of 1 still share the vectorised pre/post steps.
+    return np.concatenate(
+        [inner_session.run(None, {input_name: t[None]})[0][:, 0] for t in tensor]
+    )
+
+
+def normalize_predictions(pred: np.ndarray) -> np.ndarray:
+    """Min-max scales each prediction in the batch to [0, 1]."""
+    flat = pred.reshape(len(pred), -1)
+    lo = flat.min(axis=1)[:, None, None]
+    hi = flat.max(axis=1)[:, None, None]
+    return (pred - lo) / np.maximum(hi - lo, 1e-6)
+
+
+def resize_masks(masks: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Bilinearly resizes a (N, h, w) float batch to (N, height, width)."""
+    _, h, w = masks.shape
+
+    def axis(out_len, in_len):
+        pos = np.clip((np.arange(out_len) + 0.5) * in_len / out_len - 0.5, 0, in_len - 1)
+        lo = np.floor(pos).astype(np.intp)
+        hi = np.minimum(lo + 1, in_len - 1)
+        return lo, hi, (pos - lo).astype(np.float32)
+
+    y0, y1, wy = axis(height, h)
+    x0, x1, wx = axis(width, w)
+    rows = masks[:, y0] * (1 - wy)[None, :, None] + masks[:, y1] * wy[None, :, None]
+    return rows[:, :, x0] * (1 - wx) + rows[:, :, x1] * wx
+
+
+def _nearest_axis(out_len: int, in_len: int):
+    """Nearest-neighbour source index per output position, plus each source cell's span."""
+    index = np.minimum(((np.arange(out_len) + 0.5) * in_len / out_len).astype(np.intp), in_len - 1)
+    cells = np.arange(in_len)
+    return index, np.searchsorted(index, cells), np.searchsorted(index, cells, side="right")
+
+
+def _neighbour_colors(small: np.ndarray, pred: np.ndarray, n, i, j, radius: int):
+    """Sums settled foreground/background colours in a window around each cell.
+
+    Returns ``(fg_count, bg_count, fg_rgb_sum, bg_rgb_sum)`` for the cells only.
+    """
+    _, h, w = pred.shape
+    fg_count = np.zeros(len(n), dtype=np.float32)
+    bg_count = np.zeros(len(n), dtype=np.float32)
+    fg_sum = np.zeros((len(n), 3), dtype=np.float32)
+    bg_sum = np.zeros((len(n), 3), dtype=np.float32)
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            y, x = i + dy, j + dx
+            inside = (y >= 0) & (y < h) & (x >= 0) & (x < w)
+            y, x = np.clip(y, 0, h - 1), np.clip(x, 0, w - 1)
+            p = pred[n, y, x]
+            rgb = small[n, y, x].astype(np.float32)
+            fg = (inside & (p >= EDGE_HIGH)).astype(np.float32)
+            bg = (inside & (p <= EDGE_LOW)).astype(np.float32)
+            fg_count += fg
+            bg_count += bg
+            fg_sum += rgb * fg[:, None]
+            bg_sum += rgb * bg[:, None]
+    return fg_count, bg_count, fg_sum, bg_sum
+
+
+def edge_band(pred: np.ndarray) -> np.ndarray:
+    """Marks low-res pixels that are uncertain or touch the foreground boundary."""
+    solid = pred > 0.5
+    padded = np.pad(solid, [(0, 0), (1, 1), (1, 1)], mode="edge")
+    _, h, w = pred.shape
+    shifts = [
+        padded[:, 1 + dy : 1 + dy + h, 1 + dx : 1 + dx + w]
+        for dy in (-1, 0, 1)
+        for dx in (-1, 0, 1)
+    ]
+    boundary = np.any(shifts, axis=0) != np.all(shifts, axis=0)
+    return boundary | ((pred > EDGE_LOW) & (pred < EDGE_HIGH))
+
+
+def refine_edges(frames: np.ndarray, small: np.ndarray, pred: np.ndarray) -> np.ndarray:
+    """Upsamples low-res predictions, refining only the pixels near the mask edge.
+
+    Away from the edge, masks are upsampled with nearest-neighbour lookups,
+    which cost one byte per pixel. Inside the band, each full-res pixel gets
+    a bilinear alpha. Where the neighbourhood has clear foreground and
+    background colours, that alpha is blended with the pixel's projection
+    onto the line between those colours. Float work scales with the band
+    size, not the frame size. Each mask whose band covers more than
+    ``MAX_BAND_FRACTION`` of its frame falls back to bilinear upsampling.
+    """
+    _, height, width, _ = frames.shape
+    _, h, w = pred.shape
+    band = edge_band(pred)
+    ragged = band.mean(axis=(1, 2)) > MAX_BAND_FRACTION
+    count("edge_frames", int((~ragged).sum()))
+
+    yi, y_start, y_end = _nearest_axis(height, h)
+    xi, x_start, x_end = _nearest_axis(width, w)
+    masks = (np.clip(pred, 0, 1) * 255).astype(np.uint8)[:, yi][:, :, xi]
+    if ragged.any():
+        count("edge_fallback_frames", int(ragged.sum()))
+        bilinear = resize_masks(pred[ragged], height, width)
+        masks[ragged] = (np.clip(bilinear, 0, 1) * 255).astype(np.uint8)
+        band[ragged] = False
+
+    # Expand band cells into the full-res pixels they cover.
+    cn, ci, cj = np.nonzero(band)
+    rows, cols = y_end[ci] - y_start[ci], x_end[cj] - x_start[cj]
+    counts = rows * cols
+    count("edge_band_pixels", int(counts.sum()))
+    if not counts.sum():
+        return masks
+    cell = np.repeat(np.arange(len(cn)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    py = y_start[ci][cell] + local // cols[cell]
+    px = x_start[cj][cell] + local % cols[cell]
+    pn = cn[cell]
+
+    # Bilinear alpha at each band pixel.
+    fy = np.clip((py + 0.5) * h / height - 0.5, 0, h - 1)
+    fx = np.clip((px + 0.5) * w / width - 0.5, 0, w - 1)
+    y0, x0 = fy.astype(np.intp), fx.astype(np.intp)
+    y1, x1 = np.minimum(y0 + 1, h - 1), np.minimum(x0 + 1, w - 1)
+    wy, wx = fy - y0, fx - x0
+    alpha = (
+        pred[pn, y0, x0] * (1 - wy) * (1 - wx)
+        + pred[pn, y0, x1] * (1 - wy) * wx
+        + pred[pn, y1, x0] * wy * (1 - wx)
+        + pred[pn, y1, x1] * wy * wx
+    )
+
+    # Mean settled foreground/background colours around each band cell.
+    fg_count, bg_count, fg_sum, bg_sum = _neighbour_colors(small, pred, cn, ci, cj, COLOR_RADIUS)
+    fore = fg_sum / np.maximum(fg_count, 1)[:, None]
+    back = bg_sum / np.maximum(bg_count, 1)[:, None]
+    axis = fore - back
+    contrast = (axis * axis).sum(axis=1)
+    trusted = (fg_count > 0) & (bg_count > 0) & (contrast >= MIN_COLOR_CONTRAST)
+
+    pixel = frames[pn, py, px].astype(np.float32)
+    back, axis = back[cell], axis[cell]
+    projected = ((pixel - back) * axis).sum(axis=1) / np.maximum(contrast[cell], 1e-6)
+    alpha = np.where(trusted[cell], (alpha + np.clip(projected, 0, 1)) / 2, alpha)
+
+    masks[pn, py, px] = (alpha * 255).astype(np.uint8)
+    return masks
+
+
+def predict_masks(session, frames: np.ndarray, refine: str = "bilinear") -> np.ndarray:
+    """Predicts (N, H, W) uint8 alpha masks for a (N, H, W, 3) batch of frames."""
+    if refine not in REFINE_MODES:
+        raise ValueError(f"Unknown refine mode '{refine}', expected one of {REFINE_MODES}")
+    inner = session.inner_session
+    _, height, width, _ = frames.shape
+    small = resize_frames(frames, _input_size(inner))
+    pred = normalize_predictions(run_model(inner, prepare_batch(small))).astype(np.float32)
+    if refine == "edge":
+        return refine_edges(frames, small, pred)
+    masks = resize_masks(pred, height, width)
+    return (np.clip(masks, 0, 1) * 255).astype(np.uint8)
+
+
+def predict_low_res_masks(session, small: np.ndarray) -> np.ndarray:
+    """Pool task: (N, h, w) uint8 masks at the model's resolution.
+
+    ``small`` frames are expected to be decoded at the model's input size
+    already; others are resized first.
+    """
+    inner = session.inner_session
+    size = _input_size(inner)
+    if small.shape[2:0:-1] != size:
+        small = resize_frames(small, size)
+    pred = normalize_predictions(run_model(inner, prepare_batch(small)))
+    return (np.clip(pred, 0, 1) * 255).astype(np.uint8)
+
+
+def composite(frames: np.ndarray, masks: np.ndarray) -> np.ndarray:
+    """Cuts out (N, H, W, 3) frames with (N, H, W) masks, returning RGBA frames."""
+    rgb = (frames.astype(np.uint16) * masks[..., None] // 255).astype(np.uint8)
+    return np.concatenate([rgb, masks[..., None]], axis=-1)
+
+
+def remove_frames(session, frames: np.ndarray, refine: str = "bilinear") -> np.ndarray:
+    """Pool task: removes the background of a batch of RGB frames."""
+    return composite(frames, predict_masks(session, frames, refine))
+
+
+def predict_image_masks(session, images: list) -> list:
+    """Pool task: predicts an L-mode alpha mask per image, in one model call.
+
+    Images may differ in size; each is resized to the model input for the
+    batch and its mask is scaled back to the image's own size.
+    """
+    inner = session.inner_session
+    size = _input_size(inner)
+    small = np.stack(
+        [np.asarray(img.convert("RGB").resize(size, Image.Resampling.LANCZOS)) for img in images]
+    )
+    pred = normalize_predictions(run_model(inner, prepare_batch(small)))
+    return [
+        Image.fromarray((np.clip(p, 0, 1) * 255).astype(np.uint8)).resize(
+            img.size, Image.Resampling.LANCZOS
+        )
+        for p, img in zip(pred, images)
+    ]
@@ -0,0 +1,234 @@
+"""Int8 variants of the segmentation models, with accuracy gating.
+
+Run from the ``Backend`` folder::
+
+    python -m sniply_inference.quantize quantize u2netp
+    python -m sniply_inference.quantize validate u2netp --samples clip.mp4 icon.png
+    python -m sniply_inference.quantize status
+
+``quantize`` makes ``<name>-int8`` from the float model in the model store
+with onnxruntime's dynamic quantization. ``validate`` runs both models on
+sample frames and records IoU and speed-up in the variant's manifest entry.
+Set ``QUANTIZED_MODELS=<name>`` to serve the variant; it is only used while
+its validation passed against the float model currently in the store.
+"""
+
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from sniply_inference.batched import (
+    _input_size,
+    normalize_predictions,
+    prepare_batch,
+    resize_frames,
+    run_model,
+)
+from sniply_inference.session_pool import DEFAULT_POOL_SIZE, INT8_SUFFIX, session_threads
+from sniply_media.probe import probe_media
+from sniply_models.model_store import get_store
+
+# Mean and worst-frame IoU of the int8 foreground masks against the float ones.
+MIN_MEAN_IOU = float(os.environ.get("QUANTIZE_MIN_MEAN_IOU", 0.95))
+MIN_FRAME_IOU = float(os.environ.get("QUANTIZE_MIN_FRAME_IOU", 0.85))
+MASK_THRESHOLD = 0.5
+DEFAULT_FRAMES = 24
+
+
+def quantize(model_name: str) -> str:
+    """Writes the dynamically quantized (uint8 weights) variant of a store model."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    store = get_store()
+    float_path = store.path(model_name)
+    base = store.entry(model_name)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, f"{model_name}{INT8_SUFFIX}.onnx")
+        start = time.perf_counter()
+        quantize_dynamic(float_path, output, weight_type=QuantType.QUInt8)
+        print(f"Quantized '{model_name}' in {time.perf_counter() - start:.1f}s")
+        entry = store.add(
+            model_name + INT8_SUFFIX,
+            output,
+            version=f"int8-{base.sha256[:12]}",
+            metadata={"quantized_from": base.sha256, "weight_type": "QUInt8"},
+        )
+    print(
+        f"{model_name}: {base.size / 1e6:.1f} MB float -> {entry.size / 1e6:.1f} MB int8; "
+        f"run 'validate' before enabling it"
+    )
+    return entry.name
+
+
+def _video_frames(path: str, count: int) -> list[np.ndarray]:
+    duration = probe_media(path).duration
+    frames = []
+    for i in range(count):
+        proc = subprocess.run(
+            [
+                "ffmpeg",
+                "-v",
+                "error",
+                "-ss",
+                f"{duration * (i + 0.5) / count:.3f}",
+                "-i",
+                path,
+                "-frames:v",
+                "1",
+                "-f",
+                "image2pipe",
+                "-c:v",
+                "png",
+                "-",
+            ],
+            capture_output=True,
+        )
+        if proc.returncode == 0 and proc.stdout:
+            with Image.open(io.BytesIO(proc.stdout)) as img:
+                frames.append(np.asarray(img.convert("RGB")))
+    return frames
+
+
+def sample_frames(samples: list[str], total: int = DEFAULT_FRAMES) -> list[np.ndarray]:
+    """RGB frames from images (one each) and videos (evenly spaced), ``total`` in all."""
+    images, videos = [], []
+    for path in samples:
+        try:
+            with Image.open(path) as img:
+                images.append(np.asarray(img.convert("RGB")))
+        except UnidentifiedImageError:
+            videos.append(path)
+    per_video = max(1, (total - len(images)) // len(videos)) if videos else 0
+    return images + [frame for path in videos for frame in _video_frames(path, per_video)]
+
+
+def _session(path: str):
+    import onnxruntime as ort
+
+    sess_opts = ort.SessionOptions()
+    # Same threading as a pool worker, so the timings match production.
+    sess_opts.intra_op_num_threads = session_threads(DEFAULT_POOL_SIZE)
+    sess_opts.inter_op_num_threads = 1
+    return ort.InferenceSession(path, sess_opts, providers=["CPUExecutionProvider"])
+
+
+def _predict(session, frames: list[np.ndarray]) -> tuple[list[np.ndarray], list[float]]:
+    """Low-res foreground probabilities and the model time of each frame."""
+    size = _input_size(session)
+    masks, seconds = [], []
+    for frame in frames:
+        tensor = prepare_batch(resize_frames(frame[None], size))
+        start = time.perf_counter()
+        pred = run_model(session, tensor)
+        seconds.append(time.perf_counter() - start)
+        masks.append(normalize_predictions(pred)[0])
+    return masks, seconds
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    a, b = a >= MASK_THRESHOLD, b >= MASK_THRESHOLD
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def validate(model_name: str, samples: list[str], frames: int = DEFAULT_FRAMES) -> dict:
+    """Compares the int8 variant's masks and speed with the float model's.
+
+    The result is recorded in the variant's manifest entry; the variant can
+    only be served while ``passed`` is true for the current float model.
+    """
+    store = get_store()
+    variant = model_name + INT8_SUFFIX
+    base = store.entry(model_name)
+    if store.entry(variant) is None:
+        raise SystemExit(f"No '{variant}' in the model store; run 'quantize {model_name}' first.")
+    images = sample_frames(samples, frames)
+    if not images:
+        raise SystemExit("None of the samples could be decoded.")
+
+    float_session, int8_session = _session(store.path(model_name)), _session(store.path(variant))
+    # One untimed call each, so neither pays for onnxruntime's lazy setup.
+    _predict(float_session, images[:1])
+    _predict(int8_session, images[:1])
+    float_masks, float_seconds = _predict(float_session, images)
+    int8_masks, int8_seconds = _predict(int8_session, images)
+
+    ious = [mask_iou(f, q) for f, q in zip(float_masks, int8_masks)]
+    float_ms = statistics.median(float_seconds) * 1000
+    int8_ms = statistics.median(int8_seconds) * 1000
+    result = {
+        "float_sha256": base.sha256,
+        "frames": len(images),
+        "samples": [os.path.basename(path) for path in samples],
+        "mean_iou": round(statistics.fmean(ious), 4),
+        "min_iou": round(min(ious), 4),
+        "min_mean_iou": MIN_MEAN_IOU,
+        "min_frame_iou": MIN_FRAME_IOU,
+        "float_ms": round(float_ms, 2),
+        "int8_ms": round(int8_ms, 2),
+        "speedup": round(float_ms / int8_ms, 3) if int8_ms else None,
+        "validated_at": round(time.time(), 3),
+    }
+    result["passed"] = result["mean_iou"] >= MIN_MEAN_IOU and result["min_iou"] >= MIN_FRAME_IOU
+    store.update_metadata(variant, validation=result)
+    return result
+
+
+def status() -> list[dict]:
+    """Quantization state of every float model in the store that has a variant."""
+    store = get_store()
+    rows = []
+    for entry in store.entries():
+        if not entry.name.endswith(INT8_SUFFIX):
+            continue
+        base = store.entry(entry.name[: -len(INT8_SUFFIX)])
+        validation = entry.metadata.get("validation", {})
+        rows.append(
+            {
+                "model": base.name if base else None,
+                "variant": entry.name,
+                "stale": base is None or entry.metadata.get("quantized_from") != base.sha256,
+                **validation,
+            }
+        )
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    make = commands.add_parser("quantize", help="Make <model>-int8 from the float model.")
+    make.add_argument("model")
+    check = commands.add_parser("validate", help="Compare <model>-int8 against the float model.")
+    check.add_argument("model")
+    check.add_argument("--samples", nargs="+", required=True, help="Images and/or videos.")
+    check.add_argument("--frames", type=int, default=DEFAULT_FRAMES)
+    commands.add_parser("status", help="Show recorded accuracy and speed-up per model.")
+    args = parser.parse_args(argv)
+
+    if args.command == "quantize":
+        quantize(args.model)
+    elif args.command == "validate":
+        result = validate(args.model, args.samples, args.frames)
+        print(
+            f"{args.model}: IoU mean {result['mean_iou']} / min {result['min_iou']} over "
+            f"{result['frames']} frames, {result['float_ms']} ms -> {result['int8_ms']} ms "
+            f"(x{result['speedup']}): {'passed' if result['passed'] else 'FAILED'}"
+        )
+        return 0 if result["passed"] else 1
+    else:
+        for row in status():
+            print(row)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
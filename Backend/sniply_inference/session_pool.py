@@ -0,0 +1,274 @@
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import Pool
+
+from sniply_jobs.thread_budget import get_budget
+from sniply_models.model_store import FETCHERS, get_store, register_fetcher
+
+DEFAULT_POOL_SIZE = int(os.environ.get("INFERENCE_POOL_SIZE", min(get_budget().total, 4)))
+# How long warm-up may wait for busy workers before giving up.
+WARM_TIMEOUT = float(os.environ.get("POOL_WARM_TIMEOUT", 600))
+# How long a stray warm-up task holds an already warm worker, so that a cold one takes the next.
+WARM_HOLD_SECONDS = 0.2
+# Models to run as their int8 variant ("<name>-int8" in the model store, made
+# by quantize.py), e.g. "u2netp,u2net". A variant is only used once it has
+# passed validation against the float model it was quantized from.
+QUANTIZED_MODELS = {
+    name.strip() for name in os.environ.get("QUANTIZED_MODELS", "").split(",") if name.strip()
+}
+INT8_SUFFIX = "-int8"
+
+# Worker-local cache of loaded model sessions, keyed by model name.
+_sessions = {}
+# Intra-op threads of this worker's sessions; 0 lets onnxruntime use every core.
+_session_threads = 0
+
+
+def validated_variant(model_name: str) -> str | None:
+    """Store name of the model's int8 variant if it passed validation against
+    the float model currently in the store, else None."""
+    store = get_store()
+    base = store.entry(model_name)
+    variant = store.entry(model_name + INT8_SUFFIX)
+    if base is None or variant is None:
+        return None
+    validation = variant.metadata.get("validation", {})
+    if validation.get("passed") and validation.get("float_sha256") == base.sha256:
+        return variant.name
+    return None
+
+
+def model_variant(model_name: str) -> str:
+    """Name of the store model that serves ``model_name`` in this deployment."""
+    if model_name in QUANTIZED_MODELS:
+        return validated_variant(model_name) or model_name
+    return model_name
+
+
+def session_threads(pool_size: int) -> int:
+    """Intra-op threads per worker so that a fully busy pool uses exactly the budget."""
+    return max(1, get_budget().total // max(pool_size, 1))
+
+
+def _init_worker(preload_models, threads=0):
+    global _session_threads
+    _session_threads = threads
+    for model_name in preload_models:
+        get_session(model_name)
+
+
+def get_session(model_name: str):
+    """Returns this worker's session for ``model_name``, loading it on first use."""
+    session = _sessions.get(model_name)
+    if session is None:
+        import onnxruntime as ort
+
+        from sniply_inference.store_session import new_store_session
+
+        sess_opts = ort.SessionOptions()
+        sess_opts.intra_op_num_threads = _session_threads
+        sess_opts.inter_op_num_threads = 1
+        # Weights come from the local model store, never from rembg's own
+        # download. The u2net family shares one 320x320 pre/post-processing.
+        session = _sessions[model_name] = new_store_session(
+            get_store().path(model_variant(model_name), verify=False), sess_opts
+        )
+    return session
+
+
+def _download_rembg_model(model_name: str):
+    def fetch(tmp_dir):
+        import rembg
+        from rembg.sessions import sessions_class
+
+        session_class = next(c for c in sessions_class if c.name() == model_name)
+        return session_class.download_models(), f"rembg-{rembg.__version__}"
+
+    return fetch
+
+
+def resolve_model(model_name: str) -> str:
+    """Verifies (or, if downloads are enabled, fetches) a model before workers load it."""
+    if model_name not in FETCHERS:
+        register_fetcher(model_name, _download_rembg_model(model_name))
+    path = get_store().path(model_name)
+    variant = model_variant(model_name)
+    if variant != model_name:
+        print(f"Using validated int8 variant '{variant}' for '{model_name}'")
+        return get_store().path(variant)
+    if model_name in QUANTIZED_MODELS:
+        print(f"'{model_name}' has no validated int8 variant; using the float model")
+    return path
+
+
+def _warm_session(session):
+    # One tiny inference pays for onnxruntime's lazy allocations up front.
+    from PIL import Image
+
+    session.predict(Image.new("RGB", (64, 64)))
+
+
+def _warm_worker(session, warm_pids):
+    if os.getpid() in warm_pids:
+        time.sleep(WARM_HOLD_SECONDS)
+    else:
+        _warm_session(session)
+    return os.getpid()
+
+
+# Counters of the task running in this worker, returned with its result.
+_task_counts = {}
+
+
+def count(name: str, amount: int = 1):
+    """Adds to a counter of the running pool task; see ``PendingResult.counts``."""
+    _task_counts[name] = _task_counts.get(name, 0) + amount
+
+
+def _run_task(func, model_name, args, kwargs):
+    _task_counts.clear()
+    start = time.perf_counter()
+    result = func(get_session(model_name), *args, **kwargs)
+    elapsed = time.perf_counter() - start
+    return os.getpid(), model_name, elapsed, dict(_task_counts), result
+
+
+class PendingResult:
+    """Handle to a task submitted to the inference pool."""
+
+    def __init__(self, async_result):
+        self._async_result = async_result
+        self.elapsed = None  # seconds the task ran in its worker, once fetched
+        self.counts = None  # what the task ``count``ed, once fetched
+
+    def ready(self) -> bool:
+        return self._async_result.ready()
+
+    def get(self, timeout: float | None = None):
+        _, _, self.elapsed, self.counts, result = self._async_result.get(timeout)
+        return result
+
+
+class InferencePool:
+    """Persistent worker processes that keep model sessions loaded between jobs.
+
+    Tasks are plain functions called as ``func(session, *args, **kwargs)`` in a
+    worker, where ``session`` is that worker's cached session for the model.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, preload_models=()):
+        self.size = size
+        self.session_threads = session_threads(size)
+        for model_name in preload_models:
+            resolve_model(model_name)
+        self._pool = Pool(
+            size,
+            initializer=_init_worker,
+            initargs=(tuple(preload_models), self.session_threads),
+        )
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._resolved = set(preload_models)
+        self._workers = {
+            proc.pid: {"models": set(preload_models), "tasks": 0, "busy_seconds": 0.0}
+            for proc in self._pool._pool
+        }
+
+    def submit(self, func, *args, model_name: str, **kwargs) -> PendingResult:
+        if model_name not in self._resolved:
+            resolve_model(model_name)
+            self._resolved.add(model_name)
+        return PendingResult(
+            self._pool.apply_async(
+                _run_task, (func, model_name, args, kwargs), callback=self._record
+            )
+        )
+
+    def run(self, func, *args, model_name: str, **kwargs):
+        return self.submit(func, *args, model_name=model_name, **kwargs).get()
+
+    def warm(self, model_name: str):
+        """Loads ``model_name`` and runs a dummy inference in every worker.
+
+        Tasks go to whichever worker is free, so rounds of them are submitted
+        until each worker's pid has reported back. Busy workers are waited
+        for, up to ``WARM_TIMEOUT`` seconds.
+        """
+        deadline = time.monotonic() + WARM_TIMEOUT
+        warm = set()
+        while True:
+            cold = {proc.pid for proc in self._pool._pool} - warm
+            if not cold:
+                return
+            results = [
+                self.submit(_warm_worker, frozenset(warm), model_name=model_name) for _ in cold
+            ]
+            try:
+                warm.update(r.get(max(0.0, deadline - time.monotonic())) for r in results)
+            except multiprocessing.TimeoutError:
+                raise RuntimeError(
+                    f"Inference workers {sorted(cold - warm)} did not warm up '{model_name}' "
+                    f"within {WARM_TIMEOUT:.0f}s"
+                )
+
+    def _record(self, outcome):
+        pid, model_name, elapsed, _, _ = outcome
+        with self._lock:
+            worker = self._workers.setdefault(
+                pid, {"models": set(), "tasks": 0, "busy_seconds": 0.0}
+            )
+            worker["models"].add(model_name)
+            worker["tasks"] += 1
+            worker["busy_seconds"] += elapsed
+
+    def stats(self) -> dict:
+        uptime = time.time() - self._started
+        with self._lock:
+            workers = [
+                {
+                    "pid": pid,
+                    "models": sorted(w["models"]),
+                    "tasks": w["tasks"],
+                    "busy_seconds": round(w["busy_seconds"], 3),
+                    "utilization": round(w["busy_seconds"] / uptime, 4) if uptime else 0.0,
+                }
+                for pid, w in self._workers.items()
+            ]
+        return {
+            "size": self.size,
+            "session_threads": self.session_threads,
+            "uptime_seconds": round(uptime, 1),
+            "workers": workers,
+        }
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_pool(size: int = DEFAULT_POOL_SIZE, preload_models=()) -> InferencePool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            print(f"Starting inference pool with {size} workers...")
+            _pool = InferencePool(size, preload_models)
+        return _pool
+
+
+def get_pool() -> InferencePool:
+    """Returns the shared pool, starting one with defaults if needed (e.g. CLI use)."""
+    return _pool or start_pool()
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,18 @@
+import onnxruntime as ort
+from rembg.sessions.u2net_custom import U2netCustomSession
+
+
+class StoreSession(U2netCustomSession):
+    """A u2net-family rembg session whose weights are a file from the model store.
+
+    rembg only loads custom models from under its own home directory, which
+    would tie the store's location to rembg's; this takes any local path.
+    """
+
+    @classmethod
+    def download_models(cls, *args, **kwargs):
+        return kwargs["model_path"]
+
+
+def new_store_session(model_path: str, sess_opts: ort.SessionOptions) -> StoreSession:
+    return StoreSession("u2net_custom", sess_opts, model_path=model_path)
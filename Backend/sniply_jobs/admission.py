@@ -0,0 +1,330 @@
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import anyio
+
+from sniply_jobs.cost_model import CostModel, work_units
+from sniply_jobs.thread_budget import lease
+from sniply_metrics.metrics import track_job
+
+
+@dataclass
+class ProcessorLimits:
+    concurrency: int
+    queue_depth: int
+
+
+# Heavy processors get few slots so they don't oversubscribe the CPU; cheap
+# ones get their own, wider lane so they never wait behind heavy jobs.
+DEFAULT_LIMITS = {
+    "bg_remover": ProcessorLimits(concurrency=1, queue_depth=4),
+    "noise_reduction": ProcessorLimits(concurrency=2, queue_depth=8),
+    "bg_remover_icon": ProcessorLimits(concurrency=2, queue_depth=16),
+    "text_apply": ProcessorLimits(concurrency=4, queue_depth=32),
+    # A pipeline may include background removal, so it is treated as heavy.
+    "pipeline": ProcessorLimits(concurrency=1, queue_depth=4),
+    # A batch keeps every inference worker busy on its own.
+    "bg_remover_icon_batch": ProcessorLimits(concurrency=1, queue_depth=4),
+}
+FALLBACK_LIMITS = ProcessorLimits(concurrency=1, queue_depth=4)
+# Weight of the latest run time in the moving average used for Retry-After.
+EWMA_ALPHA = 0.3
+# Jobs running at once across all processors; per-processor limits still apply.
+JOB_SLOTS = int(os.environ.get("JOB_SLOTS", max(2, os.cpu_count() or 1)))
+# Jobs expected to take at most this long ignore the global slot limit, so a
+# quick request never waits behind a long one.
+SHORT_JOB_SECONDS = float(os.environ.get("SHORT_JOB_SECONDS", 5))
+# Seconds of expected runtime a waiting job is credited per second queued,
+# so long jobs can't be starved by a stream of short ones.
+AGING_RATE = float(os.environ.get("SCHEDULER_AGING_RATE", 0.5))
+
+
+def limits_from_env(value: str | None = None) -> dict:
+    """Parses ``PROCESSOR_LIMITS`` ("name=concurrency:queue,...") over the defaults."""
+    limits = dict(DEFAULT_LIMITS)
+    value = value if value is not None else os.environ.get("PROCESSOR_LIMITS", "")
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, spec = item.partition("=")
+        concurrency, _, queue_depth = spec.partition(":")
+        limits[name.strip()] = ProcessorLimits(
+            concurrency=max(1, int(concurrency)),
+            queue_depth=max(0, int(queue_depth or 0)),
+        )
+    return limits
+
+
+class QueueFullError(Exception):
+    def __init__(self, processor: str, retry_after: int):
+        super().__init__(f"Too many pending '{processor}' requests, retry in {retry_after}s.")
+        self.processor = processor
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A request admitted to a processor's queue, not yet running."""
+
+    def __init__(self, gate):
+        self.gate = gate
+        self.admitted_at = time.monotonic()
+        self.done = False
+        self.units = None  # work units of the input, once probed
+        self.estimate = None  # expected run seconds
+        self.started_at = None
+        self.finished = False
+        self._wake = None  # called by the scheduler when the ticket starts
+
+    def priority(self, now: float) -> float:
+        """Shortest expected job first, minus credit for time spent waiting."""
+        return self.estimate - AGING_RATE * (now - self.admitted_at)
+
+    @property
+    def short(self) -> bool:
+        return self.estimate <= SHORT_JOB_SECONDS
+
+    def cancel(self):
+        """Gives the queue slot back without running (e.g. on a cache hit)."""
+        if not self.done:
+            self.done = True
+            self.gate.leave_queue()
+
+
+class ProcessorGate:
+    def __init__(self, name: str, limits: ProcessorLimits):
+        self.name = name
+        self.limits = limits
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_seconds = 0.0
+        self.run_seconds = 0.0
+        self.avg_run_seconds = None
+
+    def admit(self) -> Ticket:
+        with self._lock:
+            if self.waiting + self.running >= self.limits.concurrency + self.limits.queue_depth:
+                self.rejected += 1
+                raise QueueFullError(self.name, self._retry_after())
+            self.waiting += 1
+        return Ticket(self)
+
+    def leave_queue(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _retry_after(self) -> int:
+        # Time until the queue ahead drains by one slot.
+        per_job = self.avg_run_seconds or 10.0
+        ahead = self.waiting + self.running - self.limits.concurrency + 1
+        return max(1, math.ceil(per_job * max(ahead, 1) / self.limits.concurrency))
+
+    def start(self, ticket: Ticket):
+        with self._lock:
+            ticket.done = True
+            self.waiting -= 1
+            self.running += 1
+            self.queue_seconds += ticket.started_at - ticket.admitted_at
+
+    def finish(self, elapsed: float):
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self.run_seconds += elapsed
+            self.avg_run_seconds = (
+                elapsed
+                if self.avg_run_seconds is None
+                else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.avg_run_seconds
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": self.limits.concurrency,
+                "queue_depth": self.limits.queue_depth,
+                "waiting": self.waiting,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_queue_seconds": round(self.queue_seconds / self.completed, 3)
+                if self.completed
+                else None,
+                "avg_run_seconds": round(self.run_seconds / self.completed, 3)
+                if self.completed
+                else None,
+            }
+
+
+class AdmissionController:
+    """Per-processor concurrency limits and bounded queues.
+
+    Admitted jobs wait in one shared queue ordered by expected runtime (see
+    ``cost_model.py``) with aging, and start when both their processor and
+    the global ``slots`` limit have room. Short jobs skip the global limit.
+
+    Request handlers wait with ``run_async``, which holds no thread while
+    queued: queue depths may add up to more than the server's threadpool.
+    ``run`` blocks the calling thread instead, for jobs and batch producers
+    that have a thread of their own.
+    """
+
+    def __init__(self, limits: dict | None = None, slots: int = JOB_SLOTS):
+        self._limits = limits if limits is not None else limits_from_env()
+        self._gates = {name: ProcessorGate(name, lim) for name, lim in self._limits.items()}
+        self._lock = threading.Lock()
+        self.slots = slots
+        self.costs = CostModel()
+        self._turn = threading.Lock()
+        self._waiting = []
+        self._running = []
+
+    def gate(self, processor: str) -> ProcessorGate:
+        with self._lock:
+            gate = self._gates.get(processor)
+            if gate is None:
+                limits = self._limits.get(processor, FALLBACK_LIMITS)
+                gate = self._gates[processor] = ProcessorGate(processor, limits)
+            return gate
+
+    def admit(self, processor: str) -> Ticket:
+        """Reserves a queue slot, raising ``QueueFullError`` if the queue is full."""
+        return self.gate(processor).admit()
+
+    def estimate(self, ticket: Ticket, info=None) -> float:
+        """Sets the ticket's expected runtime from its probed ``MediaInfo`` (if any)."""
+        ticket.units = work_units(info)
+        ticket.estimate = self.costs.estimate(
+            ticket.gate.name, ticket.units, ticket.gate.avg_run_seconds
+        )
+        return ticket.estimate
+
+    def eta(self, ticket: Ticket) -> float:
+        """Expected seconds until the ticket's job finishes, queueing included."""
+        if ticket.estimate is None:
+            self.estimate(ticket)
+        now = time.monotonic()
+        with self._turn:
+            # Short jobs only compete with their own processor.
+            def competing(t):
+                return not ticket.short or t.gate is ticket.gate
+
+            running = [
+                max(0.0, t.estimate - (now - t.started_at)) for t in self._running if competing(t)
+            ]
+            ahead = [
+                t.estimate
+                for t in self._waiting
+                if t is not ticket and competing(t) and t.priority(now) <= ticket.priority(now)
+            ]
+        lanes = ticket.gate.limits.concurrency if ticket.short else self.slots
+        return (sum(running) + sum(ahead)) / lanes + ticket.estimate
+
+    def _can_start(self, ticket: Ticket) -> bool:
+        if ticket.gate.running >= ticket.gate.limits.concurrency:
+            return False
+        return ticket.short or len(self._running) < self.slots
+
+    def _next(self) -> Ticket | None:
+        now = time.monotonic()
+        ready = [t for t in self._waiting if self._can_start(t)]
+        return min(ready, key=lambda t: t.priority(now), default=None)
+
+    def _enqueue(self, ticket: Ticket, wake):
+        if ticket.estimate is None:
+            self.estimate(ticket)
+        with self._turn:
+            ticket._wake = wake
+            self._waiting.append(ticket)
+            self._dispatch()
+
+    def _dispatch(self):
+        """Starts every waiting ticket that fits, best first (lock held)."""
+        while True:
+            ticket = self._next()
+            if ticket is None:
+                return
+            self._waiting.remove(ticket)
+            self._running.append(ticket)
+            ticket.started_at = time.monotonic()
+            ticket.gate.start(ticket)
+            ticket._wake()
+
+    def wait(self, ticket: Ticket):
+        """Blocks the calling thread until the ticket's job may start."""
+        started = threading.Event()
+        self._enqueue(ticket, started.set)
+        started.wait()
+
+    async def wait_async(self, ticket: Ticket):
+        """Waits for the ticket's turn without holding a thread.
+
+        If the waiting task is cancelled (e.g. the client went away), the
+        ticket leaves the queue, or gives back its slot if it had started.
+        """
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        self._enqueue(ticket, lambda: loop.call_soon_threadsafe(started.set))
+        try:
+            await started.wait()
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    def _abandon(self, ticket: Ticket):
+        with self._turn:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                ticket.done = True
+                ticket.gate.leave_queue()
+                return
+        if not ticket.finished:
+            self._finish(ticket)
+
+    def _execute(self, ticket: Ticket, func, *args, **kwargs):
+        try:
+            # Running jobs split the CPU between them (see thread_budget.py).
+            queued = ticket.started_at - ticket.admitted_at
+            with lease(ticket.gate.name), track_job(ticket.gate.name, queued):
+                return func(*args, **kwargs)
+        finally:
+            self._finish(ticket)
+
+    def _finish(self, ticket: Ticket):
+        elapsed = time.monotonic() - ticket.started_at
+        self.costs.observe(ticket.gate.name, ticket.units, elapsed)
+        with self._turn:
+            ticket.finished = True
+            self._running.remove(ticket)
+            ticket.gate.finish(elapsed)
+            self._dispatch()
+
+    def run(self, ticket: Ticket, func, *args, **kwargs):
+        """Waits for the ticket's turn, then runs ``func`` and records its runtime."""
+        self.wait(ticket)
+        return self._execute(ticket, func, *args, **kwargs)
+
+    async def run_async(self, ticket: Ticket, func, *args, **kwargs):
+        """``run`` for request handlers: waits on the event loop, runs ``func`` in a thread."""
+        await self.wait_async(ticket)
+        try:
+            return await anyio.to_thread.run_sync(
+                functools.partial(self._execute, ticket, func, *args, **kwargs)
+            )
+        except BaseException:
+            # Cancelled before a worker thread picked the call up.
+            if not ticket.finished:
+                self._finish(ticket)
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            gates = list(self._gates.values())
+        return {
+            gate.name: {**gate.stats(), "cost_model": self.costs.stats(gate.name)}
+            for gate in gates
+        }
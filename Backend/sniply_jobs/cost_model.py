@@ -0,0 +1,95 @@
+import threading
+
+from sniply_media.probe import MediaInfo
+
+# Prior runtime model per processor, used until enough runs are observed:
+# seconds = overhead + rate * megapixel-frames.
+PRIORS = {
+    "bg_remover": (1.0, 0.12),
+    "pipeline": (1.0, 0.12),
+    "noise_reduction": (0.5, 0.01),
+    "text_apply": (0.3, 0.005),
+    "bg_remover_icon": (0.3, 0.4),
+}
+FALLBACK_PRIOR = (1.0, 0.05)
+# Estimate for jobs whose media couldn't be probed and that have no history.
+DEFAULT_ESTIMATE = 10.0
+# Runs needed before the fitted model replaces the prior.
+MIN_SAMPLES = 3
+# Weight kept by older observations on each new one, so the fit tracks drift
+# (e.g. a model change or different hardware).
+DECAY = 0.95
+
+
+def work_units(info: MediaInfo | None) -> float | None:
+    """Megapixel-frames to process: frame count times decoded frame area."""
+    if info is None or info.display_size is None:
+        return None
+    width, height = info.display_size
+    frames = info.frame_count
+    if not frames and info.video is not None and info.video.fps:
+        frames = info.duration * info.video.fps
+    return max(frames, 1) * width * height / 1e6
+
+
+class _Fit:
+    """Exponentially decayed least-squares fit of runtime against work units."""
+
+    def __init__(self):
+        self.n = self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.samples = 0
+
+    def observe(self, x: float, y: float):
+        self.n = self.n * DECAY + 1
+        self.sx = self.sx * DECAY + x
+        self.sy = self.sy * DECAY + y
+        self.sxx = self.sxx * DECAY + x * x
+        self.sxy = self.sxy * DECAY + x * y
+        self.samples += 1
+
+    def coefficients(self, prior: tuple[float, float]) -> tuple[float, float]:
+        if self.samples < MIN_SAMPLES:
+            return prior
+        denom = self.n * self.sxx - self.sx * self.sx
+        rate = (self.n * self.sxy - self.sx * self.sy) / denom if denom > 1e-9 else 0.0
+        if rate <= 0:
+            # Too little spread in job sizes to fit a slope: scale the prior instead.
+            scale = self.sy / max(prior[0] * self.n + prior[1] * self.sx, 1e-9)
+            return prior[0] * scale, prior[1] * scale
+        overhead = max(0.0, (self.sy - rate * self.sx) / self.n)
+        return overhead, rate
+
+
+class CostModel:
+    """Predicts job runtimes per processor and calibrates itself from finished jobs."""
+
+    def __init__(self):
+        self._fits = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, processor: str, units: float | None, fallback: float | None = None) -> float:
+        """Expected runtime in seconds; ``fallback`` is used when ``units`` is unknown."""
+        if units is None:
+            return fallback if fallback is not None else DEFAULT_ESTIMATE
+        with self._lock:
+            fit = self._fits.get(processor)
+            prior = PRIORS.get(processor, FALLBACK_PRIOR)
+            overhead, rate = fit.coefficients(prior) if fit else prior
+        return overhead + rate * units
+
+    def observe(self, processor: str, units: float | None, seconds: float):
+        if units is None:
+            return
+        with self._lock:
+            self._fits.setdefault(processor, _Fit()).observe(units, seconds)
+
+    def stats(self, processor: str) -> dict:
+        with self._lock:
+            fit = self._fits.get(processor)
+            prior = PRIORS.get(processor, FALLBACK_PRIOR)
+            overhead, rate = fit.coefficients(prior) if fit else prior
+            return {
+                "samples": fit.samples if fit else 0,
+                "overhead_seconds": round(overhead, 3),
+                "seconds_per_megapixel_frame": round(rate, 5),
+            }
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import dataclass, field
+
+from sniply_jobs.admission import AdmissionController, Ticket
+
+# Finished jobs are forgotten after this many seconds.
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 3600))
+
+
+@dataclass
+class Job:
+    processor: str
+    output_path: str
+    output_filename: str
+    media_type: str
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"  # queued -> running -> done | failed
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    estimated_run_seconds: float | None = None
+    estimated_finish_at: float | None = None
+
+    def to_dict(self) -> dict:
+        started = self.started_at or time.time()
+        finished = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "processor": self.processor,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": round(started - self.created_at, 3),
+            "run_seconds": round(finished - started, 3) if self.started_at else None,
+            "estimated_run_seconds": _rounded(self.estimated_run_seconds),
+            "estimated_finish_at": _rounded(self.estimated_finish_at),
+            "eta_seconds": _rounded(max(0.0, self.estimated_finish_at - time.time()))
+            if self.estimated_finish_at and self.status in ("queued", "running")
+            else None,
+        }
+
+
+def _rounded(value: float | None) -> float | None:
+    return round(value, 3) if value is not None else None
+
+
+class JobManager:
+    """Runs blocking processor calls in the background and tracks their state.
+
+    Every admitted job gets a thread that waits in the admission scheduler,
+    which decides the order jobs start in (shortest expected job first).
+    Admission queue limits bound the number of threads.
+    """
+
+    def __init__(self, admission: AdmissionController):
+        self._admission = admission
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, job: Job, ticket: Ticket, func, *args, **kwargs) -> Job:
+        """Queues ``func`` for a job already admitted with ``ticket``."""
+        job.estimated_run_seconds = ticket.estimate
+        job.estimated_finish_at = job.created_at + self._admission.eta(ticket)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        threading.Thread(
+            target=self._admission.run,
+            args=(ticket, self._run, job, func, args, kwargs),
+            name=f"job-{job.processor}",
+            daemon=True,
+        ).start()
+        return job
+
+    def add_finished(self, job: Job) -> Job:
+        """Registers a job whose result already exists (e.g. a cache hit)."""
+        job.status = "done"
+        job.started_at = job.finished_at = job.created_at
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, func, args, kwargs):
+        if self._closed:
+            job.error = "Server shutting down."
+            job.status = "failed"
+            job.finished_at = time.time()
+            return
+        job.started_at = time.time()
+        job.status = "running"
+        try:
+            func(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [
+            j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff
+        ]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        # Queued jobs fail fast instead of starting; running ones are abandoned.
+        self._closed = True
@@ -0,0 +1,102 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+
+# Cores shared by every running job; ffmpeg, onnxruntime and pool sizes all
+# derive from it so overlapping jobs don't oversubscribe the CPU.
+TOTAL_THREADS = int(os.environ.get("THREAD_BUDGET", os.cpu_count() or 1))
+
+# Relative share of the budget per processor; unlisted processors weigh 1.
+JOB_WEIGHTS = {
+    "bg_remover": 2.0,
+    "pipeline": 2.0,
+    "noise_reduction": 1.0,
+    "text_apply": 1.0,
+    "bg_remover_icon": 0.5,
+    "bg_remover_icon_batch": 1.0,
+}
+
+
+class Lease:
+    """A running job's share of the thread budget, updated as other jobs come and go."""
+
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        self.threads = 1
+
+    def ffmpeg_args(self) -> list[str]:
+        return thread_args(self.threads)
+
+
+class ThreadBudget:
+    def __init__(self, total: int = TOTAL_THREADS):
+        self.total = max(1, total)
+        self._leases = []
+        self._lock = threading.Lock()
+
+    def acquire(self, name: str, weight: float | None = None) -> Lease:
+        lease = Lease(name, JOB_WEIGHTS.get(name, 1.0) if weight is None else weight)
+        with self._lock:
+            self._leases.append(lease)
+            self._rebalance()
+        return lease
+
+    def release(self, lease: Lease):
+        with self._lock:
+            if lease in self._leases:
+                self._leases.remove(lease)
+                self._rebalance()
+
+    def _rebalance(self):
+        # Weighted shares of the budget, never below one thread per job.
+        weights = sum(lease.weight for lease in self._leases)
+        for lease in self._leases:
+            lease.threads = max(1, int(self.total * lease.weight / weights))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total": self.total,
+                "leased": sum(lease.threads for lease in self._leases),
+                "jobs": [{"name": l.name, "threads": l.threads} for l in self._leases],
+            }
+
+
+_budget = ThreadBudget()
+_current = contextvars.ContextVar("thread_lease", default=None)
+
+
+def get_budget() -> ThreadBudget:
+    return _budget
+
+
+@contextmanager
+def lease(name: str, weight: float | None = None):
+    """Holds a share of the budget for the duration of a job."""
+    current = _budget.acquire(name, weight)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        _budget.release(current)
+
+
+def current_lease() -> Lease | None:
+    return _current.get()
+
+
+def current_threads(default: int | None = None) -> int:
+    """Threads the current job may use: its lease, else ``default``, else the whole budget."""
+    current = _current.get()
+    if current is not None:
+        return current.threads
+    return default or _budget.total
+
+
+def thread_args(threads: int | None = None) -> list[str]:
+    """FFmpeg flags capping codec and filter-graph threads (``current_threads()`` by default)."""
+    threads = str(threads or current_threads())
+    return ["-threads", threads, "-filter_threads", threads]
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+import traceback
+
+COLD, WARMING, WARM, FAILED = "cold", "warming", "warm", "failed"
+
+# Processors that must be warm before the replica reports ready; all by default.
+REQUIRED = [p.strip() for p in os.environ.get("READY_PROCESSORS", "").split(",") if p.strip()]
+
+
+class Readiness:
+    """Warm-up state per processor, filled in by a background warm-up thread.
+
+    A processor is warm once its modules are imported and its models are
+    loaded and have run once, so its first request pays for neither.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self._thread = None
+
+    def _set(self, name: str, **state):
+        with self._lock:
+            self._states[name] = {**self._states.get(name, {}), **state}
+
+    def state(self, name: str) -> str:
+        with self._lock:
+            return self._states.get(name, {}).get("state", COLD)
+
+    def warm(self, name: str, steps):
+        """Runs a processor's warm-up ``steps`` in order; it is warm if all succeed."""
+        self._set(name, state=WARMING, error=None)
+        start = time.perf_counter()
+        try:
+            for step in steps:
+                step()
+        except Exception as e:
+            traceback.print_exc()
+            self._set(name, state=FAILED, error=str(e))
+            print(f"Warm-up of '{name}' failed: {e}")
+            return
+        seconds = round(time.perf_counter() - start, 3)
+        self._set(name, state=WARM, seconds=seconds)
+        print(f"'{name}' is warm ({seconds}s)")
+
+    def start(self, plan: list[tuple[str, list]]) -> threading.Thread:
+        """Warms processors one after another in a background thread.
+
+        ``plan`` is a list of ``(processor, steps)``; a processor may name
+        others it depends on by listing them earlier in the plan.
+        """
+        for name, _ in plan:
+            self._set(name, state=COLD)
+
+        def run():
+            for name, steps in plan:
+                self.warm(name, steps)
+
+        self._thread = threading.Thread(target=run, name="warmup", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def require(self, *names: str):
+        """A warm-up step that fails unless ``names`` are already warm."""
+
+        def check():
+            cold = [name for name in names if self.state(name) != WARM]
+            if cold:
+                raise RuntimeError(f"depends on {', '.join(cold)}, which are not warm")
+
+        return check
+
+    def report(self) -> dict:
+        with self._lock:
+            processors = {name: dict(state) for name, state in self._states.items()}
+        required = REQUIRED or list(processors)
+        return {
+            "ready": bool(processors)
+            and all(processors.get(name, {}).get("state") == WARM for name in required),
+            "processors": processors,
+        }
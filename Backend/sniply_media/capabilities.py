@@ -0,0 +1,149 @@
+import subprocess
+import threading
+from dataclasses import dataclass, field
+
+FFMPEG = "ffmpeg"
+
+# Encoders that are listed whenever ffmpeg was built with them, GPU or not;
+# they only count as available once a tiny test encode succeeds.
+GPU_ENCODERS = ("h264_nvenc",)
+TEST_ENCODE = ["-f", "lavfi", "-i", "color=size=256x256:duration=0.1", "-frames:v", "1"]
+
+# Model name -> callable returning the model's local path (raising if unavailable).
+# Processors register the models they need; they are located once at detection.
+MODEL_LOCATORS = {}
+
+
+@dataclass
+class Capabilities:
+    """What this host's ffmpeg and model store can do, detected once."""
+
+    ffmpeg_version: str | None = None
+    encoders: set[str] = field(default_factory=set)
+    hwaccels: set[str] = field(default_factory=set)
+    filters: set[str] = field(default_factory=set)
+    gpu_encoders: set[str] = field(default_factory=set)
+    models: dict[str, str | None] = field(default_factory=dict)
+
+    def has_encoder(self, name: str) -> bool:
+        if name in GPU_ENCODERS:
+            return name in self.gpu_encoders
+        return name in self.encoders
+
+    def has_filter(self, name: str) -> bool:
+        return name in self.filters
+
+    def model(self, name: str) -> str | None:
+        # Models registered after detection (by a lazily imported processor)
+        # are located on first use.
+        if name not in self.models and name in MODEL_LOCATORS:
+            with _model_lock:
+                if name not in self.models:
+                    self.models[name] = _locate(name, MODEL_LOCATORS[name])
+        return self.models.get(name)
+
+    @property
+    def cuda(self) -> bool:
+        """True when CUDA decoding and NVENC encoding both work."""
+        return "cuda" in self.hwaccels and "h264_nvenc" in self.gpu_encoders
+
+    def to_dict(self) -> dict:
+        return {
+            "ffmpeg_version": self.ffmpeg_version,
+            "cuda": self.cuda,
+            "hwaccels": sorted(self.hwaccels),
+            "gpu_encoders": sorted(self.gpu_encoders),
+            "encoders": sorted(self.encoders),
+            "filters": sorted(self.filters),
+            "models": {name: path is not None for name, path in self.models.items()},
+        }
+
+
+def _ffmpeg(*args) -> str:
+    proc = subprocess.run([FFMPEG, "-hide_banner", *args], capture_output=True, text=True)
+    return proc.stdout if proc.returncode == 0 else ""
+
+
+def _encoders(output: str) -> set[str]:
+    # " V....D libx264   description", after a "------" separator.
+    _, _, listing = output.partition("------")
+    return {line.split()[1] for line in listing.splitlines() if len(line.split()) > 1}
+
+
+def _filters(output: str) -> set[str]:
+    # " T.C hqdn3d   V->V   description"; the legend lines contain " = ".
+    return {
+        parts[1]
+        for parts in (line.split() for line in output.splitlines() if " = " not in line)
+        if len(parts) > 2 and "->" in parts[2]
+    }
+
+
+def _hwaccels(output: str) -> set[str]:
+    _, _, listing = output.partition(":")
+    return {line.strip() for line in listing.splitlines() if line.strip()}
+
+
+def _test_encode(encoder: str) -> bool:
+    proc = subprocess.run(
+        [FFMPEG, "-v", "error", *TEST_ENCODE, "-c:v", encoder, "-f", "null", "-"],
+        capture_output=True,
+    )
+    return proc.returncode == 0
+
+
+def _locate(name: str, locate) -> str | None:
+    try:
+        return locate()
+    except Exception as e:
+        print(f"Model '{name}' unavailable: {e}")
+        return None
+
+
+def detect_capabilities() -> Capabilities:
+    """Queries ffmpeg for encoders, hwaccels and filters, and locates registered models."""
+    version = _ffmpeg("-version").split("\n", 1)[0]
+    caps = Capabilities(
+        ffmpeg_version=version.split()[2] if len(version.split()) > 2 else None,
+        encoders=_encoders(_ffmpeg("-encoders")),
+        hwaccels=_hwaccels(_ffmpeg("-hwaccels")),
+        filters=_filters(_ffmpeg("-filters")),
+    )
+    caps.gpu_encoders = {
+        name for name in GPU_ENCODERS if name in caps.encoders and _test_encode(name)
+    }
+    for name, locate in list(MODEL_LOCATORS.items()):
+        caps.models[name] = _locate(name, locate)
+    print(
+        f"FFmpeg {caps.ffmpeg_version}: {len(caps.encoders)} encoders, "
+        f"{len(caps.filters)} filters, cuda={'yes' if caps.cuda else 'no'}, "
+        f"models: {', '.join(f'{n}={bool(p)}' for n, p in caps.models.items()) or 'none'}"
+    )
+    return caps
+
+
+_lock = threading.Lock()
+_model_lock = threading.Lock()
+_capabilities = None
+
+
+def register_model(name: str, locate):
+    MODEL_LOCATORS[name] = locate
+
+
+def get_capabilities() -> Capabilities:
+    """Returns the host's capabilities, detecting them on first use."""
+    global _capabilities
+    with _lock:
+        if _capabilities is None:
+            _capabilities = detect_capabilities()
+        return _capabilities
+
+
+def refresh_capabilities() -> Capabilities:
+    """Re-detects capabilities, e.g. after installing a model."""
+    global _capabilities
+    caps = detect_capabilities()
+    with _lock:
+        _capabilities = caps
+    return caps
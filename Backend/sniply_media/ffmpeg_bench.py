@@ -0,0 +1,72 @@
+import re
+import subprocess
+import time
+from collections import deque
+
+from sniply_metrics.metrics import record_stage
+
+# Per-call timings at info level; -nostats keeps the progress line out of stderr.
+BENCH_ARGS = ["-v", "info", "-nostats", "-benchmark_all"]
+# "bench:  1517 user  0 sys  1545 real decode_video" (microseconds per call).
+BENCH_LINE = re.compile(r"bench:\s+(\d+) user\s+(\d+) sys\s+(\d+) real (\w+)")
+TASK_STAGES = {
+    "decode_video": "decode",
+    "decode_audio": "decode",
+    "encode_video": "encode",
+    "encode_audio": "encode",
+}
+# Lines of stderr (other than benchmark lines) printed when a run fails.
+ERROR_TAIL_LINES = 20
+
+
+def parse_benchmark(lines, other_lines: deque | None = None) -> dict[str, float]:
+    """Wall seconds ffmpeg spent decoding and encoding, from ``-benchmark_all`` lines.
+
+    ``lines`` may be a live stderr stream: only the totals are kept, plus
+    the other lines in ``other_lines`` (e.g. a bounded deque).
+    """
+    stages = {"decode": 0.0, "encode": 0.0}
+    for line in lines:
+        match = BENCH_LINE.search(line)
+        if match is None:
+            if other_lines is not None:
+                other_lines.append(line)
+            continue
+        stage = TASK_STAGES.get(match.group(4))
+        if stage:
+            stages[stage] += int(match.group(3)) / 1e6
+    return stages
+
+
+def run_benchmarked(cmd: list[str]) -> tuple[dict[str, float], float]:
+    """Runs ffmpeg with ``BENCH_ARGS`` in ``cmd``, streaming its stderr.
+
+    Returns the decode/encode totals and the run's wall seconds. On failure
+    only the last ``ERROR_TAIL_LINES`` other lines are printed.
+    """
+    tail = deque(maxlen=ERROR_TAIL_LINES)
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    with proc:
+        stages = parse_benchmark(proc.stderr, tail)
+    if proc.returncode != 0:
+        print("".join(tail))
+        raise subprocess.CalledProcessError(proc.returncode, cmd, None, "".join(tail))
+    return stages, time.perf_counter() - start
+
+
+def record_benchmark(
+    stages: dict[str, float],
+    wall_seconds: float,
+    frames: int | None = None,
+    nbytes: int | None = None,
+) -> dict[str, float]:
+    """Records decode, filter and encode stages of one ffmpeg run.
+
+    ffmpeg doesn't time filtering on its own, so ``filter`` is the rest of
+    the run: filter graph, demuxing and muxing.
+    """
+    stages = {**stages, "filter": max(0.0, wall_seconds - stages["decode"] - stages["encode"])}
+    for stage in ("decode", "filter", "encode"):
+        record_stage(stage, stages[stage], frames, nbytes if stage == "encode" else None)
+    return stages
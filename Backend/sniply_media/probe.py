@@ -0,0 +1,190 @@
+import dataclasses
+import json
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from fractions import Fraction
+
+FFPROBE = "ffprobe"
+MEDIA_INFO_CACHE_SIZE = int(os.environ.get("MEDIA_INFO_CACHE_SIZE", 256))
+
+SHOW_ENTRIES = ":".join(
+    [
+        "format=format_name,duration,start_time,size,bit_rate",
+        "stream=index,codec_type,codec_name,time_base,width,height,pix_fmt,"
+        "avg_frame_rate,r_frame_rate,sample_rate,channels,profile,level,has_b_frames",
+        "stream_tags=rotate",
+        "stream_side_data=rotation",
+        "packet=stream_index,pts,flags",
+    ]
+)
+
+
+@dataclass
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: str | None
+    time_base: Fraction | None
+    width: int | None = None
+    height: int | None = None
+    pix_fmt: str | None = None
+    fps: float | None = None
+    rotation: int = 0
+    sample_rate: int | None = None
+    channels: int | None = None
+    profile: str | None = None
+    level: int | None = None  # e.g. 31 for H.264 level 3.1
+    has_b_frames: int | None = None  # frame reordering depth; 0 means no B-frames
+
+
+@dataclass
+class MediaInfo:
+    """What ffprobe knows about a file, parsed once and shared by all processors."""
+
+    path: str
+    format_name: str
+    duration: float
+    start_time: float
+    size: int | None
+    bit_rate: int | None
+    streams: list[StreamInfo]
+    # (pts, is_keyframe) of the first video stream's packets, in decode order.
+    packets: list[tuple[int, bool]] = field(default_factory=list, repr=False)
+
+    @property
+    def video(self) -> StreamInfo | None:
+        return next((s for s in self.streams if s.codec_type == "video"), None)
+
+    @property
+    def audio(self) -> list[StreamInfo]:
+        return [s for s in self.streams if s.codec_type == "audio"]
+
+    @property
+    def has_audio(self) -> bool:
+        return bool(self.audio)
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.packets)
+
+    @property
+    def keyframes(self) -> list[int]:
+        """Keyframe pts of the first video stream, in presentation order."""
+        return sorted(pts for pts, is_key in self.packets if is_key)
+
+    @property
+    def display_size(self) -> tuple[int, int] | None:
+        """(width, height) of decoded frames, honouring rotation metadata."""
+        video = self.video
+        if video is None or not video.width or not video.height:
+            return None
+        if abs(video.rotation) % 180 == 90:  # ffmpeg auto-rotates on decode
+            return video.height, video.width
+        return video.width, video.height
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate(value) -> float | None:
+    try:
+        rate = Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return float(rate) if rate > 0 else None
+
+
+def _stream(raw: dict) -> StreamInfo:
+    rotation = next(
+        (int(d["rotation"]) for d in raw.get("side_data_list", []) if "rotation" in d),
+        _number(raw.get("tags", {}).get("rotate"), int) or 0,
+    )
+    time_base = raw.get("time_base")
+    return StreamInfo(
+        index=int(raw["index"]),
+        codec_type=raw.get("codec_type", ""),
+        codec_name=raw.get("codec_name"),
+        time_base=Fraction(time_base) if time_base and time_base != "0/0" else None,
+        width=_number(raw.get("width"), int),
+        height=_number(raw.get("height"), int),
+        pix_fmt=raw.get("pix_fmt"),
+        fps=_rate(raw.get("avg_frame_rate")) or _rate(raw.get("r_frame_rate")),
+        rotation=rotation,
+        sample_rate=_number(raw.get("sample_rate"), int),
+        channels=_number(raw.get("channels"), int),
+        profile=raw.get("profile"),
+        level=_number(raw.get("level"), int),
+        has_b_frames=_number(raw.get("has_b_frames"), int),
+    )
+
+
+def run_probe(path: str) -> MediaInfo:
+    """Runs ffprobe once over the file, including a packet scan for the keyframe index."""
+    proc = subprocess.run(
+        [FFPROBE, "-v", "error", "-show_entries", SHOW_ENTRIES, "-of", "json", path],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    raw = json.loads(proc.stdout)
+    fmt = raw.get("format", {})
+    streams = [_stream(s) for s in raw.get("streams", [])]
+    video = next((s for s in streams if s.codec_type == "video"), None)
+    packets = []
+    if video is not None:
+        for packet in raw.get("packets", []):
+            if packet.get("stream_index") == video.index and "pts" in packet:
+                packets.append((int(packet["pts"]), "K" in packet.get("flags", "")))
+    return MediaInfo(
+        path=path,
+        format_name=fmt.get("format_name", ""),
+        duration=_number(fmt.get("duration")) or 0.0,
+        start_time=_number(fmt.get("start_time")) or 0.0,
+        size=_number(fmt.get("size"), int),
+        bit_rate=_number(fmt.get("bit_rate"), int),
+        streams=streams,
+        packets=packets,
+    )
+
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # content hash (or file identity) -> MediaInfo, oldest first
+_aliases = {}  # file identity -> cache key
+
+
+def _identity(path: str) -> str:
+    st = os.stat(path)
+    return f"{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def probe_media(path: str, content_hash: str | None = None) -> MediaInfo:
+    """Returns the file's ``MediaInfo``, probing it only on the first request.
+
+    Results are cached by ``content_hash`` when given, so identical uploads
+    share one probe, and by file identity otherwise. Once an upload has been
+    probed with its hash, later lookups by path alone hit the same entry.
+    """
+    identity = _identity(path)
+    with _lock:
+        key = content_hash or _aliases.get(identity, identity)
+        info = _cache.get(key)
+        if info is not None:
+            _cache.move_to_end(key)
+            _aliases[identity] = key
+    if info is None:
+        info = run_probe(path)
+        with _lock:
+            _cache[key] = info
+            _aliases[identity] = key
+            while len(_cache) > MEDIA_INFO_CACHE_SIZE:
+                evicted, _ = _cache.popitem(last=False)
+                for alias in [a for a, k in _aliases.items() if k == evicted]:
+                    del _aliases[alias]
+    return info if info.path == path else dataclasses.replace(info, path=path)
@@ -0,0 +1,343 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from fractions import Fraction
+
+from sniply_jobs.thread_budget import current_threads, thread_args
+from sniply_metrics.metrics import stage
+from sniply_media.probe import probe_media
+
+FFMPEG = "ffmpeg"
+
+# Chunks shorter than this aren't worth a process of their own.
+MIN_SEGMENT_SECONDS = float(os.environ.get("MIN_SEGMENT_SECONDS", 10))
+MAX_SEGMENTS = int(os.environ.get("MAX_SEGMENTS", 16))
+
+
+@dataclass
+class Segment:
+    """A run of video between two keyframes, in stream time-base units."""
+
+    start_pts: int | None  # None: from the start of the stream
+    end_pts: int | None  # None: to the end of the stream
+    start_time: float
+    # Copied segments are stream-copied as-is instead of filtered and encoded.
+    copy: bool = False
+    frames: int | None = None  # packets in a copied segment; None: to the end
+
+
+@dataclass
+class SegmentPlan:
+    segments: list[Segment]
+    time_base: Fraction
+    start_time: float
+    has_audio: bool
+    pix_fmt: str | None = None
+    # Encoder arguments for re-encoded chunks that splice cleanly with copied ones.
+    video_args: list[str] | None = None
+
+
+def free_cores() -> int:
+    """Cores not already busy, judging by the one-minute load average."""
+    cores = os.cpu_count() or 1
+    try:
+        load = os.getloadavg()[0]
+    except (OSError, AttributeError):
+        load = 0.0
+    return max(1, cores - int(load))
+
+
+def segment_count(duration: float, cores: int | None = None) -> int:
+    """Number of chunks for a clip: one per core of the job's thread share, each at least
+    ``MIN_SEGMENT_SECONDS``."""
+    cores = current_threads(free_cores()) if cores is None else cores
+    return max(1, min(cores, MAX_SEGMENTS, int(duration // MIN_SEGMENT_SECONDS)))
+
+
+def plan_segments(input_path: str, count: int | None = None) -> SegmentPlan | None:
+    """Splits a video into about ``count`` chunks at keyframes.
+
+    ``count`` defaults to ``segment_count`` for the clip's duration. Returns
+    None when the clip is too short or has too few keyframes to split.
+    """
+    info = probe_media(input_path)
+    video = info.video
+    duration = info.duration
+    count = segment_count(duration) if count is None else count
+    if video is None or video.time_base is None or count < 2:
+        return None
+
+    time_base = video.time_base
+    start_time = info.start_time
+    keyframes = info.keyframes
+    if not keyframes:
+        return None
+
+    # The first keyframe at or after each evenly spaced target time.
+    bounds = []
+    for k in range(1, count):
+        target = (start_time + duration * k / count) / time_base
+        later = [pts for pts in keyframes if pts >= target and pts > keyframes[0]]
+        if later and (not bounds or later[0] > bounds[-1]):
+            bounds.append(later[0])
+    if not bounds:
+        return None
+
+    starts = [None] + bounds
+    ends = bounds + [None]
+    segments = [
+        Segment(s, e, float((s if s is not None else keyframes[0]) * time_base))
+        for s, e in zip(starts, ends)
+    ]
+    return SegmentPlan(segments, time_base, start_time, info.has_audio, video.pix_fmt)
+
+
+# Sources whose GOPs can be spliced with libx264-encoded ones.
+SPLICE_CODECS = {"h264"}
+SPLICE_PIX_FMTS = {"yuv420p", "yuvj420p"}
+# ffprobe profile name -> libx264 profile.
+SPLICE_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+}
+# Reordering depth of the source -> libx264 B-frame settings with the same depth.
+# A mismatch makes decode timestamps step backwards at the splices.
+SPLICE_B_FRAMES = {
+    0: ["-bf", "0"],
+    1: ["-x264-params", "b-pyramid=none"],
+    2: ["-x264-params", "b-pyramid=normal"],
+}
+# Containers whose video timescale is set to the source's when chunks are joined.
+TIMESCALE_EXTENSIONS = {".mp4", ".m4v", ".mov"}
+
+
+def splice_video_args(video) -> list[str] | None:
+    """libx264 arguments matching the source's profile, level and B-frame depth.
+
+    Returns None when the stream can't be matched, so the caller re-encodes
+    the whole clip instead of splicing.
+    """
+    profile = SPLICE_PROFILES.get(video.profile)
+    b_frames = SPLICE_B_FRAMES.get(video.has_b_frames)
+    if profile is None or b_frames is None or (profile == "baseline" and video.has_b_frames):
+        return None
+    args = ["-c:v", "libx264", "-pix_fmt", video.pix_fmt, "-profile:v", profile]
+    if video.level and video.level >= 10:
+        args += ["-level:v", f"{video.level // 10}.{video.level % 10}"]
+    return args + b_frames
+
+
+def plan_windows(input_path: str, windows: list[tuple[float, float | None]]) -> SegmentPlan | None:
+    """Plans a smart render that re-encodes only the GOPs overlapping ``windows``.
+
+    ``windows`` are ``(start, end)`` seconds from the start of the clip, with
+    ``end=None`` meaning the end of the clip. Every other GOP is copied.
+    Re-encoded GOPs use the source's profile, level and B-frame depth (see
+    ``splice_video_args``). Returns None when the source can't be spliced
+    (not 8-bit 4:2:0 H.264, or stream parameters libx264 can't match) or
+    when the windows cover the whole clip. Assumes closed GOPs.
+    """
+    info = probe_media(input_path)
+    video = info.video
+    if (
+        video is None
+        or video.time_base is None
+        or video.codec_name not in SPLICE_CODECS
+        or video.pix_fmt not in SPLICE_PIX_FMTS
+    ):
+        return None
+    video_args = splice_video_args(video)
+    if video_args is None:
+        print(
+            f"Can't match {video.profile} (level {video.level}, B-frame depth "
+            f"{video.has_b_frames}) for splicing; re-encoding the whole clip"
+        )
+        return None
+    time_base = video.time_base
+    start_time = info.start_time
+    keyframes = info.keyframes
+    if not keyframes:
+        return None
+    order = {pts: i for i, (pts, _) in enumerate(info.packets)}
+
+    # Keyframe-aligned [start, end) pts ranges covering each window, merged.
+    ranges = []
+    for window_start, window_end in sorted(windows, key=lambda w: w[0]):
+        first = (start_time + window_start) / time_base
+        last = None if window_end is None else (start_time + window_end) / time_base
+        a = max([k for k in keyframes if k <= first], default=keyframes[0])
+        b = None if last is None else next((k for k in keyframes if k > last), None)
+        if ranges and (ranges[-1][1] is None or a <= ranges[-1][1]):
+            prev_end = ranges[-1][1]
+            ranges[-1] = (ranges[-1][0], None if b is None or prev_end is None else max(b, prev_end))
+        else:
+            ranges.append((a, b))
+
+    def segment(start, end, copy):
+        frames = None
+        if copy and end is not None:
+            frames = order[end] - order[start]
+        return Segment(
+            None if start == keyframes[0] else start,
+            end,
+            float(start * time_base),
+            copy=copy,
+            frames=frames,
+        )
+
+    segments = []
+    cursor = keyframes[0]
+    for a, b in ranges:
+        if a > cursor:
+            segments.append(segment(cursor, a, copy=True))
+        segments.append(segment(a, b, copy=False))
+        cursor = b
+        if cursor is None:
+            break
+    if cursor is not None:
+        segments.append(segment(cursor, None, copy=True))
+    if not any(seg.copy for seg in segments):
+        return None
+
+    return SegmentPlan(
+        segments, time_base, start_time, info.has_audio, video.pix_fmt, video_args
+    )
+
+
+def _run(cmd: list[str]):
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print("FFmpeg error:")
+        print(proc.stderr)
+        raise subprocess.CalledProcessError(proc.returncode, cmd, proc.stdout, proc.stderr)
+
+
+def _copy_command(input_path, plan, segment, chunk_path):
+    seek = []
+    if segment.start_pts is not None:
+        # Input seeking in copy mode starts at the keyframe at or before the target.
+        seek = ["-ss", f"{segment.start_time - plan.start_time + 0.001:.6f}"]
+    frames = ["-frames:v", str(segment.frames)] if segment.frames is not None else []
+    return (
+        [FFMPEG, "-v", "error", *seek, "-i", input_path, "-map", "0:v:0", "-c", "copy"]
+        + frames
+        + ["-y", chunk_path]
+    )
+
+
+def _chunk_command(input_path, plan, segment, video_filter, video_args, threads, chunk_path):
+    trim = []
+    if segment.start_pts is not None:
+        trim.append(f"start_pts={segment.start_pts}")
+    if segment.end_pts is not None:
+        trim.append(f"end_pts={segment.end_pts}")
+    # Timestamps are kept (-copyts) so time-based filter expressions see the
+    # same t as a single-process run; the chunk is rebased to 0 at the end.
+    filters = [f"trim={':'.join(trim)}"] if trim else []
+    filters.append(f"setpts=PTS-{plan.start_time:.6f}/TB")
+    if video_filter:
+        filters.append(video_filter)
+    filters.append("setpts=PTS-STARTPTS")
+
+    seek = []
+    if segment.start_pts is not None:
+        # Seek lands on the chunk's own keyframe; trim makes the cut exact.
+        seek = ["-noaccurate_seek", "-ss", f"{segment.start_time - plan.start_time + 0.001:.6f}"]
+    return (
+        [FFMPEG, "-v", "error", *seek, "-copyts", "-i", input_path]
+        + ["-map", "0:v:0", "-vf", ",".join(filters)]
+        + list(video_args)
+        + thread_args(threads)
+        + ["-y", chunk_path]
+    )
+
+
+def run_segmented(
+    input_path: str,
+    output_path: str,
+    plan: SegmentPlan,
+    video_filter: str,
+    video_args: list[str],
+    audio_filter: str | None = None,
+    audio_args: list[str] = ("-c:a", "aac"),
+    output_args: list[str] = ("-movflags", "+faststart"),
+    work_dir: str | None = None,
+) -> str:
+    """Runs a video filter chain on each chunk in parallel and joins the results.
+
+    Video chunks are encoded by separate ffmpeg processes (or stream-copied,
+    for copy segments) and joined losslessly with the concat demuxer, whose
+    automatic ``h264_mp4toannexb`` conversion carries each chunk's parameter
+    sets in-band. Audio is never split: it is filtered as one continuous
+    stream alongside the chunks and muxed in at the end. Chunks are kept in
+    ``work_dir`` (default: next to the output).
+    """
+    work_dir = tempfile.mkdtemp(
+        prefix="segments_", dir=work_dir or os.path.dirname(os.path.abspath(output_path))
+    )
+    encoded = [segment for segment in plan.segments if not segment.copy]
+    share = current_threads(free_cores())
+    threads = max(1, share // max(len(encoded), 1))
+    try:
+        commands = []
+        chunk_paths = []
+        for i, segment in enumerate(plan.segments):
+            chunk_path = os.path.join(work_dir, f"chunk_{i:03d}.mkv")
+            chunk_paths.append(chunk_path)
+            if segment.copy:
+                commands.append(_copy_command(input_path, plan, segment, chunk_path))
+                continue
+            commands.append(
+                _chunk_command(
+                    input_path, plan, segment, video_filter, video_args, threads, chunk_path
+                )
+            )
+
+        copy_audio = audio_filter is None and list(audio_args) == ["-c:a", "copy"]
+        audio_path = os.path.join(work_dir, "audio.mka")
+        if plan.has_audio and not copy_audio:
+            # First: it spans the whole clip, while the queued chunks are short.
+            commands.insert(
+                0,
+                [FFMPEG, "-v", "error", "-i", input_path, "-map", "0:a", "-vn"]
+                + (["-af", audio_filter] if audio_filter else [])
+                + list(audio_args)
+                + ["-y", audio_path],
+            )
+
+        # At most the job's share of threads at once; the other chunks queue.
+        workers = min(len(commands), max(1, share // threads))
+        print(
+            f"Processing {len(plan.segments)} segments, {workers} at a time "
+            f"({len(encoded)} encoded, {threads} threads each)..."
+        )
+        with stage("encode", frames=probe_media(input_path).frame_count):
+            with ThreadPoolExecutor(workers) as executor:
+                for future in [executor.submit(_run, cmd) for cmd in commands]:
+                    future.result()
+
+        list_path = os.path.join(work_dir, "chunks.txt")
+        with open(list_path, "w") as f:
+            for chunk_path in chunk_paths:
+                f.write(f"file '{chunk_path}'\n")
+
+        join = [FFMPEG, "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+        if plan.has_audio:
+            join += ["-i", input_path if copy_audio else audio_path, "-map", "0:v", "-map", "1:a"]
+        if (
+            os.path.splitext(output_path)[1].lower() in TIMESCALE_EXTENSIONS
+            and plan.time_base.numerator == 1
+        ):
+            # The chunks are in Matroska's millisecond time base; restore the source's.
+            join += ["-video_track_timescale", str(plan.time_base.denominator)]
+        with stage("mux") as run:
+            _run(join + ["-c", "copy"] + list(output_args) + ["-y", output_path])
+            run.nbytes = os.path.getsize(output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return output_path
@@ -0,0 +1,250 @@
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a quick text overlay to a long background removal.
+TIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Frames/s and MB/s.
+RATE_BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines += self._samples(key, value)
+        return lines
+
+    def _samples(self, key, value) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_format(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, key, value) -> list[str]:
+        counts, total = value
+        lines = []
+        for bound, count in zip(self.buckets, counts):
+            le = 'le="' + _format(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_format(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """Metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def on_collect(self, func):
+        """Registers ``func()`` to refresh gauges right before each scrape."""
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Metrics collector {collect.__name__} failed: {e}")
+        return "\n".join(line for m in self._metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram("sniply_stage_seconds", "Time spent per processing stage.", ("processor", "stage"))
+)
+STAGE_FRAMES = REGISTRY.register(
+    Counter("sniply_stage_frames_total", "Frames handled per stage.", ("processor", "stage"))
+)
+STAGE_BYTES = REGISTRY.register(
+    Counter("sniply_stage_bytes_total", "Bytes handled per stage.", ("processor", "stage"))
+)
+STAGE_FPS = REGISTRY.register(
+    Histogram(
+        "sniply_stage_frames_per_second",
+        "Per-run frame throughput of a stage.",
+        ("processor", "stage"),
+        RATE_BUCKETS,
+    )
+)
+STAGE_MBPS = REGISTRY.register(
+    Histogram(
+        "sniply_stage_megabytes_per_second",
+        "Per-run byte throughput of a stage.",
+        ("processor", "stage"),
+        RATE_BUCKETS,
+    )
+)
+JOB_SECONDS = REGISTRY.register(
+    Histogram("sniply_job_seconds", "Run time of processor jobs.", ("processor",))
+)
+JOB_QUEUE_SECONDS = REGISTRY.register(
+    Histogram("sniply_job_queue_seconds", "Time jobs waited before running.", ("processor",))
+)
+JOBS = REGISTRY.register(
+    Counter("sniply_jobs_total", "Finished processor jobs.", ("processor", "status"))
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge("sniply_queue_depth", "Jobs admitted and waiting to run.", ("processor",))
+)
+ACTIVE_JOBS = REGISTRY.register(
+    Gauge("sniply_active_jobs", "Jobs currently running.", ("processor",))
+)
+WORKER_UTILIZATION = REGISTRY.register(
+    Gauge("sniply_worker_utilization", "Busy fraction of inference pool workers.", ("worker",))
+)
+THREADS_LEASED = REGISTRY.register(
+    Gauge("sniply_threads_leased", "CPU threads leased to running jobs.", ("processor",))
+)
+
+_processor = contextvars.ContextVar("metrics_processor", default="none")
+# (stage, seconds) of the stages recorded inside ``collect_stages``, if any.
+_collected = contextvars.ContextVar("metrics_collected", default=None)
+
+
+def record_stage(
+    stage: str,
+    seconds: float | None,
+    frames: int | None = None,
+    nbytes: int | None = None,
+    processor: str | None = None,
+):
+    """Records one run of a stage; throughput is derived when a duration is given."""
+    labels = {"processor": processor or _processor.get(), "stage": stage}
+    if seconds is not None:
+        STAGE_SECONDS.observe(seconds, **labels)
+        collected = _collected.get()
+        if collected is not None:
+            collected.append((stage, seconds))
+    if frames:
+        STAGE_FRAMES.inc(frames, **labels)
+        if seconds:
+            STAGE_FPS.observe(frames / seconds, **labels)
+    if nbytes:
+        STAGE_BYTES.inc(nbytes, **labels)
+        if seconds:
+            STAGE_MBPS.observe(nbytes / 1e6 / seconds, **labels)
+
+
+class StageRun:
+    """Counts set inside a ``stage`` block (e.g. once the frame total is known)."""
+
+    def __init__(self, frames=None, nbytes=None):
+        self.frames = frames
+        self.nbytes = nbytes
+
+
+@contextmanager
+def stage(name: str, frames: int | None = None, nbytes: int | None = None):
+    """Times a stage of the current job. Failed runs are not recorded."""
+    run = StageRun(frames, nbytes)
+    start = time.perf_counter()
+    yield run
+    record_stage(name, time.perf_counter() - start, run.frames, run.nbytes)
+
+
+@contextmanager
+def collect_stages():
+    """Also lists the ``(stage, seconds)`` recorded inside, e.g. for a Server-Timing header.
+
+    Only stages recorded in the calling thread are seen.
+    """
+    collected = []
+    token = _collected.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected.reset(token)
+
+
+@contextmanager
+def track_job(processor: str, queue_seconds: float | None = None):
+    """Labels stages recorded inside with ``processor`` and records the job's outcome."""
+    if queue_seconds is not None:
+        JOB_QUEUE_SECONDS.observe(queue_seconds, processor=processor)
+    token = _processor.set(processor)
+    start = time.perf_counter()
+    status = "failed"
+    try:
+        yield
+        status = "done"
+    finally:
+        _processor.reset(token)
+        JOB_SECONDS.observe(time.perf_counter() - start, processor=processor)
+        JOBS.inc(processor=processor, status=status)
@@ -0,0 +1,284 @@
+"""Local, content-addressed store of model files.
+
+Models live under ``MODEL_STORE_DIR`` as ``objects/<sha256>/<file>`` and are
+listed in ``manifest.json`` with their checksum, size and version. Lookups
+only ever read local disk; seed the store ahead of time with::
+
+    python -m sniply_models.model_store add u2net ~/.u2net/u2net.onnx --version rembg-2.0
+    python -m sniply_models.model_store add rnnoise rnnoise-models-master.zip \\
+        --member rnnoise-models-master/cleanvoice/cleanvoice.rnnn --version cleanvoice
+    python -m sniply_models.model_store list
+    python -m sniply_models.model_store verify
+
+With ``MODEL_DOWNLOADS=1``, a missing model is fetched once by the fetcher
+its processor registered and added to the store.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import asdict, dataclass, field
+
+STORE_DIR = os.environ.get(
+    "MODEL_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"),
+)
+MANIFEST_NAME = "manifest.json"
+ALLOW_DOWNLOADS = os.environ.get("MODEL_DOWNLOADS", "0") == "1"
+HASH_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Model name -> callable(tmp_dir) returning (local_path, version) of a fresh copy.
+FETCHERS = {}
+
+
+class ModelStoreError(Exception):
+    pass
+
+
+@dataclass
+class ModelEntry:
+    name: str
+    sha256: str
+    size: int
+    version: str
+    file: str  # file name inside the object directory, e.g. "u2net.onnx"
+    added_at: float
+    # Free-form records about the model, e.g. how a derived variant was made
+    # and validated.
+    metadata: dict = field(default_factory=dict)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """Models by name, verified against the manifest once per process."""
+
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._verified = set()
+        self._entries = self._load()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                raw = json.load(f).get("models", {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            raise ModelStoreError(f"Unreadable model manifest {self.manifest_path}: {e}")
+        return {name: ModelEntry(name=name, **fields) for name, fields in raw.items()}
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        models = {
+            name: {k: v for k, v in asdict(entry).items() if k != "name"}
+            for name, entry in sorted(self._entries.items())
+        }
+        # Written to a temporary file first, so readers never see half a manifest.
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"models": models}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def object_path(self, entry: ModelEntry) -> str:
+        return os.path.join(self.root, "objects", entry.sha256, entry.file)
+
+    def entries(self) -> list[ModelEntry]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def entry(self, name: str) -> ModelEntry | None:
+        with self._lock:
+            if name not in self._entries:
+                # Another process (e.g. the CLI or the server) may have added it.
+                self._entries = self._load()
+            return self._entries.get(name)
+
+    def update_metadata(self, name: str, **fields) -> ModelEntry:
+        with self._lock:
+            self._entries = self._load()
+            entry = self._entries[name]
+            entry.metadata.update(fields)
+            self._save()
+            return entry
+
+    def add(
+        self,
+        name: str,
+        source: str,
+        version: str = "unversioned",
+        member=None,
+        metadata: dict | None = None,
+    ):
+        """Copies a model into the store (``member`` picks a file out of a ZIP)."""
+        with tempfile.TemporaryDirectory(dir=self._tmp_root()) as tmp:
+            if member:
+                with zipfile.ZipFile(source) as archive:
+                    source = archive.extract(member, tmp)
+            sha256 = file_sha256(source)
+            entry = ModelEntry(
+                name=name,
+                sha256=sha256,
+                size=os.path.getsize(source),
+                version=version,
+                file=os.path.basename(source),
+                added_at=round(time.time(), 3),
+                metadata=metadata or {},
+            )
+            target = self.object_path(entry)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                staged = os.path.join(tmp, "object")
+                shutil.copyfile(source, staged)
+                os.replace(staged, target)
+        with self._lock:
+            self._entries[name] = entry
+            self._verified.add(name)
+            self._save()
+        print(f"Stored model '{name}' ({entry.size} bytes, sha256 {sha256[:12]}...)")
+        return entry
+
+    def _tmp_root(self) -> str:
+        # Same filesystem as the objects, so finished copies are moved into place.
+        path = os.path.join(self.root, "tmp")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def verify(self, name: str | None = None) -> dict:
+        """Re-hashes one or all models; returns ``{name: error or None}``."""
+        names = [name] if name else [entry.name for entry in self.entries()]
+        return {n: self._check(n) for n in names}
+
+    def _check(self, name: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            return "not in the store"
+        path = self.object_path(entry)
+        if not os.path.exists(path):
+            return f"missing file {path}"
+        if os.path.getsize(path) != entry.size:
+            return "size differs from the manifest"
+        if file_sha256(path) != entry.sha256:
+            return "checksum differs from the manifest"
+        with self._lock:
+            self._verified.add(name)
+        return None
+
+    def path(self, name: str, verify: bool = True) -> str:
+        """Local path of model ``name``, verified on first lookup in this process.
+
+        ``verify=False`` only checks the size and never fetches, for processes
+        (e.g. inference workers) whose parent already resolved the model.
+        """
+        entry = self.entry(name)
+        if entry is None and not verify:
+            raise ModelStoreError(f"Model '{name}' is not in the store at {self.root}.")
+        if entry is None:
+            entry = self._fetch(name)
+        if verify and name not in self._verified:
+            error = self._check(name)
+            if error:
+                raise ModelStoreError(f"Model '{name}' failed verification: {error}.")
+        elif not verify:
+            path = self.object_path(entry)
+            if not os.path.exists(path) or os.path.getsize(path) != entry.size:
+                raise ModelStoreError(f"Model '{name}' is missing or truncated at {path}.")
+        return self.object_path(entry)
+
+    def _fetch(self, name: str) -> ModelEntry:
+        fetch = FETCHERS.get(name)
+        if not ALLOW_DOWNLOADS or fetch is None:
+            raise ModelStoreError(
+                f"Model '{name}' is not in the store at {self.root}. Seed it with "
+                f"'python -m sniply_models.model_store add {name} <file>'"
+                + (" or set MODEL_DOWNLOADS=1." if fetch is not None else ".")
+            )
+        print(f"Fetching model '{name}' into the store...")
+        with tempfile.TemporaryDirectory(dir=self._tmp_root()) as tmp:
+            source, version = fetch(tmp)
+            return self.add(name, source, version)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "root": self.root,
+                "downloads": ALLOW_DOWNLOADS,
+                "models": {
+                    name: {
+                        "version": entry.version,
+                        "size": entry.size,
+                        "sha256": entry.sha256,
+                        "verified": name in self._verified,
+                        "metadata": entry.metadata,
+                    }
+                    for name, entry in self._entries.items()
+                },
+            }
+
+
+def register_fetcher(name: str, fetch):
+    """Registers ``fetch(tmp_dir) -> (local_path, version)`` for downloads-enabled hosts."""
+    FETCHERS[name] = fetch
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ModelStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ModelStore()
+        return _store
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the local model store.")
+    parser.add_argument("--root", default=STORE_DIR, help="Store directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Copy a local model file into the store.")
+    add.add_argument("name", help="Model name, e.g. u2net, u2netp or rnnoise.")
+    add.add_argument("source", help="Model file, or a ZIP archive with --member.")
+    add.add_argument("--version", default="unversioned")
+    add.add_argument("--member", help="Path of the model inside a ZIP source.")
+    commands.add_parser("list", help="Show the manifest.")
+    commands.add_parser("verify", help="Re-hash every model against the manifest.")
+    args = parser.parse_args(argv)
+
+    store = ModelStore(args.root)
+    if args.command == "add":
+        store.add(args.name, args.source, args.version, args.member)
+    elif args.command == "list":
+        for entry in store.entries():
+            print(f"{entry.name}\t{entry.version}\t{entry.size}\t{entry.sha256}")
+    else:
+        errors = {name: error for name, error in store.verify().items() if error}
+        for name, error in errors.items():
+            print(f"{name}: {error}", file=sys.stderr)
+        print(f"{len(store.entries()) - len(errors)} ok, {len(errors)} failed")
+        return 1 if errors else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,27 @@
+import functools
 import os
+import platform
+import shutil
 import subprocess
 import sys
 import time
 import urllib.request
 import zipfile
 
+from sniply_jobs.thread_budget import thread_args
+from sniply_media.capabilities import get_capabilities, register_model
+from sniply_media.probe import probe_media
+from sniply_media.segments import plan_segments, run_segmented
+from sniply_metrics.metrics import stage
+from sniply_models.model_store import get_store, register_fetcher
+
+VIDEO_FILTER = "hqdn3d=4.0:3.0:6.0:4.5"
+AFFTDN_FILTER = "afftdn=nf=-25"
+GPU_VIDEO_ARGS = ["-c:v", "h264_nvenc", "-preset", "p4", "-b:v", "4M"]
+CPU_VIDEO_ARGS = ["-c:v", "libx264", "-preset", "fast", "-crf", "20"]
+
+
+@functools.lru_cache(maxsize=None)
 def get_ffmpeg_path():
     ffmpeg_path = shutil.which("ffmpeg")
     if ffmpeg_path:
@@ -14,35 +31,28 @@ def get_ffmpeg_path():
 
     raise FileNotFoundError("FFmpeg not found. Please install ffmpeg or add to PATH.")
 
-FFMPEG_PATH = get_ffmpeg_path()
 
+RNNOISE_MODEL = "rnnoise"
+RNNOISE_ZIP_URL = "https://github.com/GregorR/rnnoise-models/archive/refs/heads/master.zip"
+RNNOISE_ZIP_MEMBER = "rnnoise-models-master/cleanvoice/cleanvoice.rnnn"
 
-def ensure_rnnoise_model():
-    model_dir = os.path.join(os.getcwd(), "rnnoise_models")
-    os.makedirs(model_dir, exist_ok=True)
-
-    relative_model_file = "rnnoise-models-master/cleanvoice/cleanvoice.rnnn"
-    model_path = os.path.join(model_dir, relative_model_file)
-
-    if os.path.exists(model_path):
-        return model_path
 
+def download_rnnoise_model(tmp_dir):
+    """Fetches the cleanvoice model (only with ``MODEL_DOWNLOADS=1``)."""
     print("⬇Downloading RNNoise models...")
-    repo_zip_url = (
-        "https://github.com/GregorR/rnnoise-models/archive/refs/heads/master.zip"
-    )
-    zip_path = os.path.join(model_dir, "rnnoise_models_master.zip")
-    urllib.request.urlretrieve(repo_zip_url, zip_path)
-
+    zip_path = os.path.join(tmp_dir, "rnnoise_models_master.zip")
+    urllib.request.urlretrieve(RNNOISE_ZIP_URL, zip_path)
     with zipfile.ZipFile(zip_path, "r") as z:
-        z.extractall(model_dir)
-    os.remove(zip_path)
+        return z.extract(RNNOISE_ZIP_MEMBER, tmp_dir), "cleanvoice-master"
 
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model file not found: {model_path}")
 
-    print("Model ready:", model_path)
-    return model_path
+def ensure_rnnoise_model():
+    return get_store().path(RNNOISE_MODEL)
+
+
+register_fetcher(RNNOISE_MODEL, download_rnnoise_model)
+# Located once by the capability registry instead of on every request.
+register_model(RNNOISE_MODEL, ensure_rnnoise_model)
 
 
 def run_ffmpeg(cmd):
@@ -58,29 +68,110 @@ def run_ffmpeg(cmd):
 
 
 def has_audio_stream(input_path):
-    cmd = [
-        FFMPEG_PATH,
-        "-v",
-        "error",
-        "-select_streams",
-        "a",
-        "-show_entries",
-        "stream=index",
-        "-of",
-        "csv=p=0",
-        "-i",
-        input_path,
-    ]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    return bool(proc.stdout.strip())
+    return probe_media(input_path).has_audio
+
+
+def rnnoise_filter():
+    """Returns the arnndn filter for the RNNoise model, or None if this host can't run it."""
+    caps = get_capabilities()
+    model_path = caps.model("rnnoise")
+    if model_path is None or not caps.has_filter("arnndn"):
+        return None
+    model_rel = os.path.relpath(model_path, os.getcwd()).replace("\\", "/")
+    print("Using model:", model_rel)
+    return f"arnndn=m='{model_rel}'"
+
+
+def denoise_filters(has_audio=True):
+    """Returns the (video, audio) filters of the denoise step, for fusing into other graphs."""
+    if not has_audio:
+        return VIDEO_FILTER, None
+    return VIDEO_FILTER, rnnoise_filter() or AFFTDN_FILTER
+
+
+def fast_denoise(input_video, output_path=None, one_pass=True, parallel=True):
+    """Denoises video and audio into ``output_path``.
 
+    ``output_path`` defaults to ``output_final.mp4`` next to the input.
+    One-pass mode decodes the input once and runs both filters in the same
+    ffmpeg process; ``one_pass=False`` keeps the separate audio, video and
+    mux passes. With ``parallel``, long clips are denoised on CPU as
+    keyframe-aligned segments in parallel processes.
+    """
+    if output_path is None:
+        base_dir = os.path.dirname(os.path.abspath(input_video))
+        output_path = os.path.join(base_dir, "output_final.mp4")
+    if one_pass:
+        return one_pass_denoise(input_video, output_path, parallel)
+    return multi_pass_denoise(input_video, output_path)
 
-def fast_denoise(input_video):
+
+def one_pass_denoise(input_video, output_path, parallel=True):
+    start = time.time()
+    timings = {}
+
+    t = time.time()
+    has_audio = has_audio_stream(input_video)
+    plan = plan_segments(input_video) if parallel else None
+    timings["probe+plan"] = time.time() - t
+
+    # The capability registry picks the path up front; CPU stays as a
+    # fallback only for runtime GPU failures on hosts that have one.
+    _, audio_filter = denoise_filters(has_audio)
+    attempts = [("cpu", CPU_VIDEO_ARGS, audio_filter)]
+    if get_capabilities().cuda:
+        attempts.insert(0, ("gpu", GPU_VIDEO_ARGS, audio_filter))
+
+    for device, video_args, audio_filter in attempts:
+        segmented = device == "cpu" and plan is not None
+        label = f"{device} + {audio_filter.split('=')[0] if audio_filter else 'no audio'}"
+        if segmented:
+            label += f" x{len(plan.segments)} segments"
+        hwaccel = ["-hwaccel", "cuda"] if device == "gpu" else []
+        print(f"Denoising video and audio in one pass ({label})...")
+        t = time.time()
+        try:
+            if segmented:
+                run_segmented(
+                    input_video,
+                    output_path,
+                    plan,
+                    VIDEO_FILTER,
+                    video_args,
+                    audio_filter=audio_filter,
+                )
+            else:
+                audio_args = ["-af", audio_filter, "-c:a", "aac"] if audio_filter else ["-an"]
+                with stage("encode", frames=probe_media(input_video).frame_count) as run:
+                    run_ffmpeg(
+                        [get_ffmpeg_path(), *hwaccel, "-i", input_video]
+                        + ["-map", "0:v:0", "-map", "0:a?"]
+                        + ["-vf", VIDEO_FILTER]
+                        + video_args
+                        + audio_args
+                        + thread_args()
+                        + ["-movflags", "+faststart", "-y", output_path]
+                    )
+                    run.nbytes = os.path.getsize(output_path)
+            timings[f"denoise+encode ({label})"] = time.time() - t
+            break
+        except subprocess.CalledProcessError:
+            timings[f"failed attempt ({label})"] = time.time() - t
+            print(f"One-pass denoise failed with {label}; trying next option...")
+    else:
+        raise RuntimeError("All one-pass denoise attempts failed.")
+
+    timings["total"] = time.time() - start
+    print("Stage timings: " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    print(f"All done! Output: {output_path}")
+    return output_path
+
+
+def multi_pass_denoise(input_video, output_final):
     start = time.time()
     base_dir = os.path.dirname(os.path.abspath(input_video))
     temp_audio = os.path.join(base_dir, "temp_clean_audio.wav")
     temp_video = os.path.join(base_dir, "temp_clean_video.mp4")
-    output_final = os.path.join(base_dir, "output_final.mp4")
 
     # ---------------- Step 1: Check audio presence ----------------
     if not has_audio_stream(input_video):
@@ -91,73 +182,57 @@ def fast_denoise(input_video):
 
     # ---------------- Step 2: Audio Denoising ----------------
     if audio_present:
-        model_path = ensure_rnnoise_model()
-        model_rel = os.path.relpath(model_path, os.getcwd()).replace("\\", "/")
-        print("Using model:", model_rel)
-        arnndn_filter = f"arnndn=m='{model_rel}'"
+        audio_filter = rnnoise_filter() or AFFTDN_FILTER
+        run_ffmpeg(
+            [
+                get_ffmpeg_path(),
+                "-i",
+                input_video,
+                "-af",
+                audio_filter,
+                "-vn",
+                "-y",
+                temp_audio,
+            ]
+        )
+        print(f"Audio denoising applied ({audio_filter.split('=')[0]}).")
+    else:
+        temp_audio = None
 
+    # ---------------- Step 3: Video Denoising ----------------
+    print("🎥 Reducing video noise (HQDN3D)...")
+    video_filter = VIDEO_FILTER
+
+    use_gpu = get_capabilities().cuda
+    if use_gpu:
         try:
             run_ffmpeg(
                 [
-                    FFMPEG_PATH,
+                    get_ffmpeg_path(),
+                    "-hwaccel",
+                    "cuda",
                     "-i",
                     input_video,
-                    "-af",
-                    arnndn_filter,
-                    "-vn",
+                    "-vf",
+                    video_filter,
+                    "-c:v",
+                    "h264_nvenc",
+                    "-preset",
+                    "p4",
+                    "-b:v",
+                    "4M",
                     "-y",
-                    temp_audio,
+                    temp_video,
                 ]
             )
-            print("RNNoise denoising applied.")
+            print("GPU video denoise successful.")
         except Exception:
-            print("RNNoise unavailable, using afftdn fallback.")
-            run_ffmpeg(
-                [
-                    FFMPEG_PATH,
-                    "-i",
-                    input_video,
-                    "-af",
-                    "afftdn=nf=-25",
-                    "-vn",
-                    "-y",
-                    temp_audio,
-                ]
-            )
-            print("afftdn denoising completed.")
-    else:
-        temp_audio = None
-
-    # ---------------- Step 3: Video Denoising ----------------
-    print("🎥 Reducing video noise (HQDN3D)...")
-    video_filter = "hqdn3d=4.0:3.0:6.0:4.5"
-
-    try:
-        run_ffmpeg(
-            [
-                FFMPEG_PATH,
-                "-hwaccel",
-                "cuda",
-                "-i",
-                input_video,
-                "-vf",
-                video_filter,
-                "-c:v",
-                "h264_nvenc",
-                "-preset",
-                "p4",
-                "-b:v",
-                "4M",
-                "-y",
-                temp_video,
-            ]
-        )
-        print("GPU video denoise successful.")
-    except Exception:
-        print("GPU path failed; falling back to CPU...")
+            print("GPU path failed; falling back to CPU...")
+            use_gpu = False
+    if not use_gpu:
         run_ffmpeg(
             [
-                FFMPEG_PATH,
+                get_ffmpeg_path(),
                 "-i",
                 input_video,
                 "-vf",
@@ -179,7 +254,7 @@ def fast_denoise(input_video):
     if temp_audio and os.path.exists(temp_audio):
         run_ffmpeg(
             [
-                FFMPEG_PATH,
+                get_ffmpeg_path(),
                 "-i",
                 temp_video,
                 "-i",
@@ -195,7 +270,7 @@ def fast_denoise(input_video):
         )
     else:
         run_ffmpeg(
-            [FFMPEG_PATH, "-i", temp_video, "-c:v", "copy", "-an", "-y", output_final]
+            [get_ffmpeg_path(), "-i", temp_video, "-c:v", "copy", "-an", "-y", output_final]
         )
 
     # ---------------- Cleanup ----------------
@@ -0,0 +1,165 @@
+import os
+import tempfile
+import time
+
+from sniply_jobs.thread_budget import thread_args
+from sniply_media.ffmpeg_bench import BENCH_ARGS, record_benchmark, run_benchmarked
+from sniply_media.probe import probe_media
+from sniply_media.segments import plan_segments, run_segmented
+from sniply_metrics.metrics import collect_stages
+from sniply_noise_reduction.denoise_video import CPU_VIDEO_ARGS, denoise_filters
+from sniply_text_apply.apply_text import (
+    CAPTION_FIELDS,
+    build_drawtext_filter,
+    normalize_captions,
+)
+from sniply_bg_remover.mask_output import DEFAULT_BACKGROUND, MP4_OUTPUT_MODES, validate_background
+
+# Steps that compile to ffmpeg filters and fuse into a single filter graph.
+FILTER_STEPS = ("noise_reduction", "text_apply")
+PIPELINE_STEPS = FILTER_STEPS + ("bg_remover",)
+MAX_STEPS = 8
+
+
+class PipelineError(ValueError):
+    pass
+
+
+def scratch_dir() -> str:
+    """Where intermediates go: ``PIPELINE_TMP_DIR``, else tmpfs when available."""
+    path = os.environ.get("PIPELINE_TMP_DIR")
+    if path:
+        return path
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def normalize_steps(steps) -> list[dict]:
+    """Validates ``[{"processor": name, "params": {...}}, ...]`` into canonical steps."""
+    if not isinstance(steps, list) or not steps:
+        raise PipelineError("Steps must be a non-empty JSON list.")
+    if len(steps) > MAX_STEPS:
+        raise PipelineError(f"A pipeline has at most {MAX_STEPS} steps.")
+    normalized = []
+    for step in steps:
+        if not isinstance(step, dict) or step.get("processor") not in PIPELINE_STEPS:
+            raise PipelineError(f"Each step needs a processor, one of {PIPELINE_STEPS}.")
+        params = step.get("params") or {}
+        if not isinstance(params, dict):
+            raise PipelineError("Step params must be a JSON object.")
+        if step["processor"] == "text_apply":
+            if not (params.get("text") or params.get("captions")):
+                raise PipelineError("text_apply steps need text or captions.")
+            style = {k: v for k, v in params.items() if k in CAPTION_FIELDS}
+            captions = params.get("captions")
+            if captions is not None and not isinstance(captions, list):
+                raise PipelineError("Captions must be a JSON list.")
+            # A single caption is the one-element form of a caption list.
+            params = {"captions": normalize_captions(captions or [style], style)}
+            if not params["captions"]:
+                raise PipelineError("text_apply steps need at least one valid caption.")
+        elif step["processor"] == "bg_remover":
+            # Pipelines always produce an MP4, so only those output modes apply.
+            output_mode = params.get("output_mode", "rgba")
+            if output_mode not in MP4_OUTPUT_MODES:
+                raise PipelineError(f"bg_remover output_mode must be one of {MP4_OUTPUT_MODES}.")
+            background = params.get("background", DEFAULT_BACKGROUND)
+            params = {"output_mode": output_mode} if output_mode != "rgba" else {}
+            if output_mode == "composite":
+                try:
+                    params["background"] = validate_background(background)
+                except ValueError as e:
+                    raise PipelineError(str(e))
+        else:
+            params = {}
+        normalized.append({"processor": step["processor"], "params": params})
+    if sum(step["processor"] == "bg_remover" for step in normalized) > 1:
+        raise PipelineError("bg_remover can appear at most once in a pipeline.")
+    return normalized
+
+
+def compile_filters(steps: list[dict], has_audio: bool) -> tuple[str | None, str | None]:
+    """Fuses consecutive filter steps into one video and one audio filter chain."""
+    video, audio = [], []
+    for step in steps:
+        if step["processor"] == "noise_reduction":
+            video_filter, audio_filter = denoise_filters(has_audio)
+            video.append(video_filter)
+            if audio_filter:
+                audio.append(audio_filter)
+        elif step["processor"] == "text_apply":
+            video += [build_drawtext_filter(**caption) for caption in step["params"]["captions"]]
+    return ",".join(video) or None, ",".join(audio) or None
+
+
+def run_filter_graph(input_path, output_path, video_filter, audio_filter, has_audio):
+    plan = plan_segments(input_path)
+    audio_args = ["-c:a", "aac"]
+    if plan is not None:
+        run_segmented(
+            input_path,
+            output_path,
+            plan,
+            video_filter,
+            CPU_VIDEO_ARGS,
+            audio_filter=audio_filter,
+            audio_args=audio_args,
+            work_dir=scratch_dir(),
+        )
+        return
+    cmd = ["ffmpeg", *BENCH_ARGS, "-i", input_path, "-map", "0:v:0", "-map", "0:a?"]
+    cmd += ["-vf", video_filter] + CPU_VIDEO_ARGS
+    if has_audio:
+        cmd += (["-af", audio_filter] if audio_filter else []) + audio_args
+    cmd += thread_args() + ["-movflags", "+faststart", "-y", output_path]
+    stages, seconds = run_benchmarked(cmd)
+    record_benchmark(
+        stages, seconds, probe_media(input_path).frame_count, os.path.getsize(output_path)
+    )
+
+
+def run_pipeline(input_path: str, output_path: str, steps: list[dict]) -> list[tuple]:
+    """Runs normalised pipeline steps with a single decode and a single encode.
+
+    Filter steps are fused into one ffmpeg filter graph. With a
+    ``bg_remover`` step, the filter steps before it run inside its decoder
+    and the ones after it inside its encoder. Fused steps can't be timed
+    one by one, so this returns ``(name, description, seconds)`` timings of
+    the stages the run recorded (decode, filter, inference, encode, ...;
+    with background removal they overlap), then the whole run.
+    """
+    info = probe_media(input_path)
+    bg_index = next(
+        (i for i, step in enumerate(steps) if step["processor"] == "bg_remover"), None
+    )
+    groups = [steps] if bg_index is None else [steps[:bg_index], steps[bg_index + 1 :]]
+    compiled = [compile_filters(group, info.has_audio) for group in groups]
+    fused = "+".join(f"{i}:{step['processor']}" for i, step in enumerate(steps))
+
+    t = time.perf_counter()
+    with collect_stages() as recorded:
+        if bg_index is None:
+            video_filter, audio_filter = compiled[0]
+            run_filter_graph(input_path, output_path, video_filter, audio_filter, info.has_audio)
+        else:
+            # Loaded only when a pipeline needs it: it pulls in numpy and Pillow.
+            from sniply_bg_remover.bg_removal import run_bg_removal_pipeline
+
+            # Background removal drops audio, so only the video filters apply.
+            run_bg_removal_pipeline(
+                input_video=input_path,
+                output_video=output_path,
+                pre_filter=compiled[0][0],
+                post_filter=compiled[1][0],
+                **steps[bg_index]["params"],
+            )
+    elapsed = time.perf_counter() - t
+
+    stages = {}
+    for name, seconds in recorded:
+        stages[name] = stages.get(name, 0.0) + seconds
+    timings = [(name, name, seconds) for name, seconds in stages.items()]
+    timings.append(("run", fused, elapsed))
+    print("Pipeline timings: " + ", ".join(f"{n} ({d}) {s:.2f}s" for n, d, s in timings))
+    return timings
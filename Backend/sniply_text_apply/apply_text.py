@@ -1,246 +1,468 @@
-import ffmpeg
 import os
+import re
 
+from sniply_jobs.thread_budget import current_threads
+from sniply_media.probe import MediaInfo, probe_media
+from sniply_media.segments import plan_segments, plan_windows, run_segmented
+from sniply_metrics.metrics import stage
 
-def apply_text_to_video_ffmpeg(
-    input_path: str,
+
+DEFAULTS = {
+    "font_size": 64,
+    "font_color": "white",
+    "box_color": "black@0.5",
+    "box_border": 20,
+    "position": "bottom",
+    "text": "Sample Text",
+}
+# Per-caption fields of a caption spec; anything else is ignored.
+CAPTION_FIELDS = (
+    "text",
+    "font_size",
+    "font_color",
+    "box_color",
+    "box_border",
+    "position",
+    "start",
+    "end",
+)
+SUBTITLE_EXTENSIONS = {".srt", ".ass", ".ssa"}
+# "00:00:01,000 --> 00:00:04,000" (SRT) and "Dialogue: 0,0:00:01.00,0:00:04.00,..." (ASS).
+SRT_TIMING = re.compile(r"(\d+):(\d+):(\d+)[,.](\d+)\s*-->\s*(\d+):(\d+):(\d+)[,.](\d+)")
+ASS_DIALOGUE = re.compile(r"^Dialogue:\s*[^,]*,(\d+):(\d+):(\d+)\.(\d+),(\d+):(\d+):(\d+)\.(\d+),")
+# Audio codecs the MP4 muxer takes as-is; anything else is re-encoded to AAC.
+MP4_AUDIO_CODECS = {"aac", "mp3", "ac3", "eac3", "alac"}
+# A colour name or #RRGGBB[AA], then an optional opacity such as "@0.5".
+COLOR_PATTERN = re.compile(
+    r"(#[0-9A-Fa-f]{6}(?:[0-9A-Fa-f]{2})?|[A-Za-z]+)(?:@(?:0?\.[0-9]+|[01](?:\.0*)?))?"
+)
+SAFE_COLORS = {
+    "aliceblue",
+    "antiquewhite",
+    "aqua",
+    "aquamarine",
+    "azure",
+    "beige",
+    "bisque",
+    "black",
+    "blanchedalmond",
+    "blue",
+    "blueviolet",
+    "brown",
+    "burlywood",
+    "cadetblue",
+    "chartreuse",
+    "chocolate",
+    "coral",
+    "cornflowerblue",
+    "cornsilk",
+    "crimson",
+    "cyan",
+    "darkblue",
+    "darkcyan",
+    "darkgoldenrod",
+    "darkgray",
+    "darkgreen",
+    "darkgrey",
+    "darkkhaki",
+    "darkmagenta",
+    "darkolivegreen",
+    "darkorange",
+    "darkorchid",
+    "darkred",
+    "darksalmon",
+    "darkseagreen",
+    "darkslateblue",
+    "darkslategray",
+    "darkslategrey",
+    "darkturquoise",
+    "darkviolet",
+    "deeppink",
+    "deepskyblue",
+    "dimgray",
+    "dimgrey",
+    "dodgerblue",
+    "firebrick",
+    "floralwhite",
+    "forestgreen",
+    "fuchsia",
+    "gainsboro",
+    "ghostwhite",
+    "gold",
+    "goldenrod",
+    "gray",
+    "grey",
+    "green",
+    "greenyellow",
+    "honeydew",
+    "hotpink",
+    "indianred",
+    "indigo",
+    "ivory",
+    "khaki",
+    "lavender",
+    "lavenderblush",
+    "lawngreen",
+    "lemonchiffon",
+    "lightblue",
+    "lightcoral",
+    "lightcyan",
+    "lightgoldenrodyellow",
+    "lightgray",
+    "lightgreen",
+    "lightgrey",
+    "lightpink",
+    "lightsalmon",
+    "lightseagreen",
+    "lightskyblue",
+    "lightslategray",
+    "lightslategrey",
+    "lightsteelblue",
+    "lightyellow",
+    "lime",
+    "limegreen",
+    "linen",
+    "magenta",
+    "maroon",
+    "mediumaquamarine",
+    "mediumblue",
+    "mediumorchid",
+    "mediumpurple",
+    "mediumseagreen",
+    "mediumslateblue",
+    "mediumspringgreen",
+    "mediumturquoise",
+    "mediumvioletred",
+    "midnightblue",
+    "mintcream",
+    "mistyrose",
+    "moccasin",
+    "navajowhite",
+    "navy",
+    "oldlace",
+    "olive",
+    "olivedrab",
+    "orange",
+    "orangered",
+    "orchid",
+    "palegoldenrod",
+    "palegreen",
+    "paleturquoise",
+    "palevioletred",
+    "papayawhip",
+    "peachpuff",
+    "peru",
+    "pink",
+    "plum",
+    "powderblue",
+    "purple",
+    "rebeccapurple",
+    "red",
+    "rosybrown",
+    "royalblue",
+    "saddlebrown",
+    "salmon",
+    "sandybrown",
+    "seagreen",
+    "seashell",
+    "sienna",
+    "silver",
+    "skyblue",
+    "slateblue",
+    "slategray",
+    "slategrey",
+    "snow",
+    "springgreen",
+    "steelblue",
+    "tan",
+    "teal",
+    "thistle",
+    "tomato",
+    "turquoise",
+    "violet",
+    "wheat",
+    "white",
+    "whitesmoke",
+    "yellow",
+    "yellowgreen",
+}
+
+def is_valid_color(c) -> bool:
+    """True for a named colour or #RRGGBB[AA], with an optional "@opacity".
+
+    Colours end up inside ffmpeg filter strings, so nothing else may pass.
+    """
+    match = isinstance(c, str) and COLOR_PATTERN.fullmatch(c)
+    return bool(match) and (
+        match.group(1).startswith("#") or match.group(1).lower() in SAFE_COLORS
+    )
+
+
+def validate_color(c, default):
+    """Validate color; fallback if invalid"""
+    if is_valid_color(c):
+        return c
+    print(f"Invalid color '{c}' — falling back to '{default}'")
+    return default
+
+
+def validate_int(n, default, min_val=1, max_val=500):
+    """Ensure integer within reasonable range"""
+    try:
+        n = int(n)
+        if n < min_val or n > max_val:
+            raise ValueError
+        return n
+    except Exception:
+        print(f"Invalid numeric value '{n}' — falling back to {default}")
+        return default
+
+
+def validate_position(p, default):
+    """Ensure position is one of 'top', 'center', 'bottom'"""
+    p = str(p).lower()
+    if p not in {"top", "center", "bottom"}:
+        print(f"Invalid position '{p}' — falling back to '{default}'")
+        return default
+    return p
+
+
+def validate_text(t, default):
+    """Ensure text is a valid non-empty string"""
+    if not isinstance(t, str) or not t.strip():
+        print(f"Invalid or empty text — falling back to default text.")
+        return default
+    return t
+
+
+def validate_time(t):
+    """Ensure a caption time is a non-negative number of seconds, or None"""
+    if t is None or t == "":
+        return None
+    try:
+        t = float(t)
+        if t < 0 or t != t or t == float("inf"):
+            raise ValueError
+        return t
+    except Exception:
+        print(f"Invalid caption time '{t}' — ignoring it")
+        return None
+
+
+def normalize_text_params(
     text: str,
-    output_path: str,
     font_size: int = 64,
     font_color: str = "white",
     box_color: str = "black@0.5",
     box_border: int = 20,
     position: str = "bottom",
-):
-    DEFAULTS = {
-        "font_size": 64,
-        "font_color": "white",
-        "box_color": "black@0.5",
-        "box_border": 20,
-        "position": "bottom",
-        "text": "Sample Text",
-    }
-    SAFE_COLORS = {
-        "aliceblue",
-        "antiquewhite",
-        "aqua",
-        "aquamarine",
-        "azure",
-        "beige",
-        "bisque",
-        "black",
-        "blanchedalmond",
-        "blue",
-        "blueviolet",
-        "brown",
-        "burlywood",
-        "cadetblue",
-        "chartreuse",
-        "chocolate",
-        "coral",
-        "cornflowerblue",
-        "cornsilk",
-        "crimson",
-        "cyan",
-        "darkblue",
-        "darkcyan",
-        "darkgoldenrod",
-        "darkgray",
-        "darkgreen",
-        "darkgrey",
-        "darkkhaki",
-        "darkmagenta",
-        "darkolivegreen",
-        "darkorange",
-        "darkorchid",
-        "darkred",
-        "darksalmon",
-        "darkseagreen",
-        "darkslateblue",
-        "darkslategray",
-        "darkslategrey",
-        "darkturquoise",
-        "darkviolet",
-        "deeppink",
-        "deepskyblue",
-        "dimgray",
-        "dimgrey",
-        "dodgerblue",
-        "firebrick",
-        "floralwhite",
-        "forestgreen",
-        "fuchsia",
-        "gainsboro",
-        "ghostwhite",
-        "gold",
-        "goldenrod",
-        "gray",
-        "grey",
-        "green",
-        "greenyellow",
-        "honeydew",
-        "hotpink",
-        "indianred",
-        "indigo",
-        "ivory",
-        "khaki",
-        "lavender",
-        "lavenderblush",
-        "lawngreen",
-        "lemonchiffon",
-        "lightblue",
-        "lightcoral",
-        "lightcyan",
-        "lightgoldenrodyellow",
-        "lightgray",
-        "lightgreen",
-        "lightgrey",
-        "lightpink",
-        "lightsalmon",
-        "lightseagreen",
-        "lightskyblue",
-        "lightslategray",
-        "lightslategrey",
-        "lightsteelblue",
-        "lightyellow",
-        "lime",
-        "limegreen",
-        "linen",
-        "magenta",
-        "maroon",
-        "mediumaquamarine",
-        "mediumblue",
-        "mediumorchid",
-        "mediumpurple",
-        "mediumseagreen",
-        "mediumslateblue",
-        "mediumspringgreen",
-        "mediumturquoise",
-        "mediumvioletred",
-        "midnightblue",
-        "mintcream",
-        "mistyrose",
-        "moccasin",
-        "navajowhite",
-        "navy",
-        "oldlace",
-        "olive",
-        "olivedrab",
-        "orange",
-        "orangered",
-        "orchid",
-        "palegoldenrod",
-        "palegreen",
-        "paleturquoise",
-        "palevioletred",
-        "papayawhip",
-        "peachpuff",
-        "peru",
-        "pink",
-        "plum",
-        "powderblue",
-        "purple",
-        "rebeccapurple",
-        "red",
-        "rosybrown",
-        "royalblue",
-        "saddlebrown",
-        "salmon",
-        "sandybrown",
-        "seagreen",
-        "seashell",
-        "sienna",
-        "silver",
-        "skyblue",
-        "slateblue",
-        "slategray",
-        "slategrey",
-        "snow",
-        "springgreen",
-        "steelblue",
-        "tan",
-        "teal",
-        "thistle",
-        "tomato",
-        "turquoise",
-        "violet",
-        "wheat",
-        "white",
-        "whitesmoke",
-        "yellow",
-        "yellowgreen",
+    start: float | None = None,
+    end: float | None = None,
+) -> dict:
+    """Validates caption settings, replacing invalid values with defaults.
+
+    ``start``/``end`` bound the caption in seconds; None shows it from the
+    beginning or until the end of the clip.
+    """
+    start, end = validate_time(start), validate_time(end)
+    if start is not None and end is not None and end <= start:
+        print(f"Caption end {end} is not after start {start} — ignoring end")
+        end = None
+    return {
+        "text": validate_text(text, DEFAULTS["text"]),
+        "font_size": validate_int(font_size, DEFAULTS["font_size"]),
+        "font_color": validate_color(font_color, DEFAULTS["font_color"]),
+        "box_color": validate_color(box_color, DEFAULTS["box_color"]),
+        "box_border": validate_int(box_border, DEFAULTS["box_border"]),
+        "position": validate_position(position, DEFAULTS["position"]),
+        "start": start,
+        "end": end,
     }
 
-    def validate_color(c, default):
-        """Validate color; fallback if invalid"""
-        try:
-            if not isinstance(c, str) or not c.strip():
-                raise ValueError
-            base = c.split("@")[0].lower()
-            if base.startswith("#"):  # allow hex like #00FF00
-                return c
-            if base not in SAFE_COLORS:
-                raise ValueError
-            return c
-        except Exception:
-            print(f"Invalid color '{c}' — falling back to '{default}'")
-            return default
-
-    def validate_int(n, default, min_val=1, max_val=500):
-        """Ensure integer within reasonable range"""
-        try:
-            n = int(n)
-            if n < min_val or n > max_val:
-                raise ValueError
-            return n
-        except Exception:
-            print(f"Invalid numeric value '{n}' — falling back to {default}")
-            return default
-
-    def validate_position(p, default):
-        """Ensure position is one of 'top', 'center', 'bottom'"""
-        p = str(p).lower()
-        if p not in {"top", "center", "bottom"}:
-            print(f"Invalid position '{p}' — falling back to '{default}'")
-            return default
-        return p
-
-    def validate_text(t, default):
-        """Ensure text is a valid non-empty string"""
-        if not isinstance(t, str) or not t.strip():
-            print(f"Invalid or empty text — falling back to default text.")
-            return default
-        return t
 
-    text = validate_text(text, DEFAULTS["text"])
-    font_color = validate_color(font_color, DEFAULTS["font_color"])
-    box_color = validate_color(box_color, DEFAULTS["box_color"])
-    font_size = validate_int(font_size, DEFAULTS["font_size"])
-    box_border = validate_int(box_border, DEFAULTS["box_border"])
-    position = validate_position(position, DEFAULTS["position"])
+def normalize_captions(captions, defaults: dict | None = None) -> list[dict]:
+    """Validates a list of caption specs.
+
+    Fields missing from a spec fall back to ``defaults`` (e.g. the request's
+    own style settings), then to the module defaults. Non-dict entries are
+    dropped.
+    """
+    defaults = {k: v for k, v in (defaults or {}).items() if k in CAPTION_FIELDS}
+    defaults.pop("start", None)
+    defaults.pop("end", None)
+    normalized = []
+    for caption in captions or []:
+        if not isinstance(caption, dict):
+            print(f"Invalid caption spec '{caption}' — skipping it")
+            continue
+        spec = {**defaults, **{k: v for k, v in caption.items() if k in CAPTION_FIELDS}}
+        spec.setdefault("text", None)
+        normalized.append(normalize_text_params(**spec))
+    return normalized
+
+
+def subtitle_windows(subtitle_path: str) -> list[tuple[float, float]] | None:
+    """Reads cue times from an SRT/ASS file, or None if it has no recognisable cues."""
+
+    def seconds(h, m, s, frac):
+        return int(h) * 3600 + int(m) * 60 + int(s) + int(frac) / 10 ** len(frac)
+
+    windows = []
+    with open(subtitle_path, encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            match = SRT_TIMING.search(line) or ASS_DIALOGUE.match(line.strip())
+            if match:
+                g = match.groups()
+                windows.append((seconds(*g[:4]), seconds(*g[4:])))
+    return windows or None
+
+
+def build_subtitles_filter(subtitle_path: str) -> str:
+    # Escaped for the filtergraph ("'") and for the option parser (":").
+    path = subtitle_path.replace("\\", "/").replace("'", "").replace(":", "\\:")
+    return f"subtitles=filename='{path}'"
+
+
+def build_drawtext_filter(
+    text: str,
+    font_size: int,
+    font_color: str,
+    box_color: str,
+    box_border: int,
+    position: str,
+    start: float | None = None,
+    end: float | None = None,
+) -> str:
     safe_text = text.replace(":", "\\:").replace("'", "\\'")
     y_expr = {"top": "80", "center": "(h-text_h)/2", "bottom": "h-text_h-80"}[position]
-    drawtext_filter = (
+    enable = ""
+    if start is not None or end is not None:
+        enable = f":enable=between(t\\,{start or 0}\\,{end if end is not None else 1e9})"
+    return (
         f"drawtext=text='{safe_text}':"
         f"fontsize={font_size}:"
         f"fontcolor={font_color}:"
         f"x=(w-text_w)/2:"
         f"y={y_expr}:"
         f"box=1:boxcolor={box_color}:boxborderw={box_border}"
+        f"{enable}"
+    )
+
+
+def audio_codec_for(info: MediaInfo) -> str:
+    """Copies audio the MP4 output can hold, otherwise re-encodes to AAC."""
+    return "copy" if {s.codec_name for s in info.audio} <= MP4_AUDIO_CODECS else "aac"
+
+
+def compile_captions(
+    text: str | None,
+    font_size: int = 64,
+    font_color: str = "white",
+    box_color: str = "black@0.5",
+    box_border: int = 20,
+    position: str = "bottom",
+    start: float | None = None,
+    end: float | None = None,
+    captions: list[dict] | None = None,
+    subtitle_path: str | None = None,
+) -> tuple[str, list[tuple[float, float | None]] | None]:
+    """Compiles captions into one filter chain.
+
+    Returns the filter and the time windows the captions cover, or None for
+    the windows if any caption is shown throughout.
+    """
+    params = normalize_text_params(
+        text, font_size, font_color, box_color, box_border, position, start, end
     )
+    captions = normalize_captions(captions, params) if captions else []
+    if not captions and not subtitle_path:
+        captions = [params]
+    filters = [build_drawtext_filter(**caption) for caption in captions]
+    if subtitle_path:
+        filters.append(build_subtitles_filter(subtitle_path))
+
+    windows = [(c["start"] or 0, c["end"]) for c in captions]
+    if subtitle_path:
+        cues = subtitle_windows(subtitle_path)
+        windows = None if cues is None else windows + cues
+    if not windows or any(c["start"] is None and c["end"] is None for c in captions):
+        windows = None
+    return ",".join(filters), windows
+
+
+def apply_text_to_video_ffmpeg(
+    input_path: str,
+    text: str | None,
+    output_path: str,
+    font_size: int = 64,
+    font_color: str = "white",
+    box_color: str = "black@0.5",
+    box_border: int = 20,
+    position: str = "bottom",
+    start: float | None = None,
+    end: float | None = None,
+    parallel: bool = True,
+    captions: list[dict] | None = None,
+    subtitle_path: str | None = None,
+):
+    """Burns captions into a video in a single encode.
+
+    Either ``text`` (one caption styled by the other arguments), or a list
+    of ``captions`` specs, each with its own text, style and time window
+    (missing fields fall back to the arguments here), and/or an SRT/ASS
+    ``subtitle_path``. Everything is compiled into one filter chain.
+    """
+    video_filter, windows = compile_captions(
+        text,
+        font_size,
+        font_color,
+        box_color,
+        box_border,
+        position,
+        start,
+        end,
+        captions,
+        subtitle_path,
+    )
+    info = probe_media(input_path)
+    audio_codec = audio_codec_for(info)
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    (
-        ffmpeg.input(input_path)
-        .output(
+    # Timed captions only need the GOPs they overlap re-encoded; the rest of
+    # the video is stream-copied.
+    plan = plan_windows(input_path, windows) if windows else None
+    # Otherwise long clips are captioned as keyframe-aligned segments in parallel.
+    if plan is None and parallel:
+        plan = plan_segments(input_path)
+    if plan is not None:
+        run_segmented(
+            input_path,
             output_path,
-            vf=drawtext_filter,
-            vcodec="libx264",
-            acodec="aac",
-            movflags="+faststart",
+            plan,
+            video_filter,
+            plan.video_args or ["-c:v", "libx264", "-pix_fmt", plan.pix_fmt or "yuv420p"],
+            audio_args=["-c:a", audio_codec],
         )
-        .overwrite_output()
-        .run(quiet=False)
-    )
+        print(f"Text applied successfully to {output_path}")
+        return
+
+    import ffmpeg  # ffmpeg-python, loaded with the first unsegmented encode
+
+    with stage("encode", frames=info.frame_count) as run:
+        (
+            ffmpeg.input(input_path)
+            .output(
+                output_path,
+                vf=video_filter,
+                vcodec="libx264",
+                acodec=audio_codec,
+                movflags="+faststart",
+                threads=current_threads(),
+                filter_threads=current_threads(),
+            )
+            .overwrite_output()
+            .run(quiet=False)
+        )
+        run.nbytes = os.path.getsize(output_path)
 
     print(f"Text applied successfully to {output_path}")
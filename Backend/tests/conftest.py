@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Modules import each other as ``sniply_<package>.<module>`` from the Backend folder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The app without its startup hooks: no inference pool, no model warm-up."""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    return TestClient(main.app)
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import anyio
+import pytest
+
+from sniply_jobs.admission import AdmissionController, ProcessorLimits, QueueFullError
+
+
+def controller(concurrency=1, queue_depth=100):
+    return AdmissionController({"heavy": ProcessorLimits(concurrency, queue_depth)}, slots=1)
+
+
+def test_queued_requests_do_not_starve_the_threadpool():
+    admission = controller()
+    release = threading.Event()
+    results = []
+
+    async def request():
+        ticket = admission.admit("heavy")
+        ticket.estimate = 100.0
+        results.append(await admission.run_async(ticket, release.wait, 10))
+
+    async def main():
+        queued = anyio.to_thread.current_default_thread_limiter().total_tokens + 5
+        async with anyio.create_task_group() as tg:
+            for _ in range(queued):
+                tg.start_soon(request)
+            await anyio.sleep(0.2)
+            # Only the running job holds a thread; anything else still gets one.
+            with anyio.fail_after(2):
+                assert await anyio.to_thread.run_sync(lambda: "ok") == "ok"
+            assert admission.stats()["heavy"]["running"] == 1
+            release.set()
+        return queued
+
+    queued = anyio.run(main)
+    assert len(results) == queued
+    stats = admission.stats()["heavy"]
+    assert stats["waiting"] == 0 and stats["running"] == 0 and stats["completed"] == queued
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    admission = controller(queue_depth=1)
+    release = threading.Event()
+
+    async def main():
+        async with anyio.create_task_group() as tg:
+            running = admission.admit("heavy")
+            running.estimate = 1.0
+            tg.start_soon(admission.run_async, running, release.wait, 10)
+            await anyio.sleep(0.1)
+            with anyio.move_on_after(0.1):
+                queued = admission.admit("heavy")
+                queued.estimate = 1.0
+                await admission.run_async(queued, lambda: None)
+            assert admission.stats()["heavy"]["waiting"] == 0
+            # The slot it held is free again.
+            admission.admit("heavy").cancel()
+            release.set()
+
+    anyio.run(main)
+    assert admission.stats()["heavy"]["completed"] == 1
+
+
+def test_blocking_run_starts_shortest_job_first():
+    admission = controller()
+    release = threading.Event()
+    order = []
+    first = admission.admit("heavy")
+    first.estimate = 1.0
+    blocker = threading.Thread(target=admission.run, args=(first, release.wait, 10))
+    blocker.start()
+    threads = []
+    for estimate in (30.0, 3.0, 10.0):
+        ticket = admission.admit("heavy")
+        ticket.estimate = estimate
+        threads.append(
+            threading.Thread(target=admission.run, args=(ticket, order.append, estimate))
+        )
+        threads[-1].start()
+    while admission.stats()["heavy"]["waiting"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [blocker, *threads]:
+        thread.join(5)
+    assert order == [3.0, 10.0, 30.0]
+
+
+def test_full_queue_is_rejected():
+    admission = controller(queue_depth=0)
+    admission.admit("heavy")
+    with pytest.raises(QueueFullError):
+        admission.admit("heavy")
@@ -0,0 +1,46 @@
+import os
+
+from PIL import Image, ImageSequence
+
+from sniply_bg_removal_icon.animated import write_gif
+
+
+def frame(color, box, duration=100):
+    """A transparent 32x32 frame with an opaque square."""
+    img = Image.new("RGBA", (32, 32), (0, 0, 0, 0))
+    img.paste(color + (255,), box)
+    img.info["duration"] = duration
+    return img
+
+
+def test_gif_frames_are_written_as_they_arrive(tmp_path):
+    output_path = str(tmp_path / "out.gif")
+    sizes = []
+
+    def frames():
+        for i in range(4):
+            yield frame((255, 0, 0), (i * 4, 0, i * 4 + 8, 8))
+            sizes.append(os.path.getsize(output_path))
+
+    assert write_gif(frames(), output_path) == 4
+    # Each frame is on disk once the next one shows it differs.
+    assert sizes[0] < sizes[1] < sizes[2] < sizes[3]
+
+
+def test_gif_keeps_timing_and_transparency(tmp_path):
+    output_path = str(tmp_path / "out.gif")
+    red = frame((255, 0, 0), (0, 0, 8, 8), 100)
+    repeat = red.copy()
+    repeat.info["duration"] = 50
+    blue = frame((0, 0, 255), (16, 16, 32, 32), 70)
+
+    assert write_gif([red, repeat, blue], output_path) == 2
+
+    with Image.open(output_path) as img:
+        frames = [(f.info["duration"], f.convert("RGBA")) for f in ImageSequence.Iterator(img)]
+    assert [duration for duration, _ in frames] == [150, 70]
+    assert frames[0][1].getpixel((2, 2)) == (255, 0, 0, 255)
+    assert frames[0][1].getpixel((20, 20))[3] == 0
+    # Disposal clears the previous frame, so the red square doesn't linger.
+    assert frames[1][1].getpixel((2, 2))[3] == 0
+    assert frames[1][1].getpixel((20, 20)) == (0, 0, 255, 255)
@@ -0,0 +1,120 @@
+import shutil
+import subprocess
+
+import pytest
+
+
+def upload(name="clip.mp4", data=b"not really a video"):
+    return {"file": (name, data, "video/mp4")}
+
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def clip_upload(tmp_path):
+    clip = tmp_path / "clip.mp4"
+    lavfi = ["-f", "lavfi", "-i", "testsrc2=size=160x120:rate=10:duration=1"]
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *lavfi, str(clip)], check=True)
+    return upload(data=clip.read_bytes())
+
+
+@pytest.fixture
+def app_dirs(monkeypatch, tmp_path):
+    """Points the app's uploads, results and result cache at ``tmp_path``; returns the cache."""
+    import main
+    from sniply_cache.result_cache import ResultCache
+
+    results = str(tmp_path / "results")
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(main, "RESULTS_DIR", results)
+    monkeypatch.setattr(main, "CACHE_DIR", str(tmp_path / "cache"))
+    cache = ResultCache(main.CACHE_DIR, results_root=results, result_ttl=main.JOB_TTL_SECONDS)
+    monkeypatch.setattr(main, "result_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def fake_bg_removal(monkeypatch, app_dirs):
+    """Stands in for the model run; records its arguments."""
+    from sniply_bg_remover import bg_removal
+
+    calls = []
+
+    def run(input_video, output_video, **kwargs):
+        calls.append(kwargs)
+        shutil.copyfile(input_video, output_video)
+        return {"frames": 10, "inferences": 2, "skipped_inferences": 8}
+
+    monkeypatch.setattr(bg_removal, "run_bg_removal_pipeline", run)
+    return calls
+
+
+def test_bg_remover_rejects_injected_background(client):
+    response = client.post(
+        "/process/bg_remover",
+        data={"output_mode": "composite", "background": "#000000:s=16x16"},
+        files=upload(),
+    )
+    assert response.status_code == 400
+    assert "background" in response.json()["detail"]
+
+
+def test_bg_remover_rejects_unknown_output_mode(client):
+    response = client.post("/process/bg_remover", data={"output_mode": "gif"}, files=upload())
+    assert response.status_code == 400
+
+
+@needs_ffmpeg
+def test_cached_job_results_survive_cache_eviction(client, tmp_path, app_dirs):
+    files = clip_upload(tmp_path)
+    text = {"text": "cache eviction"}
+    assert client.post("/process/text_apply", data=text, files=files).status_code == 200
+
+    job = client.post("/jobs/text_apply", data=text, files=files).json()
+    assert job["status"] == "done"
+    app_dirs.clear()  # evicts every entry, including the one just hit
+    assert app_dirs.stats()["entries"] == 0
+
+    response = client.get(f"/jobs/{job['job_id']}/result")
+    assert response.status_code == 200
+    assert response.content
+
+
+@pytest.mark.parametrize(
+    "data, message",
+    [({"diff_threshold": "2"}, "threshold"), ({"max_interval": "100000"}, "interval")],
+)
+def test_bg_remover_rejects_bad_temporal_options(client, data, message):
+    response = client.post("/process/bg_remover", data={"temporal": "true", **data}, files=upload())
+    assert response.status_code == 400
+    assert message in response.json()["detail"]
+
+
+@needs_ffmpeg
+def test_bg_remover_temporal_mode_reports_skipped_inferences(client, tmp_path, fake_bg_removal):
+    data = {"temporal": "true", "max_interval": "5"}
+    response = client.post("/process/bg_remover", data=data, files=clip_upload(tmp_path))
+
+    assert response.status_code == 200
+    temporal = fake_bg_removal[0]["temporal"]
+    assert temporal.max_interval == 5 and temporal.diff_threshold == 0.06
+    assert response.headers["X-Inference-Stats"] == (
+        "frames=10, inferences=2, skipped_inferences=8"
+    )
+
+
+@pytest.mark.parametrize("data", [{"refine": "sharpen"}, {"refine": "edge", "output_mode": "webm"}])
+def test_bg_remover_rejects_bad_refine_options(client, data):
+    response = client.post("/process/bg_remover", data=data, files=upload())
+    assert response.status_code == 400
+    assert "efine" in response.json()["detail"]
+
+
+@needs_ffmpeg
+def test_bg_remover_edge_refinement_reaches_the_pipeline(client, tmp_path, fake_bg_removal):
+    files = clip_upload(tmp_path)
+    response = client.post("/process/bg_remover", data={"refine": "edge"}, files=files)
+
+    assert response.status_code == 200
+    assert fake_bg_removal[0]["refine"] == "edge"
+    assert "X-Inference-Stats" in response.headers
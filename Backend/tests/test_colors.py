@@ -0,0 +1,51 @@
+import pytest
+
+from sniply_bg_remover.mask_output import mask_filter_graph, validate_background
+from sniply_pipeline.pipeline import PipelineError, normalize_steps
+from sniply_text_apply.apply_text import is_valid_color, validate_color
+
+INJECTIONS = [
+    "#000000:s=8x8[j];[j]nullsink;movie=/tmp/rv/icon.png,scale=640:360[m]",
+    "#000000:s=16x16",
+    "black:s=99999x99999",
+    "red,scale=1",
+    "#00ff00'",
+    "#12345",
+    "",
+    None,
+]
+
+
+@pytest.mark.parametrize(
+    "color", ["black", "Black", "black@0.5", "#00FF00", "#00ff0080", "white@1"]
+)
+def test_accepts_plain_colors(color):
+    assert is_valid_color(color)
+    assert validate_background(color) == color
+
+
+@pytest.mark.parametrize("color", INJECTIONS)
+def test_rejects_anything_else(color):
+    assert not is_valid_color(color)
+    with pytest.raises(ValueError):
+        validate_background(color)
+    assert validate_color(color, "white") == "white"
+
+
+def test_filter_graph_never_embeds_an_invalid_background():
+    with pytest.raises(ValueError):
+        mask_filter_graph("composite", (64, 64), 30, background=INJECTIONS[0])
+    _, graph = mask_filter_graph("composite", (64, 64), 30, background="#102030")
+    assert "color=c=#102030:s=64x64:r=30[bg]" in graph
+
+
+def test_pipeline_rejects_invalid_background():
+    step = {"processor": "bg_remover", "params": {"output_mode": "composite"}}
+    step["params"]["background"] = INJECTIONS[1]
+    with pytest.raises(PipelineError):
+        normalize_steps([step])
+    step["params"]["background"] = "green"
+    assert normalize_steps([step])[0]["params"] == {
+        "output_mode": "composite",
+        "background": "green",
+    }
@@ -0,0 +1,51 @@
+import shutil
+import subprocess
+
+import pytest
+
+from sniply_media.ffmpeg_bench import BENCH_ARGS, ERROR_TAIL_LINES, parse_benchmark, run_benchmarked
+from sniply_pipeline.pipeline import normalize_steps, run_pipeline
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def test_benchmark_lines_are_summed_per_stage():
+    stderr = (
+        "Stream mapping:\n"
+        "bench: 1517 user 0 sys 1500 real decode_video\n"
+        "bench: 2000 user 10 sys 2500 real decode_video\n"
+        "bench: 800 user 0 sys 1000 real encode_audio\n"
+        "bench: 9000 user 5 sys 9000 real encode_video\n"
+    )
+    stages = parse_benchmark(stderr.splitlines(keepends=True))
+    assert stages == pytest.approx({"decode": 0.004, "encode": 0.01})
+
+
+@needs_ffmpeg
+def test_failed_runs_keep_only_the_end_of_stderr(tmp_path):
+    lavfi = ["-f", "lavfi", "-i", "testsrc2=size=64x64:rate=30:duration=2"]
+    # Benchmarks every frame, then fails to open the output.
+    cmd = ["ffmpeg", *BENCH_ARGS, *lavfi, "-y", str(tmp_path / "missing" / "out.mp4")]
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        run_benchmarked(cmd)
+    lines = error.value.stderr.splitlines()
+    assert 0 < len(lines) <= ERROR_TAIL_LINES
+    assert not any(line.startswith("bench:") for line in lines)
+
+
+@needs_ffmpeg
+def test_server_timing_reports_measured_stages(tmp_path):
+    input_path = str(tmp_path / "in.mp4")
+    lavfi = ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=30:duration=2"]
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *lavfi, input_path], check=True)
+    step = {"processor": "text_apply", "params": {"text": "hi"}}
+    steps = normalize_steps([step, step])
+
+    timings = run_pipeline(input_path, str(tmp_path / "out.mp4"), steps)
+
+    stages = {name: seconds for name, _, seconds in timings}
+    assert list(stages) == ["decode", "filter", "encode", "run"]
+    assert stages["decode"] > 0 and stages["encode"] > 0
+    # Each step is labelled by its own position, even when two are identical.
+    assert timings[-1][1] == "0:text_apply+1:text_apply"
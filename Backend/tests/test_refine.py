@@ -0,0 +1,59 @@
+import numpy as np
+
+from sniply_inference import session_pool
+from sniply_inference.batched import refine_edges
+
+
+def counted(func, *args):
+    """Runs ``func`` as a pool worker would and returns what it counted."""
+    session_pool._task_counts.clear()
+    func(*args)
+    return dict(session_pool._task_counts)
+
+
+def test_edge_refinement_counts_refined_frames_and_band_pixels():
+    pred = np.zeros((2, 32, 32), dtype=np.float32)
+    pred[:, 8:24, 8:24] = 1
+    frames = np.zeros((2, 128, 128, 3), dtype=np.uint8)
+
+    counts = counted(refine_edges, frames, frames[:, ::4, ::4], pred)
+
+    assert counts["edge_frames"] == 2
+    # The band hugs the square's outline; everything else is upsampled as is.
+    assert 0 < counts["edge_band_pixels"] < 2 * 128 * 128 // 4
+
+
+def test_ragged_masks_fall_back_to_bilinear():
+    pred = np.random.default_rng(0).random((1, 32, 32), dtype=np.float32)
+    frames = np.zeros((1, 64, 64, 3), dtype=np.uint8)
+
+    counts = counted(refine_edges, frames, frames[:, ::2, ::2], pred)
+    assert counts == {"edge_frames": 0, "edge_fallback_frames": 1, "edge_band_pixels": 0}
+
+
+def test_fallback_is_decided_per_frame():
+    clean = np.zeros((32, 32), dtype=np.float32)
+    clean[8:24, 8:24] = 1
+    noisy = np.random.default_rng(0).random((32, 32), dtype=np.float32)
+    pred = np.stack([clean, noisy])
+    frames = np.zeros((2, 128, 128, 3), dtype=np.uint8)
+
+    counts = counted(refine_edges, frames, frames[:, ::4, ::4], pred)
+    masks = refine_edges(frames, frames[:, ::4, ::4], pred)
+
+    assert counts["edge_frames"] == 1 and counts["edge_fallback_frames"] == 1
+    # Only the clean mask's outline is refined; the noisy one is upsampled bilinearly.
+    assert 0 < counts["edge_band_pixels"] < 128 * 128 // 4
+    assert len(np.unique(masks[1])) > 2
+
+
+def test_task_counts_come_back_with_the_result(monkeypatch):
+    monkeypatch.setattr(session_pool, "get_session", lambda model_name: None)
+
+    def task(session):
+        session_pool.count("edge_frames", 3)
+        return "masks"
+
+    session_pool.count("left over", 1)
+    _, _, _, counts, result = session_pool._run_task(task, "u2netp", (), {})
+    assert counts == {"edge_frames": 3} and result == "masks"
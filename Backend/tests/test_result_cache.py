@@ -0,0 +1,60 @@
+import os
+import time
+
+from sniply_cache.result_cache import ResultCache
+
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return str(path)
+
+
+def produce(cache, results, job, key, size):
+    """What run_staged does: a processor writes a result, which is then cached."""
+    path = write(os.path.join(results, job, "out.mp4"), size)
+    cache.add_result(path)
+    cache.put(key, path)
+    return path
+
+
+def test_results_are_stored_once(tmp_path):
+    results = str(tmp_path / "results")
+    cache = ResultCache(str(tmp_path / "cache"), 1000, results_root=results)
+    path = produce(cache, results, "a", "k", 100)
+
+    assert os.stat(cache.get("k")).st_ino == os.stat(path).st_ino
+    assert cache.stats()["bytes"] == 100 and cache.stats()["result_bytes"] == 0
+
+
+def test_hits_outlive_their_cache_entry(tmp_path):
+    results = str(tmp_path / "results")
+    cache = ResultCache(str(tmp_path / "cache"), 1000, results_root=results)
+    produce(cache, results, "a", "k", 100)
+
+    hit = cache.checkout("k", os.path.join(results, "b", "out.mp4"))
+    produce(cache, results, "c", "k", 50)  # replaces the entry "b" was served from
+
+    assert os.path.getsize(cache.get("k")) == 50
+    assert os.path.getsize(hit) == 100
+
+
+def test_budget_counts_results_and_pins_entries_in_use(tmp_path, monkeypatch):
+    results = str(tmp_path / "results")
+    cache = ResultCache(str(tmp_path / "cache"), 250, results_root=results, result_ttl=3600)
+    produce(cache, results, "a", "old", 100)
+    produce(cache, results, "b", "new", 100)
+    cache.add_result(write(os.path.join(results, "c", "out.mp4"), 100))
+
+    # Over budget, but both entries share their file with a live result.
+    assert cache.get("old") and cache.get("new")
+    assert cache.stats()["bytes"] + cache.stats()["result_bytes"] == 300
+
+    later = time.time() + 7200
+    monkeypatch.setattr(time, "time", lambda: later)
+    produce(cache, results, "d", "newest", 100)
+
+    # Expired results are removed, unpinning their entries; the oldest is evicted.
+    assert not os.path.exists(os.path.join(results, "a"))
+    assert cache.get("old") is None and cache.get("new") and cache.get("newest")
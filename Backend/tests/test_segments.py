@@ -0,0 +1,105 @@
+import shutil
+import subprocess
+import threading
+import time
+from fractions import Fraction
+from types import SimpleNamespace
+
+import pytest
+
+from sniply_media import segments
+from sniply_media.probe import StreamInfo, probe_media
+from sniply_media.segments import Segment, SegmentPlan, plan_windows, splice_video_args
+from sniply_text_apply.apply_text import apply_text_to_video_ffmpeg
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def h264(profile, has_b_frames, level=31):
+    return StreamInfo(
+        0,
+        "video",
+        "h264",
+        None,
+        pix_fmt="yuv420p",
+        profile=profile,
+        level=level,
+        has_b_frames=has_b_frames,
+    )
+
+
+def test_splice_args_match_the_source():
+    args = splice_video_args(h264("Constrained Baseline", 0, level=30))
+    assert args[args.index("-profile:v") + 1] == "baseline"
+    assert args[args.index("-level:v") + 1] == "3.0"
+    assert args[-2:] == ["-bf", "0"]
+    assert splice_video_args(h264("High", 2))[-2:] == ["-x264-params", "b-pyramid=normal"]
+
+
+@pytest.mark.parametrize(
+    "stream", [h264("High 4:4:4 Predictive", 2), h264("High", 3), h264("Baseline", 1)]
+)
+def test_unmatchable_streams_are_not_spliced(stream):
+    assert splice_video_args(stream) is None
+
+
+def source(path, *args):
+    lavfi = ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=30:duration=6"]
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", *lavfi, "-c:v", "libx264", "-g", "30", *args, str(path)],
+        check=True,
+    )
+    return str(path)
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize(
+    "args", [("-profile:v", "baseline"), ("-profile:v", "main", "-bf", "0"), ()]
+)
+def test_smart_render_splices_decode_cleanly(tmp_path, args):
+    input_path = source(tmp_path / "in.mp4", *args)
+    windows = [(2.2, 3.5)]
+    assert plan_windows(input_path, windows) is not None
+    output_path = str(tmp_path / "out" / "out.mp4")
+    apply_text_to_video_ffmpeg(
+        input_path, None, output_path, captions=[{"text": "hi", "start": 2.2, "end": 3.5}]
+    )
+
+    decode = subprocess.run(
+        ["ffmpeg", "-v", "warning", "-i", output_path, "-f", "null", "-"],
+        capture_output=True,
+        text=True,
+    )
+    assert "non monotonically increasing dts" not in decode.stderr
+    src, out = probe_media(input_path).video, probe_media(output_path).video
+    assert (out.profile, out.has_b_frames, out.time_base) == (
+        src.profile,
+        src.has_b_frames,
+        src.time_base,
+    )
+    assert probe_media(output_path).frame_count == probe_media(input_path).frame_count
+
+
+def test_chunks_run_within_the_jobs_thread_share(tmp_path, monkeypatch):
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def run(cmd):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        open(cmd[-1], "wb").close()
+
+    monkeypatch.setattr(segments, "_run", run)
+    monkeypatch.setattr(segments, "current_threads", lambda default=None: 3)
+    monkeypatch.setattr(segments, "probe_media", lambda path: SimpleNamespace(frame_count=900))
+    windows = [Segment(i * 100, (i + 1) * 100, i / 10) for i in range(9)]
+    plan = SegmentPlan(windows, Fraction(1, 1000), 0.0, has_audio=True)
+
+    segments.run_segmented("in.mp4", str(tmp_path / "out.mp4"), plan, "null", ["-c:v", "libx264"])
+
+    # Nine encoded chunks plus the audio, but never more processes than threads.
+    assert peak[0] == 3
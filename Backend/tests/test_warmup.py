@@ -0,0 +1,42 @@
+import importlib
+import os
+import time
+
+from sniply_inference import session_pool
+from sniply_jobs import warmup
+
+
+def test_ready_processors_are_stripped(monkeypatch):
+    monkeypatch.setenv("READY_PROCESSORS", " text_apply , bg_remover,, ")
+    try:
+        assert importlib.reload(warmup).REQUIRED == ["text_apply", "bg_remover"]
+    finally:
+        monkeypatch.delenv("READY_PROCESSORS")
+        importlib.reload(warmup)
+
+
+def busy(session, seconds):
+    time.sleep(seconds)
+
+
+def warm_session(session):
+    with open(os.environ["WARM_LOG"], "a") as f:
+        f.write(f"{os.getpid()}\n")
+
+
+def test_warm_runs_in_every_worker(monkeypatch, tmp_path):
+    log = tmp_path / "warmed"
+    monkeypatch.setenv("WARM_LOG", str(log))
+    # Forked workers inherit the patched module.
+    monkeypatch.setattr(session_pool, "get_session", lambda model_name: None)
+    monkeypatch.setattr(session_pool, "_warm_session", warm_session)
+    pool = session_pool.InferencePool(size=3)
+    try:
+        pool._resolved.add("fake")
+        job = pool.submit(busy, 1.0, model_name="fake")  # one worker is busy meanwhile
+        pool.warm("fake")
+        job.get()
+        warmed = {int(pid) for pid in log.read_text().split()}
+        assert warmed == {proc.pid for proc in pool._pool._pool}
+    finally:
+        pool.close()